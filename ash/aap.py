@@ -4,14 +4,38 @@
 
 # pylint: disable=no-member, access-member-before-definition, missing-class-docstring, missing-function-docstring
 
+import json
+import math
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
 import requests
 from termcolor import colored
 
 import urllib3
 
+from .backoff import AdaptiveLimiter, RetryPolicy, RETRY_STATUSES
+from .cancellation import check_cancelled, sleep
+from .response_cache import ResponseCache
+from .singleflight import SingleFlight
 from .models import Inventory, Project, JobTemplate, Job, Host
 from .object_types import INVENTORIES, PROJECTS, JOB_TEMPLATES, JOBS, HOSTS
+from .stats import Stats, normalize_endpoint
+
+
+# Responses kept in the local cache for the offline mode, by endpoint shape
+OFFLINE_ENDPOINTS = (
+    'jobs',
+    'jobs/{id}',
+    'jobs/{id}/stdout',
+    'jobs/{id}/job_host_summaries',
+    'job_templates/{id}/jobs',
+)
 
+# Seconds the health probe waits for the controller before ash goes offline
+PROBE_TIMEOUT = 3
 
 OBJECT_FACTORIES = {
     INVENTORIES: Inventory,
@@ -21,8 +45,30 @@ OBJECT_FACTORIES = {
     HOSTS: Host,
 }
 
+
+def _later_chunk(endpoint):
+    query = parse_qs(urlsplit(endpoint).query)
+    return query.get('start_line', ['0'])[0] != '0'
+
+
+class TextResponse(object):
+    """The parts of a requests.Response used by ash, rebuilt from a body kept as text."""
+
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text
+        self.content = text.encode('utf-8')
+
+    def json(self, **kwargs):
+        return json.loads(self.text, **kwargs)
+
+
+# Answer of a write while offline, no request was sent. log_error reports it like an API error.
+OFFLINE_REFUSAL = TextResponse(None, "ash is offline, the controller cannot be changed.")
+
+
 class API():
-    def __init__(self, baseurl, token, api_path, verify_ssl=True):
+    def __init__(self, baseurl, token, api_path, verify_ssl=True, stats=None, daemon=None, store=None):
         self.base_url = baseurl
         self.token = token
         self.api_path = api_path
@@ -32,60 +78,202 @@ class API():
             "Authorization": f"Bearer {self.token}",
             "Content-Type": "application/json"
         }
+        # A shared session keeps connections alive across requests and pages
+        self.session = requests.Session()
+        self.stats = stats or Stats()
+        # ash.daemon.DaemonClient, requests go through ashd while it is reachable
+        self.daemon = daemon
+        self.responses = ResponseCache(stats=self.stats)
+        # Identical GETs of concurrent threads share one HTTP call and its parsed body
+        self.inflight = SingleFlight()
+        # Every thread of this controller, paged listings, background tasks and pollers, shares the limiter
+        self.retry = RetryPolicy()
+        self.limiter = AdaptiveLimiter()
+        # ash.cache.CacheWriter keeping the OFFLINE_ENDPOINTS responses, served from it without network when offline
+        self.store = store
+        self.offline = False
+        # When the cached objects were last written, for the prompt while offline
+        self.data_refreshed_at = None
+        # Set by interactive shells, a controller that stops answering switches them to offline
+        self.auto_offline = False
         if not self.verify_ssl:
             urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-    def _print_ssl_hint(self):
-        print(colored("TLS certificate verification failed.", 'red'))
-        print(colored("Hint: add your CA/intermediate certificates to trusted authorities (system trust store or REQUESTS_CA_BUNDLE).", 'yellow'))
-        print(colored("If needed for non-production usage, you can disable verification by setting 'verify_ssl: false' in ash config.", 'yellow'))
+    def _print_error(self, message):
+        """Print an API error on stderr, away from the rows of --format output."""
+        self.stats.record_error()
+        print(colored(message, 'red'), file=sys.stderr)
 
-    def get_request(self, endpoint):
+    def _print_ssl_hint(self):
+        print(colored("TLS certificate verification failed.", 'red'), file=sys.stderr)
+        print(colored("Hint: add your CA/intermediate certificates to trusted authorities (system trust store or REQUESTS_CA_BUNDLE).", 'yellow'), file=sys.stderr)
+        print(colored("If needed for non-production usage, you can disable verification by setting 'verify_ssl: false' in ash config.", 'yellow'), file=sys.stderr)
+
+    def _daemon_request(self, op, **request):
+        """Send a request to ashd, None when it went away, the shell then talks to the controller itself."""
+        reply = self.daemon.call(dict(request, op=op, base_url=self.base_url, token=self.token,
+                                      api_path=self.api_path, verify_ssl=self.verify_ssl))
+        if reply is None:
+            print(colored("ashd is not reachable anymore, connecting to the API directly.", 'yellow'))
+            self.daemon = None
+        return reply
+
+    def ping(self):
+        """Health probe, True when the controller answers quickly. Not retried, a busy controller counts as down."""
+        if self.daemon is not None:
+            # Probed by ashd with the same timeout, not through its retried request path
+            reply = self._daemon_request('probe')
+            if reply is not None:
+                return bool(reply.get('ok'))
         try:
-            response = requests.get(requests.compat.urljoin(self.url, endpoint), headers=self.headers,
-                                    verify=self.verify_ssl, timeout=10)
-            return response
-        except requests.exceptions.SSLError as e:
-            print(colored(f"Error connecting to API: {e}", 'red'))
-            self._print_ssl_hint()
-            return None
-        except requests.exceptions.RequestException as e:
-            print(colored(f"Error connecting to API: {e}", 'red'))
-            return None
-
-    def post_request(self, endpoint, payload):
+            response = self.session.get(requests.compat.urljoin(self.url, 'ping/'), headers=self.headers,
+                                        verify=self.verify_ssl, timeout=PROBE_TIMEOUT)
+        except requests.exceptions.RequestException:
+            return False
+        return response.status_code == 200
+
+    def go_offline(self):
+        """Serve GETs from the kept responses and refuse writes from now on."""
+        self.offline = True
+        self.data_refreshed_at = self.store.cache.last_refreshed() if self.store is not None else None
+
+    def lost_connection(self):
+        """Go offline when the controller stopped answering, for shells that asked for it."""
+        if self.offline or not self.auto_offline or self.store is None:
+            return
+        self.go_offline()
+        print(colored(f"{self.base_url} is not reachable, working offline from the cache. Use 'offline off' to reconnect.", 'yellow'))
+
+    def _send(self, method, endpoint, fresh=False, **kwargs):
+        if self.offline:
+            return OFFLINE_REFUSAL
+        started = time.perf_counter()
+        response = None
         try:
-            response = requests.post(requests.compat.urljoin(self.url, endpoint), headers=self.headers,
-                                     json=payload, verify=self.verify_ssl, timeout=10)
+            if self.daemon is not None:
+                reply = self._daemon_request('request', method=method, endpoint=endpoint, payload=kwargs.get('json'),
+                                             fresh=fresh)
+                if reply is not None:
+                    if 'error' in reply:
+                        self._print_error(f"Error connecting to API: {reply['error']}")
+                        return None
+                    response = TextResponse(reply['status'], reply.get('text', ''))
+                    self._time_json(response)
+                    return response
+            response = self._request(method, endpoint, **kwargs)
+            self._time_json(response)
             return response
         except requests.exceptions.SSLError as e:
-            print(colored(f"Error connecting to API: {e}", 'red'))
+            self._print_error(f"Error connecting to API: {e}")
             self._print_ssl_hint()
             return None
+        except requests.exceptions.ConnectionError as e:
+            # Already retried, the controller is down or unreachable
+            self._print_error(f"Error connecting to API: {e}")
+            self.lost_connection()
+            return None
         except requests.exceptions.RequestException as e:
-            print(colored(f"Error connecting to API: {e}", 'red'))
+            self._print_error(f"Error connecting to API: {e}")
             return None
-
-    def delete_request(self, endpoint):
-        try:
-            response = requests.delete(requests.compat.urljoin(self.url, endpoint), headers=self.headers,
-                                       verify=self.verify_ssl, timeout=10)
-            return response
-        except requests.exceptions.SSLError as e:
-            print(colored(f"Error connecting to API: {e}", 'red'))
-            self._print_ssl_hint()
+        finally:
+            size = len(response.content) if response is not None else 0
+            status = response.status_code if response is not None else None
+            self.stats.record_request(method, endpoint, time.perf_counter() - started, size, status)
+
+    def _request(self, method, endpoint, **kwargs):
+        """Send a request within the concurrency limit, retrying what a busy controller refused."""
+        url = requests.compat.urljoin(self.url, endpoint)
+        attempt = 0
+        while True:
+            response = None
+            error = None
+            started = self.limiter.acquire()
+            try:
+                response = self.session.request(method, url, headers=self.headers, verify=self.verify_ssl,
+                                                timeout=10, **kwargs)
+            except requests.exceptions.SSLError:
+                raise
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                error = e
+            finally:
+                self.limiter.release(started, endpoint,
+                                     ok=response is not None and response.status_code not in RETRY_STATUSES)
+            refused = isinstance(error, requests.exceptions.ConnectTimeout)
+            if not self.retry.should_retry(method, attempt, response, refused=refused):
+                if error is not None:
+                    raise error
+                return response
+            self.stats.record_retry(method, endpoint)
+            sleep(self.retry.delay(attempt, response))
+            attempt += 1
+
+    def _time_json(self, response):
+        """Make response.json() parse once and account its parsing time."""
+        parse = response.json
+        parsed = []
+
+        def json(**kwargs):
+            if not parsed:
+                started = time.perf_counter()
+                parsed.append(parse(**kwargs))
+                self.stats.record_json(time.perf_counter() - started)
+            return parsed[0]
+
+        response.json = json
+
+    def shared_objects(self, object_type, refresh=False):
+        """Return every object of a cached type from the ashd index, None without a daemon."""
+        if self.daemon is None:
             return None
-        except requests.exceptions.RequestException as e:
-            print(colored(f"Error connecting to API: {e}", 'red'))
+        reply = self._daemon_request('objects', object_type=object_type, refresh=refresh)
+        if reply is None or 'objects' not in reply:
             return None
-
-    def retrieves_objects(self, object_type, result_limit=10, order_by=None,
-                          baseuri=None, filters=None):
-        if not result_limit or result_limit > 100:
-            page_size = 100
+        return [self.instantiate_object(object_type, data) for data in reply['objects']]
+
+    def get_request(self, endpoint, fresh=False):
+        """GET an endpoint, recent responses of stable objects are reused unless fresh is set."""
+        check_cancelled()
+        if self.offline:
+            return self._stored_response(endpoint)
+        if not fresh:
+            response = self.responses.get(endpoint)
+            if response is not None:
+                return response
+        response, shared = self.inflight.do(endpoint, lambda: self._send('GET', endpoint, fresh=fresh))
+        if shared:
+            self.stats.record_coalesced('GET', endpoint)
         else:
-            page_size = result_limit
+            self.responses.put(endpoint, response)
+            self._store_response(endpoint, response)
+        if response is None and self.offline:
+            # The request that found the controller down is answered like the next ones
+            return self._stored_response(endpoint)
+        return response
+
+    def _store_response(self, endpoint, response):
+        if self.store is None or response is None or response.status_code != 200:
+            return
+        # Only the first chunk of an output is read offline, later chunks of a followed job are not kept
+        if normalize_endpoint(endpoint).rstrip('/') in OFFLINE_ENDPOINTS and not _later_chunk(endpoint):
+            self.store.write_response(endpoint, response.text)
+
+    def _stored_response(self, endpoint):
+        entry = self.store.load_response(endpoint) if self.store is not None else None
+        if entry is None:
+            return None
+        return TextResponse(200, entry[0])
 
+    def post_request(self, endpoint, payload):
+        check_cancelled()
+        self.responses.invalidate(endpoint)
+        return self._send('POST', endpoint, json=payload)
+
+    def delete_request(self, endpoint):
+        check_cancelled()
+        self.responses.invalidate(endpoint)
+        return self._send('DELETE', endpoint)
+
+    def _build_list_url(self, object_type, page_size, order_by=None, baseuri=None, filters=None):
         if baseuri:
             url = f"{baseuri}?page_size={page_size}"
         else:
@@ -100,28 +288,113 @@ class API():
                 else:
                     for v in value:
                         url += f"&{key}={v}"
+        return url
+
+    def retrieves_objects(self, object_type, result_limit=10, order_by=None,
+                          baseuri=None, filters=None, parallel=1):
+        data = self.retrieves_data(object_type, result_limit=result_limit, order_by=order_by,
+                                   baseuri=baseuri, filters=filters, parallel=parallel)
+        if data is None:
+            return None
+
+        objects = [self.instantiate_object(object_type, item) for item in data]
+        return objects
+
+    def retrieves_data(self, object_type, result_limit=10, order_by=None,
+                       baseuri=None, filters=None, parallel=1):
+        """Return the raw result dicts of a listing endpoint.
+
+        With parallel > 1 the first page is used to learn the total count, then
+        the remaining pages are requested concurrently by page number."""
+        if not result_limit or result_limit > 100:
+            page_size = 100
+        else:
+            page_size = result_limit
+
+        url = self._build_list_url(object_type, page_size, order_by=order_by, baseuri=baseuri, filters=filters)
 
         response = self.get_request(url)
         if response is None or response.status_code != 200:
             self.log_error(response)
             return None
-        data = response.json().get('results', [])
+        body = response.json()
+        # The parsed body may be shared with concurrent callers of the same page, extend a copy
+        data = list(body.get('results', []))
 
         if not result_limit:
-            result_limit = response.json().get('count', 0)
-
-        while response.json().get('next') and len(data) < result_limit:
-            endpoint = response.json().get('next').replace(self.api_path, '')
+            result_limit = body.get('count', 0)
+
+        if parallel > 1 and body.get('next') and len(data) < result_limit:
+            total = min(body.get('count', 0), result_limit)
+            pages = range(2, math.ceil(total / page_size) + 1)
+            with ThreadPoolExecutor(max_workers=parallel) as executor:
+                results = list(executor.map(lambda page: self._get_page(f"{url}&page={page}"), pages))
+            for results_page in results:
+                if results_page is None:
+                    return None
+                data.extend(results_page)
+            return data[:result_limit]
+
+        while body.get('next') and len(data) < result_limit:
+            endpoint = body.get('next').replace(self.api_path, '')
             response = self.get_request(endpoint)
             if response is None or response.status_code != 200:
                 self.log_error(response)
                 return None
-            for item in response.json().get('results', []):
+            body = response.json()
+            for item in body.get('results', []):
                 if len(data) < result_limit:
                     data.append(item)
 
-        objects = [self.instantiate_object(object_type, item) for item in data]
-        return objects
+        return data
+
+    def _get_page(self, endpoint):
+        response = self.get_request(endpoint)
+        if response is None or response.status_code != 200:
+            self.log_error(response)
+            return None
+        return response.json().get('results', [])
+
+    def retrieves_page(self, object_type, page, page_size=100, order_by=None, baseuri=None, filters=None):
+        """Return (results, count) of a single page of a listing endpoint, or None on error."""
+        url = self._build_list_url(object_type, page_size, order_by=order_by, baseuri=baseuri, filters=filters)
+        response = self.get_request(f"{url}&page={page}")
+        if response is None or response.status_code != 200:
+            self.log_error(response)
+            return None
+        body = response.json()
+        return body.get('results', []), body.get('count', 0)
+
+    def iter_pages(self, object_type, result_limit=10, order_by=None, baseuri=None, filters=None):
+        """Yield the raw results of a listing endpoint one page at a time, following 'next'.
+
+        Errors are logged and end the iteration."""
+        if not result_limit or result_limit > 100:
+            page_size = 100
+        else:
+            page_size = result_limit
+
+        endpoint = self._build_list_url(object_type, page_size, order_by=order_by, baseuri=baseuri, filters=filters)
+        remaining = result_limit or None
+        while endpoint:
+            response = self.get_request(endpoint)
+            if response is None or response.status_code != 200:
+                self.log_error(response)
+                return
+            body = response.json()
+            results = body.get('results', [])
+            if remaining is not None:
+                results = results[:remaining]
+                remaining -= len(results)
+            yield results
+            if remaining == 0 or not body.get('next'):
+                return
+            endpoint = body.get('next').replace(self.api_path, '')
+
+    def iter_objects(self, object_type, result_limit=10, order_by=None, baseuri=None, filters=None):
+        for page in self.iter_pages(object_type, result_limit=result_limit, order_by=order_by,
+                                    baseuri=baseuri, filters=filters):
+            yield [self.instantiate_object(object_type, item) for item in page]
 
     def instantiate_object(self, object_type, data):
         object_factory = OBJECT_FACTORIES.get(object_type)
@@ -131,51 +404,80 @@ class API():
         return object_factory(self, data)
 
     def log_error(self, response):
-        if response is None:
-            print(colored("Error: No response from API", 'red'))
+        if response is OFFLINE_REFUSAL:
+            self.stats.record_error()
+            print(colored(response.text, 'yellow'), file=sys.stderr)
+        elif response is None and self.offline:
+            self.stats.record_error()
+            print(colored("Not available offline, it was never retrieved while online.", 'yellow'), file=sys.stderr)
+        elif response is None:
+            self._print_error("Error: No response from API")
         else:
-            print(colored(f"Error: {response.status_code} - {response.text}", 'red'))
+            self._print_error(f"Error: {response.status_code} - {response.text}")
+
+
+# Seconds a cached inventory, project or job template is used without asking the controller
+OBJECT_MAX_AGE = 300
 
 
 class AAP():
-    def __init__(self, api):
+    def __init__(self, api, cache=None, max_age=OBJECT_MAX_AGE):
         self.api = api
+        # ash.cache.Cache read through by get_inventory, get_project and get_job_template
+        self.cache = cache
+        self.max_age = max_age
 
-    def get_inventories(self):
-        return self.api.retrieves_objects(INVENTORIES, result_limit=0)
+    def _get_object(self, object_type, object_id):
+        """Return an object from the local cache when it is fresh, from the controller otherwise.
 
-    def get_inventory(self, inventory_id):
-        response = self.api.get_request(f"inventories/{inventory_id}/")
+        A stale entry costs one empty listing when it was not modified since
+        it was cached, only misses and modified objects are fetched in full."""
+        if self.cache is not None:
+            entry = self.cache.load_cache_entry(object_type, object_id)
+            if entry is not None:
+                obj, cached_at = entry
+                obj.api = self.api
+                if self.api.offline or time.time() - cached_at < self.max_age or self._unmodified(object_type, obj):
+                    return obj
+
+        response = self.api.get_request(f"{object_type}/{object_id}/")
 
         if response is None or response.status_code != 200:
             self.api.log_error(response)
             return None
 
-        return Inventory(self.api, response.json())
+        obj = self.api.instantiate_object(object_type, response.json())
+        if self.cache is not None:
+            self.cache.insert_cache(object_type, obj.id, obj)
+        return obj
+
+    def _unmodified(self, object_type, obj):
+        modified = getattr(obj, 'modified', None)
+        if not modified:
+            return False
+        response = self.api.get_request(f"{object_type}/?id={obj.id}&modified__gt={modified}&page_size=1", fresh=True)
+        if response is None or response.status_code != 200 or response.json().get('count') != 0:
+            return False
+        self.cache.touch_cache(object_type, obj.id)
+        return True
+
+    def get_inventories(self):
+        return self.api.retrieves_objects(INVENTORIES, result_limit=0)
+
+    def get_inventory(self, inventory_id):
+        return self._get_object(INVENTORIES, inventory_id)
 
     def get_projects(self):
         return self.api.retrieves_objects(PROJECTS, result_limit=0)
 
     def get_project(self, project_id):
-        response = self.api.get_request(f"projects/{project_id}/")
-
-        if response is None or response.status_code != 200:
-            self.api.log_error(response)
-            return None
-
-        return Project(self.api, response.json())
+        return self._get_object(PROJECTS, project_id)
 
     def get_job_templates(self):
         return self.api.retrieves_objects(JOB_TEMPLATES, result_limit=0)
 
     def get_job_template(self, job_template_id):
-        response = self.api.get_request(f"job_templates/{job_template_id}/")
-
-        if response is None or response.status_code != 200:
-            self.api.log_error(response)
-            return None
-
-        return JobTemplate(self.api, response.json())
+        return self._get_object(JOB_TEMPLATES, job_template_id)
 
     def get_jobs(self, filters=None, result_limit=50):
         jobs = self.api.retrieves_objects(JOBS, result_limit=result_limit,
@@ -184,6 +486,10 @@ class AAP():
             jobs = list(reversed(jobs))
         return jobs
 
+    def iter_jobs(self, filters=None, result_limit=50):
+        """Yield pages of jobs, most recently finished first."""
+        return self.api.iter_objects(JOBS, result_limit=result_limit, order_by="-finished", filters=filters)
+
     def get_job(self, job_id):
         response = self.api.get_request(f"jobs/{job_id}/")
 
@@ -1,17 +1,30 @@
 #!/usr/bin/env python
 
+import asyncio
+import os
+import signal
+import sys
+import time
+import traceback
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from prompt_toolkit import PromptSession
-from prompt_toolkit.history import FileHistory
+from prompt_toolkit.patch_stdout import patch_stdout
 from prompt_toolkit.styles import Style
-from os.path import expanduser
 
 from .aap import AAP, API
+from .cache import Cache, CacheWriter
 from .models import Inventory, JobTemplate, Project, Job
-from .display import Display
+from .display import Display, format_age
 from .completer import AshCompleter, FormCompleter
 from .commands import ROOT_COMMANDS, CD_COMMANDS, LS_COMMANDS, LS_JOB_TEMPLATE_FILTERS, LS_JOBS_FILTERS, LS_PROJECTS_FILTERS, LS_INVENTORIES_FILTERS, JT_COMMANDS, JOB_COMMANDS, INVENTORY_COMMANDS, PROJECT_COMMANDS
 from .colors import COLORS
+from .stats import Stats, format_breakdown
+from .profiling import CommandProfiler
+from .history import HISTORY_SIZE, create_history
+from .tasks import Task, TaskManager, console_session
+from .notifier import JobNotifier, run_notify_command
 from .handlers.base import BaseHandler
 from .handlers.root import RootHandler
 from .handlers.job_template import JobTemplateHandler
@@ -35,8 +48,44 @@ class Ash(object):
         PROJECTS: ('Project', 'orange'),
     }
 
-    def __init__(self, config, cache):
-        self.commands = ROOT_COMMANDS
+    # Attributes built on first access, batch runs only pay for what their commands use
+    _LAZY_ATTRIBUTES = {
+        'inventories': '_load_inventories_cache',
+        'inventories_by_id': '_load_inventories_cache',
+        'inventories_by_name': '_load_inventories_cache',
+        'job_templates': '_load_job_templates_cache',
+        'job_templates_by_id': '_load_job_templates_cache',
+        'job_templates_by_name': '_load_job_templates_cache',
+        'projects': '_load_projects_cache',
+        'projects_by_id': '_load_projects_cache',
+        'projects_by_name': '_load_projects_cache',
+        'history': '_create_sessions',
+        'session': '_create_sessions',
+        'session_wo_history': '_create_sessions',
+    }
+
+    # Commands that prompt, switch context or take over the screen cannot run in the background
+    _FOREGROUND_ONLY_COMMANDS = ('cd', 'launch', 'relaunch', 'reuse', 'add_hosts', 'clear_hosts', 'project', 'inventory', 'template', 'use',
+                                 'offline', 'fg')
+
+    # Per controller attributes, swapped by 'use'
+    _CONTROLLER_ATTRIBUTES = (
+        'config', 'api', 'aap', 'cache', 'cache_writer', 'notifier', 'api_description', 'api_description_color', 'commands',
+        'current_context', 'current_context_type', 'last_context', 'last_context_type', 'host_limit',
+    ) + tuple(name for name, loader in _LAZY_ATTRIBUTES.items() if loader != '_create_sessions')
+
+    # Objects a context refers to, fetched in the background by _switch_context: (object type, summary_fields key)
+    _RELATED_OBJECTS = {
+        JOBS: ((JOB_TEMPLATES, 'job_template'), (INVENTORIES, 'inventory'), (PROJECTS, 'project')),
+        JOB_TEMPLATES: ((INVENTORIES, 'inventory'), (PROJECTS, 'project')),
+    }
+
+    interactive = True
+    timing = False
+    daemon = None
+    _prefetch_executor = None
+
+    def __init__(self, config, cache, interactive=True, daemon=None, offline=False):
         self.cd_commands = CD_COMMANDS
         self.ls_commands = LS_COMMANDS
         self.ls_commands_filters = {
@@ -46,29 +95,25 @@ class Ash(object):
             INVENTORIES: LS_INVENTORIES_FILTERS
         }
         self.job_template_commands = JT_COMMANDS
-        if getattr(config, 'api_path', None):
-            api_path = config.api_path
-        else:
-            api_path = "/api/controller/v2/"
-        self.api = API(config.base_url, config.token, api_path, verify_ssl=getattr(config, 'verify_ssl', True))
-        self.api_description = getattr(config, 'description', None)
-        self.api_description_color = getattr(config, 'description_color', 'white')
-        self.aap = AAP(self.api)
-        self.cache = cache
-        self._load_all_caches()
-        self.current_context = None
-        self.current_context_type = None
-        self.last_context = None
-        self.last_context_type = None
+        self.stats = Stats()
+        self.interactive = interactive
+        self.task_manager = TaskManager(on_done=self._on_task_done)
+        self.notify_bell = bool(getattr(config, 'notify_bell', False))
+        self.notify_command = getattr(config, 'notify_command', None)
+        # Saved state of the controllers that are not active, by name
+        self.controllers = OrderedDict()
+        # ash.daemon.DaemonClient shared by the API clients of every controller, None without ashd
+        self.daemon = daemon
+        # --offline, every controller is served from its cache without a health probe
+        self.force_offline = offline
+        self._connect(config, cache)
         self.colors = COLORS
-        history_file_path = expanduser("~/.ash_history")
-        self.history = FileHistory(history_file_path)
         self.completer = AshCompleter(self)
         self.form_completer = FormCompleter(self)
         self.style = Style.from_dict(self.colors)
-        self.display = Display(self.style)
-        self.session = PromptSession(history=self.history, style=self.style)
-        self.session_wo_history = PromptSession(style=self.style)
+        self.display = Display(self.style, self.stats)
+        if self.interactive:
+            self._create_sessions()
         self._base_handler = BaseHandler(self)
         self._root_handler = RootHandler(self)
         self._jt_handler = JobTemplateHandler(self)
@@ -77,6 +122,144 @@ class Ash(object):
         self._project_handler = ProjectHandler(self)
         self._command_handlers = self._build_command_handlers()
 
+    def _build_controller(self, config, cache, probe=True):
+        """Return the state of a controller: its API client, cache, notifier and an empty context.
+
+        Without probe the controller is not switched to offline when it stops
+        answering, for controllers only queried by --all-controllers."""
+        if getattr(config, 'api_path', None):
+            api_path = config.api_path
+        else:
+            api_path = "/api/controller/v2/"
+        cache_writer = CacheWriter(cache)
+        api = API(config.base_url, config.token, api_path, verify_ssl=getattr(config, 'verify_ssl', True), stats=self.stats,
+                  daemon=self.daemon, store=cache_writer)
+        aap = AAP(api, cache=cache)
+        if self.force_offline:
+            api.go_offline()
+        elif self.interactive and probe:
+            self._watch_connection(api)
+        cache.stats = self.stats
+        description = getattr(config, 'description', None)
+        name = description or api.base_url
+        notifier = JobNotifier(aap, lambda job: self._on_job_finished(job, name),
+                               interval=getattr(config, 'notify_interval', 5))
+        return {
+            'config': config,
+            'api': api,
+            'aap': aap,
+            'cache': cache,
+            'cache_writer': cache_writer,
+            'notifier': notifier,
+            'api_description': description,
+            'api_description_color': getattr(config, 'description_color', 'white'),
+            'commands': ROOT_COMMANDS,
+            'current_context': None,
+            'current_context_type': None,
+            'last_context': None,
+            'last_context_type': None,
+            'host_limit': None,
+        }
+
+    def _connect(self, config, cache):
+        """Create the API client, cache and notifier of a controller and make it the active one."""
+        self._restore_controller(self._build_controller(config, cache))
+        if self.interactive:
+            self._load_all_caches()
+
+    @property
+    def controller_name(self):
+        return self.api_description or self.api.base_url
+
+    def _save_controller(self):
+        """Return the state of the active controller, indexes that were never loaded are left out."""
+        return {name: self.__dict__[name] for name in self._CONTROLLER_ATTRIBUTES if name in self.__dict__}
+
+    def _restore_controller(self, state):
+        for name in self._CONTROLLER_ATTRIBUTES:
+            if name in state:
+                self.__dict__[name] = state[name]
+            else:
+                # Loaded on first access by __getattr__, for this controller
+                self.__dict__.pop(name, None)
+
+    def use_controller(self, name):
+        """Make another configured controller the active one, return False when there is none by that name.
+
+        Raise ValueError when its configuration entry is invalid, the active controller is kept then.
+
+        Controllers are connected on first use and then kept with their
+        HTTP session, indexes and context, so switching back is instant."""
+        if name == self.controller_name:
+            return True
+        state = self.controllers.get(name)
+        config = None
+        if state is None:
+            select = getattr(self.config, 'select', None)
+            config = select(name) if select else None
+            if config is None:
+                return False
+        self.controllers[self.controller_name] = self._save_controller()
+        if state is not None:
+            del self.controllers[name]
+            self._restore_controller(state)
+            if self.interactive and not self.api.auto_offline and not self.api.offline:
+                # Connected by --all-controllers, without a probe
+                self._watch_connection(self.api)
+        else:
+            self._connect(config, Cache(config.base_url))
+        return True
+
+    def controller_states(self, failures=None):
+        """Return (name, state) of every configured controller, in configuration order.
+
+        Controllers never used are connected, and kept for a later 'use'.
+        Those with an invalid configuration entry are skipped and added to
+        failures as (name, reason)."""
+        names = self.config.names() if hasattr(self.config, 'names') else [self.controller_name]
+        states = []
+        for name in names:
+            if name == self.controller_name:
+                states.append((name, self._save_controller()))
+                continue
+            if name not in self.controllers:
+                try:
+                    config = self.config.select(name)
+                except ValueError as e:
+                    if failures is not None:
+                        failures.append((name, str(e)))
+                    continue
+                self.controllers[name] = self._build_controller(config, Cache(config.base_url), probe=False)
+            states.append((name, self.controllers[name]))
+        return states
+
+    def controller_objects(self, name, state, object_type):
+        """Return the cached objects of a controller, fetching and caching them when the cache is empty."""
+        if name == self.controller_name:
+            return getattr(self, object_type)
+        if object_type not in state:
+            objects = state['cache'].load_cache(object_type)
+            if objects:
+                for obj in objects:
+                    obj.api = state['api']
+            else:
+                objects = getattr(state['aap'], f'get_{object_type}')() or []
+                state['cache'].insert_cache_many(object_type, ((obj.id, obj) for obj in objects))
+            state[object_type] = objects
+        return state[object_type]
+
+    def __getattr__(self, name):
+        loader = self._LAZY_ATTRIBUTES.get(name)
+        if loader is None:
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+        getattr(self, loader)()
+        return self.__dict__[name]
+
+    def _create_sessions(self):
+        self.history = create_history(self.cache.data_folder, getattr(self.config, 'history_size', HISTORY_SIZE))
+        self.session = PromptSession(history=self.history, style=self.style)
+        self.session_wo_history = PromptSession(style=self.style)
+
     def _build_command_handlers(self):
         """Return explicit command-to-method mapping used by the command loop."""
         return {
@@ -84,6 +267,13 @@ class Ash(object):
             'watch': self._root_handler.watch,
             'cd': self._root_handler.cd,
             'cache': self._root_handler.cache,
+            'timing': self._root_handler.timing,
+            'stats': self._root_handler.stats,
+            'tasks': self._root_handler.tasks,
+            'fg': self._root_handler.fg,
+            'kill': self._root_handler.kill,
+            'use': self._root_handler.use,
+            'offline': self._root_handler.offline,
             'refresh': self._base_handler.refresh,
             'url': self._base_handler.url,
             'open': self._base_handler.open,
@@ -94,8 +284,10 @@ class Ash(object):
             'reuse': self._job_handler.reuse,
             'cancel': self._job_handler.cancel,
             'output': self._job_handler.output,
+            'profile': self._base_handler.profile,
+            'durations': self._job_handler.durations,
             'template': self._job_handler.template,
-            'hosts': self._inventory_handler.hosts,
+            'hosts': self._base_handler.hosts,
             'add_hosts': self._inventory_handler.add_hosts,
             'clear_hosts': self._inventory_handler.clear_hosts,
             'sync': self._base_handler.sync,
@@ -104,23 +296,35 @@ class Ash(object):
         }
 
     def _get_objects(self, object_type):
+        # ashd keeps the indexes warm for every shell, the local cache is the fallback
+        objects = self.api.shared_objects(object_type) if self.daemon is not None and not self.api.offline else None
+        if objects is None:
+            objects = self._get_local_objects(object_type)
+        if not objects:
+            return [], [], []
+
+        objects_by_id = {obj.id: obj for obj in objects}
+        objects_by_name = {obj.name: obj for obj in objects}
+
+        return objects, objects_by_id, objects_by_name
+
+    def _get_local_objects(self, object_type):
         objects = self.cache.load_cache(object_type)
         if objects:
-            print(f"Loaded {object_type} from cache, use 'cache' command to refresh.")
+            if self.interactive:
+                print(f"Loaded {object_type} from cache, use 'cache' command to refresh.")
+            for obj in objects:
+                obj.api = self.api
         else:
             print(f"Retrieving and caching {object_type}")
             method = getattr(self.aap, f'get_{object_type}')
             objects = method()
             if not objects:
-                return [], [], []
+                return []
             for obj in objects:
                 self.cache.insert_cache(object_type, obj.id, obj)
             print(f"{len(objects)} {object_type} cached.")
-
-        objects_by_id = {obj.id: obj for obj in objects}
-        objects_by_name = {obj.name: obj for obj in objects}
-
-        return objects, objects_by_id, objects_by_name
+        return objects
 
     def _load_inventories_cache(self):
         self.inventories, self.inventories_by_id, self.inventories_by_name = self._get_objects(INVENTORIES)
@@ -144,7 +348,7 @@ class Ash(object):
                     filter_key = filter[0]
                     filter_value = arg.split(':', 1)[1].strip()
                     if not filter_value:
-                        self.display.print(f"Invalid filter format: '{arg}'. Expected format is 'filter:value'.", 'red')
+                        self.display.error(f"Invalid filter format: '{arg}'. Expected format is 'filter:value'.")
                         return []
                     objects = [
                         obj for obj in objects
@@ -175,18 +379,92 @@ class Ash(object):
         self.current_context = context
         self.current_context_type = context_type
         if self.current_context is not None:
-            if self.current_context_type != JOBS:
-                self.current_context.refresh()
-                self.cache.insert_cache(self.current_context_type, self.current_context.id, self.current_context)
+            if self.current_context_type != JOBS and not self.api.offline:
+                if self.interactive:
+                    # The cached object is shown right away, the prompt follows if the refresh changes it
+                    self._background(self._refresh_context, context, context_type, self.cache_writer)
+                else:
+                    self.current_context.refresh()
+                    self.cache.insert_cache(self.current_context_type, self.current_context.id, self.current_context)
             object_label, color = self._CONTEXT_DISPLAY.get(context_type, (context_type, 'white'))
             if context_type == JOBS:
                 color = self.display.status_to_color(context.status)
             self.display.print(f"Switched context to {object_label}: ID={context.id}, Name={context.name}", color)
+            if self.interactive and not self.api.offline:
+                self._prefetch(self._related_endpoints(context, context_type))
         else:
             self.display.print("Switched to root context", 'white')
 
         self.commands = self._get_commands_for_context(context_type)
 
+    def _related_endpoints(self, context, context_type):
+        """Return the endpoints the follow-up commands of a context will need, e.g. 'template' or 'launch'."""
+        summary_fields = getattr(context, 'summary_fields', None) or {}
+        # Not loaded on purpose, a context switch must not block on the index
+        job_templates_by_id = self.__dict__.get('job_templates_by_id', {})
+        endpoints = []
+        for object_type, field in self._RELATED_OBJECTS.get(context_type, ()):
+            object_id = (summary_fields.get(field) or {}).get('id') or getattr(context, field, None)
+            if not isinstance(object_id, int):
+                continue
+            endpoints.append(f"{object_type}/{object_id}")
+            if object_type == JOB_TEMPLATES and getattr(job_templates_by_id.get(object_id), 'survey_enabled', False):
+                endpoints.append(f"{object_type}/{object_id}/survey_spec/")
+        if context_type == JOB_TEMPLATES and getattr(context, 'survey_enabled', False):
+            endpoints.append(f"{context.uri}/survey_spec/")
+        return endpoints
+
+    def _background(self, function, *args):
+        """Run function on the small pool used for the work a context switch does not wait for."""
+        if self._prefetch_executor is None:
+            self._prefetch_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='ash-prefetch')
+        future = self._prefetch_executor.submit(self._in_console, function, *args)
+        future.add_done_callback(self._on_background_done)
+        return future
+
+    def _on_background_done(self, future):
+        if future.cancelled() or future.exception() is None:
+            return
+        error = future.exception()
+        with console_session():
+            self.display.error(f"Background refresh failed: {type(error).__name__}: {error}")
+
+    def _watch_connection(self, api):
+        """Switch api to offline when its controller stops answering, probed now in the background."""
+        # Startup does not wait for the probe, requests failing later switch to offline as well
+        api.auto_offline = True
+        self._background(self._probe, api)
+
+    def _probe(self, api):
+        if not api.ping():
+            api.lost_connection()
+            self._invalidate_prompt()
+
+    @staticmethod
+    def _in_console(function, *args):
+        with console_session():
+            function(*args)
+
+    def _prefetch(self, endpoints):
+        """GET endpoints in the background, the responses land in the API response cache.
+
+        A command asking for one of them while it is in flight shares the request."""
+        for endpoint in endpoints:
+            self._background(self.api.get_request, endpoint)
+
+    def _refresh_context(self, context, context_type, cache_writer):
+        before = (context.name, getattr(context, 'status', None))
+        context.refresh()
+        cache_writer.write(context_type, context.id, context)
+        if self.current_context is context and (context.name, getattr(context, 'status', None)) != before:
+            self._invalidate_prompt()
+
+    def _invalidate_prompt(self):
+        session = self.__dict__.get('session')
+        if session is not None and session.app.is_running:
+            # Thread safe, the prompt is redrawn by the event loop with the new get_prompt()
+            session.app.invalidate()
+
     def _find_matching_objects(self, objects, identifier):
         matches = [obj for obj in objects if identifier.lower() in obj.name.lower()]
         exact_matches = [obj for obj in matches if identifier.lower() == obj.name.lower()]
@@ -210,7 +488,7 @@ class Ash(object):
             selected_object = self._find_matching_objects(objects, identifier)
 
         if not selected_object:
-            self.display.print(f"{not_found_label} '{identifier}' not found.", 'red')
+            self.display.error(f"{not_found_label} '{identifier}' not found.")
             return
         self._switch_context(selected_object, object_type)
 
@@ -243,7 +521,7 @@ class Ash(object):
                     job_id = int(job.split(':', 1)[0])
                     job = next((j for j in jobs if j.id == job_id), None)
         if not job:
-            self.display.print(f"Job '{identifier}' not found.", 'red')
+            self.display.error(f"Job '{identifier}' not found.")
             return
         self._switch_context(job, JOBS)
 
@@ -280,6 +558,10 @@ class Ash(object):
         prompt.append(('class:white', 'ash '))
         if self.api_description:
             prompt.append((f'class:{self.api_description_color}', f'[{self.api_description}] '))
+        if self.api.offline:
+            refreshed_at = self.api.data_refreshed_at
+            age = f", data {format_age(time.time() - refreshed_at)} old" if refreshed_at else ''
+            prompt.append(('class:yellow', f'[offline{age}] '))
         if self.current_context:
             if isinstance(self.current_context, JobTemplate):
                 prompt.append(('class:cyan', f'JobTemplate[{self.current_context.id}] - {self.current_context.name} '))
@@ -294,32 +576,157 @@ class Ash(object):
         prompt.append(('class:white', '> '))
         return prompt
 
-    def run(self):
+    def execute(self, text):
+        """Run one command line, return False when the shell should terminate.
+
+        A command line ending with '&' is started as a background task."""
+        if text.strip().endswith('&'):
+            self._start_background(text.strip()[:-1].strip())
+            return True
+        arr = text.strip().split(' ')
+        command, args = arr[0], arr[1:]
+
+        if command == 'exit':
+            return False
+        elif command in self.commands:
+            method = self._command_handlers.get(command)
+            if method:
+                if self.timing:
+                    started, totals = time.perf_counter(), self.stats.snapshot()
+                try:
+                    method(args)
+                except KeyboardInterrupt:
+                    self.display.error("\nCommand interrupted by user.")
+                except Exception as e:  # pylint: disable=broad-except
+                    # A bug or an unexpected answer of the controller fails the command, not the session
+                    self.display.error(f"{command}: {type(e).__name__}: {e}")
+                    traceback.print_exc(file=sys.stderr)
+                if self.timing:
+                    wall_ms = (time.perf_counter() - started) * 1000
+                    self.display.print(format_breakdown(command, wall_ms, self.stats.delta(totals)), 'yellow')
+            else:
+                print('Command not implemented: {}'.format(command))
+        elif command == '':
+            pass
+        else:
+            print('Unknown command: {}'.format(command))
+            self.failed_commands += 1
+        return True
+
+    def _start_background(self, text):
+        command = text.split(' ')[0]
+        if not text or command == 'exit':
+            self.display.print("Usage: <command> &", 'yellow')
+            return
+        if command not in self.commands:
+            print('Unknown command: {}'.format(command))
+            self.failed_commands += 1
+            return
+        args = text.split(' ')[1:]
+        if command in self._FOREGROUND_ONLY_COMMANDS or '--pager' in args or (command == 'watch' and '--format' not in args):
+            self.display.error(f"'{command}' prompts, switches context or takes over the screen, run it in the foreground.")
+            return
+        task = self.task_manager.start(text, lambda: self.execute(text))
+        self.display.print(f"[{task.number}] {text}", 'white')
+
+    def _on_task_done(self, task):
+        elapsed = f"{task.elapsed:.1f}s"
+        if task.status == 'failed':
+            self.display.error(f"[{task.number}] failed ({elapsed}): {task.command}: {task.error}")
+        else:
+            self.display.print(f"[{task.number}] {task.status} ({elapsed}): {task.command}", 'green' if task.status == 'done' else 'yellow')
+
+    def _on_job_finished(self, job, controller=None):
+        """Called by the notifier threads when a job launched in this session finishes."""
+        where = f"[{controller}] " if controller and self.controllers else ''
+        self.display.print(f"{where}Job {job.id} ({job.name}) finished: {job.status}", self.display.status_to_color(job.status))
+        if self.notify_bell:
+            sys.stdout.write('\a')
+            sys.stdout.flush()
+        if self.notify_command:
+            run_notify_command(self.notify_command, job)
+
+    async def _execute_foreground(self, text):
+        """Run a command in a worker thread while the event loop waits for it.
+
+        Ctrl-C interrupts the command thread instead of the event loop, and
+        full-screen views or prompts opened by the command get their own loop."""
+        task = Task(0, text, lambda: self.execute(text)).start()
+        loop = asyncio.get_running_loop()
+        try:
+            loop.add_signal_handler(signal.SIGINT, task.interrupt)
+        except (NotImplementedError, RuntimeError):
+            pass
+        try:
+            await loop.run_in_executor(None, task.done.wait)
+        finally:
+            try:
+                loop.remove_signal_handler(signal.SIGINT)
+            except (NotImplementedError, RuntimeError):
+                pass
+        if task.error is not None:
+            raise task.error
+        return task.result is not False
+
+    async def run_async(self):
+        self.failed_commands = 0
         while True:
             try:
-                text = self.session.prompt(self.get_prompt(), completer=self.completer, multiline=False)
-                # text = self.session.prompt(self.get_prompt(), refresh_interval=0.5, reserve_space_for_menu=0)
+                # Output of background tasks is printed above the prompt while it is shown
+                with patch_stdout(raw=True):
+                    text = await self.session.prompt_async(self.get_prompt, completer=self.completer, multiline=False)
             except KeyboardInterrupt:
                 continue  # Control-C pressed. Try again.
             except EOFError:
                 break  # Control-D pressed.
 
-            arr = text.strip().split(' ')
-            command, args = arr[0], arr[1:]
-
-            if command == 'exit':
+            if not await self._execute_foreground(text):
                 break
-            elif command in self.commands:
-                method = self._command_handlers.get(command)
-                if method:
-                    try:
-                        method(args)
-                    except KeyboardInterrupt:
-                        self.display.print("\nCommand interrupted by user.", 'red')
-                else:
-                    print('Command not implemented: {}'.format(command))
-            elif command == '':
-                continue
-            else:
-                print('Unknown command: {}'.format(command))
+        self._close()
         print('[ash is terminating]')
+
+    def _close(self):
+        for task in self.task_manager.running():
+            task.interrupt()
+        self.notifier.stop()
+        if self._prefetch_executor is not None:
+            # Refreshes already running write to the cache writers, they are flushed after them
+            self._prefetch_executor.shutdown(wait=True, cancel_futures=True)
+        for state in self.controllers.values():
+            state['notifier'].stop()
+            state['cache_writer'].flush()
+        self.cache_writer.flush()
+
+    def run(self):
+        asyncio.run(self.run_async())
+
+    def run_batch(self, lines):
+        """Run command lines without a prompt, return the process exit status.
+
+        ASH_PROFILE=1 profiles the run and prints the top functions on stderr,
+        any other value is also used as the path of the profile file to write.
+        ASH_PROFILE_SAMPLE=1 uses a sampling profiler when one is installed."""
+        self.failed_commands = 0
+        profile = os.environ.get('ASH_PROFILE')
+        profiler = CommandProfiler(sample=bool(os.environ.get('ASH_PROFILE_SAMPLE'))) if profile else None
+        with profiler or nullcontext():
+            for line in lines:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                # A command fails when it reports an error, even if it goes on with the next item
+                errors = self.stats.snapshot()['errors']
+                running = self.execute(line)
+                if self.stats.snapshot()['errors'] > errors:
+                    self.failed_commands += 1
+                if not running:
+                    break
+            errors = self.stats.snapshot()['errors']
+            self.task_manager.wait_all()
+            if self.stats.snapshot()['errors'] > errors:
+                self.failed_commands += 1
+        if profiler:
+            profiler.report(out=sys.stderr)
+            if profile not in ('1', 'true', 'yes'):
+                profiler.dump(profile)
+        return 1 if self.failed_commands else 0
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+
+"""Retries and adaptive concurrency for the requests sent to a busy controller."""
+
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from .cancellation import check_cancelled
+from .stats import normalize_endpoint
+
+# Statuses telling the request was not processed and is worth sending again
+RETRY_STATUSES = (429, 502, 503, 504)
+
+# Statuses retried for POST and DELETE, the controller refused them so they cannot have run twice
+REFUSED_STATUSES = (429, 503)
+
+# Seconds a thread waits for a request slot before checking whether its command was killed
+SLOT_WAIT_SLICE = 0.1
+
+
+def retry_after(response, now=None):
+    """Return the seconds asked by the Retry-After header of response, None without one."""
+    value = response.headers.get('Retry-After') if response is not None else None
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, date.timestamp() - (now or time.time()))
+
+
+class RetryPolicy(object):
+    """Exponential backoff with full jitter, Retry-After wins when the controller sends it."""
+
+    def __init__(self, retries=3, base_delay=0.5, max_delay=30.0):
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def should_retry(self, method, attempt, response=None, refused=False):
+        """refused is True for errors raised before the request reached the controller."""
+        if attempt >= self.retries:
+            return False
+        if response is None:
+            return method == 'GET' or refused
+        statuses = RETRY_STATUSES if method == 'GET' else REFUSED_STATUSES
+        return response.status_code in statuses
+
+    def delay(self, attempt, response=None):
+        asked = retry_after(response)
+        if asked is not None:
+            return min(asked, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class AdaptiveLimiter(object):
+    """AIMD limit on the requests in flight to one controller, shared by every thread using its API.
+
+    The limit grows by one per round of successful requests and is halved
+    on errors or when a request takes latency_factor times longer than
+    usual for its endpoint, at most once per round."""
+
+    def __init__(self, initial=4, minimum=1, maximum=32, latency_factor=3.0):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_factor = latency_factor
+        self.in_flight = 0
+        self.latencies = {}
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """Wait for a free slot, return the start time to give back to release.
+
+        Raise KeyboardInterrupt when the command of the thread is killed while waiting."""
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait(SLOT_WAIT_SLICE)
+                check_cancelled()
+            self.in_flight += 1
+        return time.monotonic()
+
+    def release(self, started, endpoint, ok=True):
+        now = time.monotonic()
+        elapsed = now - started
+        key = normalize_endpoint(endpoint)
+        with self._condition:
+            self.in_flight -= 1
+            usual = self.latencies.get(key)
+            slow = usual is not None and elapsed > usual * self.latency_factor
+            if ok:
+                self.latencies[key] = elapsed if usual is None else 0.8 * usual + 0.2 * elapsed
+            if not ok or slow:
+                # Requests started before the first error see the same overload, count it once
+                if now - self._last_decrease > (usual or elapsed):
+                    self.limit = max(self.minimum, self.limit / 2)
+                    self._last_decrease = now
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._condition.notify_all()
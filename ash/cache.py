@@ -2,32 +2,59 @@
 
 import sqlite3
 import pickle
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
 
-from .object_types import CACHED_OBJECT_TYPES
+from .object_types import CACHED_OBJECT_TYPES, CACHED_DATA_TYPES
+
+# Bounds of the responses kept for the offline mode, the least recently stored go first
+STORED_RESPONSES_MAX_ENTRIES = 2000
+STORED_RESPONSES_MAX_BYTES = 64 * 1024 * 1024
+STORED_RESPONSES_MAX_AGE = 30 * 86400
+
 
 class Cache(object):
+    # Set to an ash.stats.Stats to account cache accesses
+    stats = None
+
     def __init__(self, aap_url):
         self.data_folder = Path.home().joinpath(".local", "share", "ash")
         self.aap_url = aap_url
         self.base64_encoded_aap_url = self.aap_url.encode('utf-8').hex()
-        self.user_version = 2
+        self.user_version = 3
         self.__init_db()
 
     def __init_db(self):
         self.db_file = self.data_folder.joinpath('cache.db')
-        self.db_user_version = self.__execute_sql('PRAGMA user_version')[0]
+        # Schema checks share one connection to keep startup cheap for batch runs
+        conn = sqlite3.connect(self.db_file)
+        c = conn.cursor()
+        self.db_user_version = c.execute('PRAGMA user_version').fetchone()[0]
         if self.db_user_version != self.user_version:
-            self._drop_all_tables()
-            self.__execute_sql(f'PRAGMA user_version = {self.user_version}')
+            tables = c.execute("SELECT name FROM sqlite_master WHERE type='table';").fetchall()
+            for table in tables:
+                c.execute(f'DROP TABLE IF EXISTS "{table[0]}"')
+            c.execute(f'PRAGMA user_version = {self.user_version}')
 
-        for table_name in CACHED_OBJECT_TYPES:
-            self._create_table(table_name)
+        for table_name in CACHED_OBJECT_TYPES + CACHED_DATA_TYPES:
+            c.execute(self._create_table_sql(table_name))
+        c.execute(f'''CREATE TABLE IF NOT EXISTS "{self.base64_encoded_aap_url}_responses"
+                     (endpoint text primary key,
+                      data text,
+                      cached_at real)''')
+        conn.commit()
+        conn.close()
+
+    def _create_table_sql(self, table_name):
+        return f'''CREATE TABLE IF NOT EXISTS "{self.base64_encoded_aap_url}_{table_name}"
+                  (id integer primary key,
+                   data blob,
+                   cached_at real)'''
 
     def _create_table(self, table_name):
-        self.__execute_sql(f'''CREATE TABLE IF NOT EXISTS "{self.base64_encoded_aap_url}_{table_name}"
-                              (id integer primary key,
-                               data blob)''')
+        self.__execute_sql(self._create_table_sql(table_name))
 
     def _drop_all_tables(self):
         # List all tables in the database
@@ -46,17 +73,105 @@ class Cache(object):
         for table_name in table_names:
             self.__execute_sql(f'DELETE FROM "{self.base64_encoded_aap_url}_{table_name}"')
 
+    def _record(self, table_name, started, hit=None):
+        if self.stats is not None:
+            self.stats.record_cache(table_name, time.perf_counter() - started, hit)
+
     def insert_cache(self, table_name, id, data):
+        started = time.perf_counter()
         data_pickled = pickle.dumps(data)
-        self.__execute_sql(f'''INSERT OR REPLACE INTO "{self.base64_encoded_aap_url}_{table_name}" (id, data) VALUES(?, ?)''', (id, data_pickled))
+        self.__execute_sql(f'''INSERT OR REPLACE INTO "{self.base64_encoded_aap_url}_{table_name}" (id, data, cached_at) VALUES(?, ?, ?)''',
+                           (id, data_pickled, time.time()))
+        self._record(table_name, started)
+
+    def insert_cache_many(self, table_name, items):
+        """Insert (id, object) pairs in a single transaction."""
+        started = time.perf_counter()
+        now = time.time()
+        rows = [(id, pickle.dumps(data), now) for id, data in items]
+        conn = sqlite3.connect(self.db_file)
+        conn.executemany(f'''INSERT OR REPLACE INTO "{self.base64_encoded_aap_url}_{table_name}" (id, data, cached_at) VALUES(?, ?, ?)''', rows)
+        conn.commit()
+        conn.close()
+        self._record(table_name, started)
 
     def load_cache(self, table_name):
+        started = time.perf_counter()
         conn = sqlite3.connect(self.db_file)
         c = conn.cursor()
         c.execute(f'''SELECT data FROM "{self.base64_encoded_aap_url}_{table_name}"''')
         rows = c.fetchall()
         conn.close()
-        return [pickle.loads(row[0]) for row in rows]
+        objects = [pickle.loads(row[0]) for row in rows]
+        self._record(table_name, started, hit=bool(objects))
+        return objects
+
+    def load_cache_item(self, table_name, id):
+        started = time.perf_counter()
+        row = self.__execute_sql(f'''SELECT data FROM "{self.base64_encoded_aap_url}_{table_name}" WHERE id = ?''', (id,))
+        if not isinstance(row, tuple):
+            self._record(table_name, started, hit=False)
+            return None
+        data = pickle.loads(row[0])
+        self._record(table_name, started, hit=True)
+        return data
+
+    def load_cache_entry(self, table_name, id):
+        """Return (object, cached_at) of one cached object, None when it is not cached."""
+        started = time.perf_counter()
+        row = self.__execute_sql(f'''SELECT data, cached_at FROM "{self.base64_encoded_aap_url}_{table_name}" WHERE id = ?''', (id,))
+        if not isinstance(row, tuple):
+            self._record(table_name, started, hit=False)
+            return None
+        self._record(table_name, started, hit=True)
+        return pickle.loads(row[0]), row[1] or 0.0
+
+    def touch_cache(self, table_name, id):
+        """Mark a cached object as checked against the controller now."""
+        self.__execute_sql(f'''UPDATE "{self.base64_encoded_aap_url}_{table_name}" SET cached_at = ? WHERE id = ?''', (time.time(), id))
+
+    def insert_responses(self, items):
+        """Keep (endpoint, body) of GET responses for the offline mode, in a single transaction.
+
+        The table is then pruned to STORED_RESPONSES_MAX_ENTRIES,
+        STORED_RESPONSES_MAX_BYTES and STORED_RESPONSES_MAX_AGE."""
+        started = time.perf_counter()
+        now = time.time()
+        table = f'"{self.base64_encoded_aap_url}_responses"'
+        conn = sqlite3.connect(self.db_file)
+        conn.executemany(f'''INSERT OR REPLACE INTO {table} (endpoint, data, cached_at) VALUES(?, ?, ?)''',
+                         [(endpoint, text, now) for endpoint, text in items])
+        conn.execute(f'''DELETE FROM {table} WHERE cached_at < ?''', (now - STORED_RESPONSES_MAX_AGE,))
+        conn.execute(f'''DELETE FROM {table} WHERE endpoint IN
+                         (SELECT endpoint FROM
+                           (SELECT endpoint,
+                                   row_number() OVER recent AS position,
+                                   sum(length(data)) OVER recent AS size
+                            FROM {table} WINDOW recent AS (ORDER BY cached_at DESC, rowid DESC))
+                          WHERE position > ? OR size > ?)''',
+                     (STORED_RESPONSES_MAX_ENTRIES, STORED_RESPONSES_MAX_BYTES))
+        conn.commit()
+        conn.close()
+        self._record('stored_responses', started)
+
+    def load_response(self, endpoint):
+        """Return (body, cached_at) of a kept GET response, None when there is none."""
+        started = time.perf_counter()
+        row = self.__execute_sql(f'''SELECT data, cached_at FROM "{self.base64_encoded_aap_url}_responses" WHERE endpoint = ?''', (endpoint,))
+        if not isinstance(row, tuple):
+            self._record('stored_responses', started, hit=False)
+            return None
+        self._record('stored_responses', started, hit=True)
+        return row
+
+    def last_refreshed(self):
+        """Return when the cached objects were last written, None for an empty cache."""
+        latest = None
+        for table_name in CACHED_OBJECT_TYPES:
+            row = self.__execute_sql(f'''SELECT max(cached_at) FROM "{self.base64_encoded_aap_url}_{table_name}"''')
+            if isinstance(row, tuple) and row[0] is not None:
+                latest = max(latest or 0, row[0])
+        return latest
 
     def __execute_sql(self, query, parameters=None, fetchone=True):
         conn = sqlite3.connect(self.db_file)
@@ -73,4 +188,60 @@ class Cache(object):
             r = c.lastrowid
         conn.commit()
         conn.close()
-        return r
\ No newline at end of file
+        return r
+
+
+class CacheWriter(object):
+    """Write-behind for objects refreshed in the shell and responses kept for the offline mode.
+
+    Writes are collected for delay seconds and then stored by a daemon
+    thread, with one transaction per table. The last write of an object wins."""
+
+    # Pseudo table of the pending responses, stored with Cache.insert_responses
+    RESPONSES = 'responses'
+
+    def __init__(self, cache, delay=0.5):
+        self.cache = cache
+        self.delay = delay
+        self._pending = OrderedDict()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def write(self, table_name, id, data):
+        with self._lock:
+            self._pending[(table_name, id)] = data
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='ash-cache-writer', daemon=True)
+                self._thread.start()
+
+    def write_response(self, endpoint, text):
+        self.write(self.RESPONSES, endpoint, text)
+
+    def load_response(self, endpoint):
+        """Return (body, cached_at) of a kept GET response, written or still pending."""
+        with self._lock:
+            text = self._pending.get((self.RESPONSES, endpoint))
+        if text is not None:
+            return text, time.time()
+        return self.cache.load_response(endpoint)
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, OrderedDict()
+        tables = OrderedDict()
+        for (table_name, id), data in pending.items():
+            tables.setdefault(table_name, []).append((id, data))
+        for table_name, items in tables.items():
+            if table_name == self.RESPONSES:
+                self.cache.insert_responses(items)
+            else:
+                self.cache.insert_cache_many(table_name, items)
+
+    def _run(self):
+        while True:
+            time.sleep(self.delay)
+            self.flush()
+            with self._lock:
+                if not self._pending:
+                    self._thread = None
+                    return
@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+
+"""Cooperative cancellation of the command running in a thread.
+
+A killed task is not interrupted wherever it happens to be, that could
+leave a lock or a request slot taken. It raises KeyboardInterrupt at the
+next check, between pages, requests and polls."""
+
+import threading
+import time
+
+_current = threading.local()
+
+
+def set_cancel_event(event):
+    """Make event the kill switch of the command running in this thread, None to clear it."""
+    _current.event = event
+
+
+def cancelled():
+    event = getattr(_current, 'event', None)
+    return event is not None and event.is_set()
+
+
+def check_cancelled():
+    """Raise KeyboardInterrupt when the command running in this thread was killed."""
+    if cancelled():
+        raise KeyboardInterrupt
+
+
+def sleep(seconds):
+    """time.sleep for polling loops, a kill ends it early."""
+    event = getattr(_current, 'event', None)
+    if event is None:
+        time.sleep(seconds)
+    else:
+        event.wait(seconds)
+    check_cancelled()
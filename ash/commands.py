@@ -4,9 +4,17 @@ from collections import OrderedDict
 
 ROOT_COMMANDS = OrderedDict([
     ('cd', 'Change context to a specific object (e.g., job_template <name_or_id>)'),
-    ('ls', 'List all objects of a certain type (e.g., job_templates, inventories)'),
-    ('watch', 'Watch jobs in real-time with dynamic updates to the dashboard'),
+    ('ls', 'List all objects of a certain type (e.g., job_templates, inventories), --format json|jsonl|csv for scripts, --all-controllers to query every configured controller'),
+    ('watch', 'Watch jobs in real-time with dynamic updates to the dashboard, --format jsonl|csv to stream status changes, --all-controllers to merge every configured controller'),
     ('cache', 'Refresh cached data from AAP (mostly for auto-completion)'),
+    ('timing', 'Print a network/json/cache/render time breakdown after each command (on or off)'),
+    ('profile', 'Profile a command, e.g. profile [--sample] [--out file.prof] ls jobs'),
+    ('stats', 'Show session request, cache and render statistics (json [file] to export, reset to clear)'),
+    ('tasks', 'List background tasks, started by ending a command with &, e.g. output &'),
+    ('fg', 'Wait for a background task in the foreground, e.g. fg 1 (Ctrl-C stops it)'),
+    ('kill', 'Stop a background task, e.g. kill 1'),
+    ('use', 'Switch to another controller of the configuration by description, without arguments list them'),
+    ('offline', 'Serve ls, cd, info and cached job output from the local cache without network (on or off)'),
     ('exit', 'Quit program')
 ])
 
@@ -21,7 +29,7 @@ LS_COMMANDS = OrderedDict([
     ('job_templates', 'List all job templates or fuzzy filtered by any field'),
     ('inventories', 'List all inventories or fuzzy filtered by any field'),
     ('projects', 'List all projects or fuzzy filtered by any field'),
-    ('jobs', 'List all jobs or fuzzy filtered by any field')
+    ('jobs', 'List all jobs or fuzzy filtered by any field, --pager for a full-screen view')
 ])
 
 JT_COMMANDS = OrderedDict([
@@ -43,7 +51,9 @@ JOB_COMMANDS = OrderedDict([
     ('relaunch', 'job: Relaunch the selected job'),
     ('reuse', 'job: Reuse the selected job parameters as prefill for a new job'),
     ('cancel', 'job: Cancel the selected job'),
-    ('output', 'job: Show output of the selected job'),
+    ('output', 'job: Show output of the selected job, --pager for a full-screen view'),
+    ('hosts', 'job: Show per-host results of the selected job, optionally filtered by status (failed, unreachable, changed, ok)'),
+    ('durations', 'job: Show the slowest tasks, roles, hosts and the critical path of the selected job'),
     ('inventory', 'job: Switch context to the inventory of the selected job'),
     ('project', 'job: Switch context to the project of the selected job'),
     ('template', 'job: Switch context to the job template of the selected job')
@@ -54,7 +64,7 @@ INVENTORY_COMMANDS = OrderedDict([
     ('refresh', 'inventory: Refresh the selected inventory'),
     ('open', 'inventory: Open the selected inventory in your browser'),
     ('url', 'inventory: Show the URL of the selected inventory'),
-    ('hosts', 'inventory: List hosts in the selected inventory'),
+    ('hosts', 'inventory: List hosts in the selected inventory, --pager for a full-screen view'),
     ('add_hosts', 'inventory: Add hosts to the selected inventory'),
     ('clear_hosts', 'inventory: Delete all hosts from the selected inventory')
 ])
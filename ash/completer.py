@@ -8,6 +8,7 @@ import json
 import os
 
 from collections import OrderedDict
+from .models import HOST_SUMMARY_STATUSES
 from .object_types import JOB_TEMPLATES, JOBS, INVENTORIES, PROJECTS
 
 
@@ -89,6 +90,20 @@ class AshCompleter(BaseCompleter):
                     self.cur_word,
                     ['inventories', 'job_templates', 'projects']
                 )
+            elif command == "use":
+                names = self.ash.config.names() if hasattr(self.ash.config, 'names') else []
+                # Descriptions may contain spaces, complete everything after the command
+                self.cur_word = ' '.join(self.word_list[1:])
+                self.completions = self._match_input(self.cur_word, names)
+            elif command in ("timing", "offline"):
+                self.completions = self._match_input(self.cur_word, ['on', 'off'])
+            elif command == "stats":
+                self.completions = self._match_input(self.cur_word, ['json', 'reset'])
+            elif command == "hosts" and self.ash.current_context_type == JOBS:
+                self.completions = self._match_input(
+                    self.cur_word,
+                    list(HOST_SUMMARY_STATUSES)
+                )
             elif command == "info":
                 self.completions = self._match_input(
                     self.cur_word,
@@ -8,9 +8,6 @@ import os
 import sys
 from urllib.parse import urlparse
 from pathlib import Path
-from iterfzf import iterfzf
-
-import yaml
 
 CONFIG_EXAMPLE = """
 Simple configuration example:
@@ -27,6 +24,9 @@ Or multiple configurations:
   api_path: "/api/controller/v2/"
   description: "My AAP instance"
   description_color: "green"
+  notify_bell: true
+  notify_command: 'notify-send "ash" "Job {id} {name}: {status}"'
+  history_size: 10000
 - base_url: "https://your-other-aap-url.com"
   token: "your-other-token"
   api_path: "/api/controller/v2/"
@@ -39,7 +39,11 @@ CONFIGS = [
     'api_path',
     'verify_ssl',
     'description',
-    'description_color'
+    'description_color',
+    'notify_bell',
+    'notify_command',
+    'notify_interval',
+    'history_size',
 ]
 
 class Config():
@@ -47,7 +51,7 @@ class Config():
        Loads configuration from a YAML file and provides
        access to the settings as attributes."""
 
-    def __init__(self, config_file=None):
+    def __init__(self, config_file=None, description=None):
         if not config_file:
             self.data_folder = Path.home().joinpath(".local", "share", "ash")
             if not self.data_folder.exists():
@@ -56,11 +60,19 @@ class Config():
         else:
             self.config_file = config_file
         config = self.__load_config()
+        # Every controller of the file, 'use' switches between them in a running shell
+        self.entries = config if isinstance(config, list) else [config]
         if not isinstance(config, dict):
             if not isinstance(config, list) or not config:
                 print(f"Invalid config format in {self.config_file}. Expected a mapping or a non-empty list of mappings.")
                 sys.exit(1)
-            if len(config) == 1:
+            if description:
+                matches = [item for item in config if item.get('description') == description]
+                if not matches:
+                    print(f"No configuration with description '{description}' in {self.config_file}.")
+                    sys.exit(1)
+                config = matches[0]
+            elif len(config) == 1:
                 config = config[0]
             else:
                 choices = []
@@ -69,6 +81,9 @@ class Config():
                     base_url = item.get('base_url', 'No base_url provided')
                     choices.append(f"{idx + 1}. {base_url} - {description}")
 
+                # Only multi-controller configs need the picker, keep it off the startup path
+                from iterfzf import iterfzf
+
                 options = {"--layout=reverse"}
                 height = len(choices) + 2
                 user_input = None
@@ -78,34 +93,58 @@ class Config():
                 idx = int(user_input.split('.')[0]) - 1
                 config = config[idx]
 
+        try:
+            self._apply(config)
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
+
+    def _apply(self, config):
+        """Load one entry of the file, raise ValueError when it is invalid."""
         for k, v in config.items():
             if k in CONFIGS:
                 setattr(self, k, v)
             else:
-                print(f"Unknown config key: {k}")
-                sys.exit(1)
+                raise ValueError(f"Unknown config key: {k}")
 
         self._validate_config()
         self.config = config
 
+    @staticmethod
+    def entry_name(entry):
+        return entry.get('description') or entry.get('base_url')
+
+    def names(self):
+        """Return the description, or base_url, of every configured controller."""
+        return [self.entry_name(entry) for entry in self.entries if isinstance(entry, dict)]
+
+    def select(self, name):
+        """Return the Config of another controller of the same file, or None when there is none by that name.
+
+        Raise ValueError when its entry is invalid, a running shell keeps the active controller."""
+        matches = [entry for entry in self.entries if isinstance(entry, dict) and name in (entry.get('description'), entry.get('base_url'))]
+        if not matches:
+            return None
+        other = Config.__new__(Config)
+        other.config_file = self.config_file
+        other.entries = self.entries
+        other._apply(matches[0])
+        return other
+
     def _validate_config(self):
         if not getattr(self, 'base_url', None):
-            print("Missing required config key: base_url")
-            sys.exit(1)
+            raise ValueError("Missing required config key: base_url")
         if not getattr(self, 'token', None):
-            print("Missing required config key: token")
-            sys.exit(1)
+            raise ValueError("Missing required config key: token")
 
         parsed = urlparse(str(self.base_url))
         if parsed.scheme not in ('http', 'https') or not parsed.netloc:
-            print(f"Invalid base_url: {self.base_url}. Expected an absolute URL with http/https.")
-            sys.exit(1)
+            raise ValueError(f"Invalid base_url: {self.base_url}. Expected an absolute URL with http/https.")
 
         if not getattr(self, 'api_path', None):
             self.api_path = '/api/controller/v2/'
         if not str(self.api_path).startswith('/'):
-            print(f"Invalid api_path: {self.api_path}. It must start with '/'.")
-            sys.exit(1)
+            raise ValueError(f"Invalid api_path: {self.api_path}. It must start with '/'.")
 
         verify_ssl = getattr(self, 'verify_ssl', True)
         if isinstance(verify_ssl, str):
@@ -114,6 +153,8 @@ class Config():
 
     def __load_config(self):
         if os.path.exists(self.config_file):
+            import yaml
+
             with open(self.config_file, 'r', encoding='utf-8') as f:
                 config = yaml.safe_load(f)
             if config is None:
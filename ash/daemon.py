@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+
+"""ashd, an optional process shared by the shells of a user.
+
+It owns one API client, the warm object indexes and a short lived GET cache
+per controller. Shells talk to it over a Unix socket with one JSON document
+per line. A new shell gets its indexes without touching the controller, and
+identical GETs sent by several shells within RESPONSE_TTL of each other cost
+one controller request. Each shell still runs its own watch and job notifier
+polling, ticks that do not line up are separate requests."""
+
+import argparse
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+from pathlib import Path
+
+SOCKET_PATH = Path.home().joinpath(".local", "share", "ash", "ashd.sock")
+
+# GET responses younger than this are shared between shells, a watch tick or a notifier poll is 2s or more
+RESPONSE_TTL = 2.0
+
+# Bounds of the shared GET responses of one controller
+RESPONSE_MAX_ENTRIES = 1024
+RESPONSE_MAX_BYTES = 32 * 1024 * 1024
+
+# Lifetime of a warm index, the 'cache' command of any shell refreshes it earlier
+INDEX_TTL = 3600
+
+
+def socket_path():
+    return Path(os.environ.get('ASH_DAEMON_SOCKET') or SOCKET_PATH)
+
+
+class DaemonClient(object):
+    """Connection to ashd, one socket per thread so background tasks do not wait on each other."""
+
+    def __init__(self, path=None, timeout=30):
+        self.path = str(path or socket_path())
+        self.timeout = timeout
+        self._local = threading.local()
+
+    @classmethod
+    def connect(cls, path=None):
+        """Return a client when an ashd answers on the socket, None otherwise."""
+        path = Path(path or socket_path())
+        if os.environ.get('ASH_NO_DAEMON') or not path.exists():
+            return None
+        client = cls(path)
+        reply = client.call({'op': 'ping'})
+        if not reply or not reply.get('ok'):
+            client.close()
+            return None
+        return client
+
+    def _stream(self):
+        stream = getattr(self._local, 'stream', None)
+        if stream is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.path)
+            stream = sock.makefile('rwb')
+            self._local.sock = sock
+            self._local.stream = stream
+        return stream
+
+    def call(self, request):
+        """Send one request, return the reply dict or None when the daemon cannot be reached."""
+        try:
+            stream = self._stream()
+            stream.write(json.dumps(request).encode('utf-8') + b'\n')
+            stream.flush()
+            line = stream.readline()
+        except (OSError, ValueError):
+            self.close()
+            return None
+        if not line:
+            self.close()
+            return None
+        return json.loads(line)
+
+    def close(self):
+        stream = getattr(self._local, 'stream', None)
+        if stream is not None:
+            try:
+                stream.close()
+                self._local.sock.close()
+            except OSError:
+                pass
+        self._local.stream = None
+        self._local.sock = None
+
+
+class ControllerService(object):
+    """What ashd keeps for one controller: its API client, GET responses and indexes."""
+
+    def __init__(self, base_url, token, api_path, verify_ssl):
+        # The server side needs requests and sqlite, shells only import the client above
+        from .aap import AAP, API
+        from .cache import Cache
+        from .response_cache import ResponseCache
+
+        self.api = API(base_url, token, api_path, verify_ssl=verify_ssl)
+        self.cache = Cache(base_url)
+        self.aap = AAP(self.api, cache=self.cache)
+        # Every endpoint is shared for RESPONSE_TTL, expired and least recently used responses are dropped
+        self.responses = ResponseCache(max_entries=RESPONSE_MAX_ENTRIES, max_bytes=RESPONSE_MAX_BYTES, ttls={},
+                                       default_ttl=RESPONSE_TTL)
+        self.indexes = {}
+        self._lock = threading.Lock()
+
+    def request(self, method, endpoint, payload=None, fresh=False):
+        if method != 'GET':
+            response = self.api.post_request(endpoint, payload) if method == 'POST' else self.api.delete_request(endpoint)
+            self.api.responses.clear()
+            # A write may change any listing of this controller
+            self.responses.clear()
+            return self._reply(response)
+
+        if not fresh:
+            cached = self.responses.get(endpoint)
+            if cached is not None:
+                return self._reply(cached)
+        # Shells asking for this endpoint at the same time share the API's single in-flight call
+        response = self.api.get_request(endpoint, fresh=fresh)
+        self.responses.put(endpoint, response)
+        return self._reply(response)
+
+    @staticmethod
+    def _reply(response):
+        if response is None:
+            return {'error': 'No response from API'}
+        return {'status': response.status_code, 'text': response.text}
+
+    def objects(self, object_type, refresh=False):
+        """Return the data of every object of a cached type, fetched once for all the shells."""
+        with self._lock:
+            index = self.indexes.get(object_type)
+        if index and not refresh and index[0] > time.monotonic():
+            return index[1]
+
+        objects = None
+        if refresh:
+            self.cache.clean_cache(object_type)
+        else:
+            objects = self.cache.load_cache(object_type)
+        if not objects:
+            objects = getattr(self.aap, f'get_{object_type}')()
+            if objects is None:
+                return None
+            self.cache.insert_cache_many(object_type, ((obj.id, obj) for obj in objects))
+        data = [obj.data for obj in objects]
+        with self._lock:
+            self.indexes[object_type] = (time.monotonic() + INDEX_TTL, data)
+        return data
+
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.services = {}
+        self._services_lock = threading.Lock()
+        if self.path.exists():
+            self.path.unlink()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # The socket carries tokens, only the owner may connect
+        previous_umask = os.umask(0o177)
+        try:
+            super().__init__(str(self.path), DaemonHandler)
+        finally:
+            os.umask(previous_umask)
+
+    def service(self, request):
+        key = (request['base_url'], request['api_path'], request['token'])
+        with self._services_lock:
+            service = self.services.get(key)
+            if service is None:
+                service = self.services[key] = ControllerService(request['base_url'], request['token'],
+                                                                 request['api_path'], request.get('verify_ssl', True))
+        return service
+
+    def dispatch(self, request):
+        op = request.get('op')
+        if op == 'ping':
+            return {'ok': True, 'pid': os.getpid()}
+        if op == 'probe':
+            return {'ok': self.service(request).api.ping()}
+        if op == 'request':
+            return self.service(request).request(request['method'], request['endpoint'], request.get('payload'),
+                                                 request.get('fresh', False))
+        if op == 'objects':
+            data = self.service(request).objects(request['object_type'], refresh=request.get('refresh', False))
+            if data is None:
+                return {'error': f"Unable to retrieve {request['object_type']}"}
+            return {'objects': data}
+        return {'error': f"Unknown operation: {op}"}
+
+    def server_close(self):
+        super().server_close()
+        if self.path.exists():
+            self.path.unlink()
+
+
+class DaemonHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                reply = self.server.dispatch(json.loads(line))
+            except Exception as e:  # pylint: disable=broad-except
+                # One bad request must not take the connection, or the daemon, down
+                reply = {'error': str(e)}
+            self.wfile.write(json.dumps(reply).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+
+def serve(path=None):
+    """Run ashd until interrupted."""
+    server = DaemonServer(path or socket_path())
+    print(f"ashd listening on {server.path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='ashd', description='Shared API clients and indexes for the ash shells of this user')
+    parser.add_argument('-s', '--socket', help=f'Unix socket path, default {SOCKET_PATH}')
+    args = parser.parse_args()
+    path = Path(args.socket) if args.socket else socket_path()
+    if DaemonClient.connect(path):
+        print(f"ashd is already running on {path}")
+        sys.exit(1)
+    serve(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,18 +2,65 @@
 
 """Display and formatting utilities for ash."""
 
+import csv
+import json
 import re
-
-import dateutil.parser
+import sys
+import time
+from datetime import datetime
+from functools import lru_cache
 from prompt_toolkit import print_formatted_text
 from prompt_toolkit.formatted_text import FormattedText
 
-from .models import Inventory, Job, JobTemplate, Project
+from .models import ControllerRow, Inventory, Job, JobTemplate, Project, HostSummary
+
+OUTPUT_FORMATS = ('json', 'jsonl', 'csv')
+
+JOB_COLUMNS = ['id', 'created', 'limit', 'name', 'playbook', 'scm_branch', 'status']
+JOB_TEMPLATE_COLUMNS = ['id', 'name', 'playbook']
+INVENTORY_COLUMNS = ['id', 'name', 'total_hosts']
+PROJECT_COLUMNS = ['id', 'name', 'scm_url']
+HOST_COLUMNS = ['id', 'name']
+HOST_SUMMARY_COLUMNS = ['host', 'status', 'ok', 'changed', 'failures', 'unreachable', 'skipped']
+
+ISO_DATETIME_RE = re.compile(r"[0-9]{4}-[0-9]{2}-[0-9]{2}T[0-9]{2}:[0-9]{2}:[0-9]{2}(\.[0-9]+)?([Zz]|([\+-])([01]\d|2[0-3]):?([0-5]\d)?)?")
+
+# Columns whose width is fixed to the formatted timestamp
+DATETIME_COLUMNS = ('created', 'modified', 'finished')
+
+
+@lru_cache(maxsize=4096)
+def format_timestamp(label):
+    """Format an ISO datetime label for display, memoized as listings repeat the same values."""
+    try:
+        # fromisoformat covers what AAP returns and is much cheaper than isoparse
+        dt = datetime.fromisoformat(label)
+    except ValueError:
+        import dateutil.parser
+
+        try:
+            dt = dateutil.parser.isoparse(label)
+        except (ValueError, TypeError):
+            return label
+    return dt.astimezone().strftime('%d/%m-%H:%M')
+
+
+def format_age(seconds):
+    """Format a duration the way a prompt can afford, e.g. 45s, 12m, 3h or 2d."""
+    for unit, size in (('d', 86400), ('h', 3600), ('m', 60)):
+        if seconds >= size:
+            return f"{int(seconds // size)}{unit}"
+    return f"{int(max(seconds, 0))}s"
 
 
 class Display:
-    def __init__(self, style):
+    def __init__(self, style, stats=None):
         self.style = style
+        self.stats = stats
+
+    def _record_render(self, started):
+        if self.stats is not None:
+            self.stats.record_render(time.perf_counter() - started)
 
     def print(self, message, class_name=None, attrs=None, end='\n'):
         if class_name:
@@ -21,14 +68,16 @@ class Display:
         else:
             print(message, end=end)
 
+    def error(self, message):
+        """Print a message telling a command failed, a batch run then exits with a failure status."""
+        if self.stats is not None:
+            self.stats.record_error()
+        self.print(message, 'red')
+
     def parse_label(self, label, max_length=None):
         # if string is ISO datetime, parse and format it
-        if re.match(r"[0-9]{4}-[0-9]{2}-[0-9]{2}T[0-9]{2}:[0-9]{2}:[0-9]{2}(\.[0-9]+)?([Zz]|([\+-])([01]\d|2[0-3]):?([0-5]\d)?)?", label):
-           try:
-                dt = dateutil.parser.isoparse(label)
-                label = dt.astimezone().strftime('%d/%m-%H:%M')
-           except (ValueError, TypeError):
-                pass
+        if ISO_DATETIME_RE.match(label):
+            label = format_timestamp(label)
         if max_length is None or len(label) <= max_length:
             return label
         else:
@@ -46,7 +95,19 @@ class Display:
         else:
             return 'white'
 
+    def host_status_to_color(self, status):
+        if status == 'failed':
+            return 'red'
+        elif status == 'unreachable':
+            return 'magenta'
+        elif status == 'changed':
+            return 'yellow'
+        else:
+            return 'green'
+
     def object_to_color(self, obj):
+        if isinstance(obj, ControllerRow):
+            obj = obj.obj
         if isinstance(obj, JobTemplate):
             return 'cyan'
         elif isinstance(obj, Inventory):
@@ -55,38 +116,97 @@ class Display:
             return 'orange'
         elif isinstance(obj, Job):
             return self.status_to_color(obj.status)
+        elif isinstance(obj, HostSummary):
+            return self.host_status_to_color(obj.status)
         else:
             return 'white'
 
-    def display_by_columns(self, objects, columns):
-        column_widths = {}
-        for col in columns:
-            if col in ['created', 'modified', 'finished']:
+    def _column_widths(self, columns, cells):
+        column_widths = []
+        for col, values in zip(columns, cells):
+            if col in DATETIME_COLUMNS:
                 max_len = 11
             else:
-                max_len = max([len(str(getattr(obj, col))) for obj in objects] + [len(col)])
+                max_len = max([len(value) for value in values] + [len(col)])
             if col == 'limit' and max_len > 30:
                 max_len = 30
             elif col == 'scm_branch' and max_len > 25:
                 max_len = 25
-            column_widths[col] = max_len
+            column_widths.append(max_len)
+        return column_widths
 
-        format_str = "   ".join([f"{{:<{column_widths[col]}}}" for col in columns])
-        header = format_str.format(*[col for col in columns])
-        self.print(header, 'headers')
-        for obj in objects:
-            message = format_str.format(*[self.parse_label(str(getattr(obj, col)), column_widths[col]) for col in columns])
-            color = self.object_to_color(obj)
-            self.print(message, color + '_bold')
+    def display_by_columns(self, objects, columns):
+        started = time.perf_counter()
+        # Cells are extracted once per column and reused for widths and output
+        cells = [[str(getattr(obj, col)) for obj in objects] for col in columns]
+        column_widths = self._column_widths(columns, cells)
+
+        format_str = "   ".join([f"{{:<{width}}}" for width in column_widths])
+        labels = [[self.parse_label(value, width) for value in values] for values, width in zip(cells, column_widths)]
+
+        # The whole table is written with a single formatted text call
+        fragments = [('class:headers', format_str.format(*columns)), ('', '\n')]
+        for obj, row in zip(objects, zip(*labels)):
+            fragments.append((f'class:{self.object_to_color(obj)}_bold', format_str.format(*row)))
+            fragments.append(('', '\n'))
+        print_formatted_text(FormattedText(fragments), style=self.style, end='')
+        self._record_render(started)
+
+    def column_row_renderer(self, columns, sample):
+        """Return (header, render_row) for paged views, with widths taken from a sample of rows."""
+        cells = [[str(getattr(obj, col)) for obj in sample] for col in columns]
+        column_widths = self._column_widths(columns, cells)
+        format_str = "   ".join([f"{{:<{width}}}" for width in column_widths])
+
+        def render_row(obj):
+            row = [self.parse_label(str(getattr(obj, col)), width) for col, width in zip(columns, column_widths)]
+            return [(f'class:{self.object_to_color(obj)}_bold', format_str.format(*row))]
+
+        return [('class:headers', format_str.format(*columns))], render_row
+
+    def stream_by_columns(self, pages, columns, output_format, out=None, header=True):
+        """Write rows in a machine readable format as pages of objects arrive.
+
+        Values are written raw, without width computation or styling, and the
+        output is flushed after every page so consumers see rows immediately."""
+        out = out or sys.stdout
+        writer = None
+        first = True
+        if output_format == 'csv':
+            writer = csv.writer(out)
+            if header:
+                writer.writerow(columns)
+        elif output_format == 'json':
+            out.write('[')
+        for page in pages:
+            # Only the formatting is timed, not the fetch of the next page
+            started = time.perf_counter()
+            for obj in page:
+                row = [getattr(obj, col, None) for col in columns]
+                if writer is not None:
+                    writer.writerow(row)
+                elif output_format == 'json':
+                    out.write(('\n' if first else ',\n') + json.dumps(dict(zip(columns, row))))
+                else:
+                    out.write(json.dumps(dict(zip(columns, row))) + '\n')
+                first = False
+            out.flush()
+            self._record_render(started)
+        if output_format == 'json':
+            out.write('\n]\n' if not first else ']\n')
+            out.flush()
 
     def display_jobs(self, jobs):
-        self.display_by_columns(jobs, ['id', 'created', 'limit', 'name', 'playbook', 'scm_branch', 'status'])
+        self.display_by_columns(jobs, JOB_COLUMNS)
+
+    def display_host_summaries(self, host_summaries):
+        self.display_by_columns(host_summaries, HOST_SUMMARY_COLUMNS)
 
     def display_job_templates(self, job_templates):
-        self.display_by_columns(job_templates, ['id', 'name', 'playbook'])
+        self.display_by_columns(job_templates, JOB_TEMPLATE_COLUMNS)
 
     def display_inventories(self, inventories):
-        self.display_by_columns(inventories, ['id', 'name', 'total_hosts'])
+        self.display_by_columns(inventories, INVENTORY_COLUMNS)
 
     def display_projects(self, projects):
-        self.display_by_columns(projects, ['id', 'name', 'scm_url'])
+        self.display_by_columns(projects, PROJECT_COLUMNS)
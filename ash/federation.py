@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+
+"""Queries fanned out to every configured controller."""
+
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError, as_completed
+
+# Seconds a controller has to answer before the merged result is shown without it
+FEDERATED_TIMEOUT = 20
+
+
+def fan_out(controllers, function, timeout=FEDERATED_TIMEOUT, on_result=None):
+    """Call function(name, state) for every (name, state) of controllers concurrently.
+
+    on_result(name, value) is called as each controller answers. Return
+    (results, failures): results are (name, value) in configuration order,
+    failures are (name, reason) for controllers that raised, returned None
+    or did not answer in time. A controller that times out is not waited for."""
+    if not controllers:
+        return [], []
+    executor = ThreadPoolExecutor(max_workers=len(controllers), thread_name_prefix='ash-federated')
+    futures = {executor.submit(function, name, state): name for name, state in controllers}
+    values, failures = {}, []
+    try:
+        for future in as_completed(futures, timeout=timeout):
+            name = futures[future]
+            try:
+                value = future.result()
+            except Exception as e:  # pylint: disable=broad-except
+                failures.append((name, str(e)))
+                continue
+            if value is None:
+                failures.append((name, 'request failed'))
+                continue
+            values[name] = value
+            if on_result:
+                on_result(name, value)
+    except FuturesTimeoutError:
+        failures.extend((name, 'timed out') for future, name in futures.items() if not future.done())
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    results = [(name, values[name]) for name, _ in controllers if name in values]
+    return results, failures
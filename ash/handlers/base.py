@@ -6,10 +6,12 @@ import json
 import subprocess
 import webbrowser
 
-import yaml
-from iterfzf import iterfzf
-
-from ..object_types import JOB_TEMPLATES, JOBS, INVENTORIES
+from ..display import OUTPUT_FORMATS
+from .. import cancellation
+from ..models import LaunchForm
+from ..pager import Pager
+from ..profiling import CommandProfiler
+from ..object_types import JOB_TEMPLATES, JOBS, LAUNCH_FORMS
 
 
 class BaseHandler:
@@ -39,6 +41,43 @@ class BaseHandler:
     def inventory(self, args):
         self.ash._job_handler.inventory(args)
 
+    def hosts(self, args):
+        output_format, args = self._pop_output_format(args)
+        if args is None:
+            return
+        if self.ash.current_context_type == JOBS:
+            self.ash._job_handler.hosts(args, output_format)
+        else:
+            self.ash._inventory_handler.hosts(args, output_format)
+
+    def profile(self, args):
+        """Profile another command."""
+        ash = self.ash
+        sample, args = self._pop_flag(args, '--sample')
+        output_file = None
+        if '--out' in args:
+            index = args.index('--out')
+            output_file = args[index + 1] if index + 1 < len(args) else None
+            args = args[:index] + args[index + 2:]
+            if not output_file:
+                ash.display.print("Usage: profile [--sample] [--out file] <command ...>", 'yellow')
+                return
+
+        command = args[0] if args else None
+        if command and command != 'profile' and command in ash.commands and command in ash._command_handlers:
+            profiler = CommandProfiler(sample=sample)
+            with profiler:
+                try:
+                    ash._command_handlers[command](args[1:])
+                except KeyboardInterrupt:
+                    ash.display.error("\nCommand interrupted by user.")
+            profiler.report()
+            if output_file:
+                profiler.dump(output_file)
+                ash.display.print(f"Profile written to {output_file}.", 'green')
+        else:
+            ash.display.print("Usage: profile [--sample] [--out file] <command ...>", 'yellow')
+
     def info(self, args):
         info = {}
         if args:
@@ -49,7 +88,10 @@ class BaseHandler:
         print(json.dumps(info, indent=4))
 
     def refresh(self, args):
-        self.ash.current_context.refresh()
+        if self.ash.api.offline:
+            self.ash.display.print("The context cannot be refreshed offline, use 'offline off' first.", 'yellow')
+            return
+        self.ash.current_context.refresh(fresh=True)
         if self.ash.current_context_type != JOBS:
             self.ash.cache.insert_cache(
                 self.ash.current_context_type,
@@ -72,7 +114,7 @@ class BaseHandler:
             except OSError as exc:
                 ash.display.print(f"Unable to access clipboard: {exc}. Please copy manually: {url}", 'yellow')
         else:
-            ash.display.print("Unable to get URL for the current context.", 'red')
+            ash.display.error("Unable to get URL for the current context.")
 
     def open(self, args):
         ash = self.ash
@@ -81,12 +123,46 @@ class BaseHandler:
             webbrowser.open(url)
             ash.display.print(f"Opened {url} in your browser.", 'green')
         else:
-            ash.display.print("Unable to get URL for the current context.", 'red')
+            ash.display.error("Unable to get URL for the current context.")
 
     # ------------------------------------------------------------------ #
     # Shared utilities
     # ------------------------------------------------------------------ #
 
+    # Listing options
+
+    def _pop_output_format(self, args):
+        """Extract '--format <fmt>' or '--format=<fmt>' from args.
+
+        Returns (output_format, remaining_args), or (None, None) when the format is invalid."""
+        output_format = None
+        remaining = []
+        args_iter = iter(args)
+        for arg in args_iter:
+            if arg == '--format':
+                output_format = next(args_iter, '')
+            elif arg.startswith('--format='):
+                output_format = arg.split('=', 1)[1]
+            else:
+                remaining.append(arg)
+
+        if output_format is not None and output_format not in OUTPUT_FORMATS:
+            self.ash.display.error(f"Unknown format: '{output_format}'. Valid formats are: {', '.join(OUTPUT_FORMATS)}.")
+            return None, None
+        return output_format, remaining
+
+    def _pop_flag(self, args, flag):
+        """Return (present, remaining_args) for a boolean flag such as '--pager'."""
+        if flag in args:
+            return True, [arg for arg in args if arg != flag]
+        return False, args
+
+    def _page_by_columns(self, source, columns, title):
+        ash = self.ash
+        sample = [source.get(index) for index in range(min(len(source), source.page_size))]
+        header, render_row = ash.display.column_row_renderer(columns, sample)
+        Pager(source, render_row, header=header, title=title, style=ash.style).run()
+
     # Input collection for launch variables
 
     def _ask_variable(self, var):
@@ -109,6 +185,8 @@ class BaseHandler:
             ash.display.print("Invalid input. Please try again.", 'yellow')
 
     def _multiple_choice_prompt(self, name, description, choices, default=None, required=False, multi=False):
+        from iterfzf import iterfzf
+
         options = {"--layout=reverse"}
         height = len(choices) + 2
         user_input = None
@@ -173,6 +251,9 @@ class BaseHandler:
             default = inventory.get('id')
             if default:
                 default_display = f"{default}:{inventory.get('name', '')}"
+        elif var == "limit" and getattr(ash, 'host_limit', None):
+            default = ash.host_limit
+            ash.host_limit = None
         else:
             default = getattr(ash.current_context, var, '')
 
@@ -223,16 +304,31 @@ class BaseHandler:
             user_input = [int(cred.strip()) for cred in user_input.split(',') if cred.strip().isdigit()]
 
         if var == "extra_vars":
+            import yaml
+
             try:
                 user_input = yaml.safe_load(user_input) if user_input else {}
                 if user_input is None:
                     user_input = {}
             except yaml.YAMLError as e:
-                ash.display.print(f"Error parsing YAML: {e}", 'red')
+                ash.display.error(f"Error parsing YAML: {e}")
                 return False, None
 
         return True, user_input
 
+    def _launch_form(self, template):
+        """Return the LaunchForm of a job template, from the cache while the template is not modified."""
+        ash = self.ash
+        modified = getattr(template, 'modified', None)
+        form = ash.cache.load_cache_item(LAUNCH_FORMS, template.id) if modified else None
+        if form is None or form.modified != modified:
+            survey_spec = template.get_survey_spec() if template.survey_enabled else []
+            form = LaunchForm(modified, template.get_asked_variables(), survey_spec)
+            # An empty spec of a survey enabled template is a failed request, it is asked again next time
+            if modified and (survey_spec or not template.survey_enabled):
+                ash.cache.insert_cache(LAUNCH_FORMS, template.id, form)
+        return form
+
     # ------------------------------------------------------------------ #
     # Inventory resolution helpers
     # ------------------------------------------------------------------ #
@@ -243,18 +339,18 @@ class BaseHandler:
         if reference.isdigit():
             inventory = ash.inventories_by_id.get(int(reference))
             if not inventory:
-                inventory = ash.aap.get_inventory(int(reference))  # Attempt to fetch from API if not in cache
+                # Reads through the local cache, the controller is only asked on a miss and it writes the entry back
+                inventory = ash.aap.get_inventory(int(reference))
                 if inventory:
                     ash.inventories.append(inventory)
                     ash.inventories_by_id[int(reference)] = inventory
                     ash.inventories_by_name[inventory.name] = inventory
-                    ash.cache.insert_cache(INVENTORIES, inventory.id, inventory)
                 else:
-                    ash.display.print(f"Invalid inventory ID {reference}. Please enter a valid inventory ID or name.", 'red')
+                    ash.display.error(f"Invalid inventory ID {reference}. Please enter a valid inventory ID or name.")
         else:
             inventory = ash.inventories_by_name.get(reference)
             if not inventory:
-                ash.display.print(f"Invalid inventory name {reference}. Please enter a valid inventory ID or name.", 'red')
+                ash.display.error(f"Invalid inventory name {reference}. Please enter a valid inventory ID or name.")
         return inventory
 
     # ------------------------------------------------------------------ #
@@ -271,9 +367,10 @@ class BaseHandler:
         return user_input.lower()
 
     def _execute_payload(self, template, payload):
-        import time
         import sys
         ash = self.ash
+        # The limit of a 'hosts' filter is offered to the next launch or reuse only, asked for or not
+        ash.host_limit = None
         if not self._validate_payload(payload) in ['yes', 'y']:
             ash.display.print("Job launch cancelled.", 'red_bold')
             return
@@ -285,11 +382,12 @@ class BaseHandler:
                 payload_copy['inventory'] = inv_id
                 job = template.launch(payload_copy)
                 if job:
+                    ash.notifier.track(job)
                     ash.display.print(f"Launched job with ID: {job.id} for inventory ID: {inv_id}", 'yellow')
                     while job.status in ['pending', 'waiting', 'running']:
                         ash.display.print(f"Job with ID: {job.id} for inventory ID: {inv_id} is currently {job.status}. Elapsed time: {str(job.elapsed)}", ash.display.status_to_color(job.status), end='')
                         job.refresh()
-                        time.sleep(5)
+                        cancellation.sleep(5)
                         sys.stdout.write('\r')      # Move cursor to the beginning of the line
                         sys.stdout.write('\033[K')  # Clear to the end of the line
                     ash.display.print(f"Job with ID: {job.id} for inventory ID: {inv_id} finished with status: {job.status}. Total elapsed time: {str(job.elapsed)}", ash.display.status_to_color(job.status))
@@ -297,6 +395,7 @@ class BaseHandler:
             job = template.launch(payload)
 
             if job:
+                ash.notifier.track(job)
                 ash.display.print(f"Launched job with ID: {job.id}, switching context to the new job and displaying output...", 'yellow')
                 ash._switch_context(job, JOBS)
                 ash._cmd_output([])
@@ -3,13 +3,24 @@
 """Inventory context command handler."""
 
 from .base import BaseHandler
+from ..display import HOST_COLUMNS
+from ..object_types import HOSTS
+from ..pager import api_source
 
 
 class InventoryHandler(BaseHandler):
     """Handles commands available in the inventory context: hosts, add_hosts, clear_hosts."""
 
-    def hosts(self, args):
+    def hosts(self, args, output_format=None):
         ash = self.ash
+        pager, args = self._pop_flag(args, '--pager')
+        if pager:
+            source = api_source(ash.api, HOSTS, baseuri=f"{ash.current_context.uri}/hosts/")
+            self._page_by_columns(source, HOST_COLUMNS, f"Hosts of {ash.current_context.name}")
+            return
+        if output_format:
+            ash.display.stream_by_columns(ash.current_context.iter_hosts(), HOST_COLUMNS, output_format)
+            return
         hosts = ash.current_context.get_hosts()
         if hosts:
             for host in hosts:
@@ -30,9 +41,9 @@ class InventoryHandler(BaseHandler):
                 if result.status_code in [201]:
                     ash.display.print(f"{host}: Host added successfully.", 'green')
                 elif result.status_code == 400:
-                    ash.display.print(f"{host}: {result.json().get('__all__', ['Unknown error'])[0]}", 'red')
+                    ash.display.error(f"{host}: {result.json().get('__all__', ['Unknown error'])[0]}")
                 else:
-                    ash.display.print(f"{host}: Failed to add host. Status code: {result.status_code}", 'red')
+                    ash.display.error(f"{host}: Failed to add host. Status code: {result.status_code}")
 
     def clear_hosts(self, args):
         ash = self.ash
@@ -44,6 +55,6 @@ class InventoryHandler(BaseHandler):
                     if result.status_code in [204]:
                         ash.display.print(f"{host}: Host deleted successfully.", 'green')
                     else:
-                        ash.display.print(f"{host}: Failed to delete host. Status code: {result.status_code}", 'red')
+                        ash.display.error(f"{host}: Failed to delete host. Status code: {result.status_code}")
         else:
             ash.display.print("Operation cancelled.", 'yellow')
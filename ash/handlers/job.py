@@ -4,22 +4,30 @@
 
 import json
 
+from prompt_toolkit.formatted_text import ANSI, to_formatted_text
+
 from .base import BaseHandler
+from ..display import HOST_SUMMARY_COLUMNS
+from ..models import HOST_SUMMARY_FILTERS, HOST_SUMMARY_STATUSES, host_summary_from_data
+from ..pager import Pager, api_source, list_source, stdout_source
+from ..object_types import JOB_PROFILES
+from ..job_profile import JobProfile, PROFILED_EVENTS, format_duration
 
 
 class JobHandler(BaseHandler):
     """Handles commands available in the job context: relaunch, reuse, cancel, output,
-    inventory, project, template."""
+    durations, hosts, inventory, project, template."""
 
     def relaunch(self, args):
         ash = self.ash
         job = ash.current_context.relaunch()
         if job:
+            ash.notifier.track(job)
             ash.display.print(f"Relaunched job with ID: {job.id}, switching context to the new job and displaying output...", 'yellow')
             ash._switch_context(job, 'jobs')
             ash._cmd_output([])
         else:
-            ash.display.print("Failed to relaunch the job.", 'red')
+            ash.display.error("Failed to relaunch the job.")
 
     def reuse(self, args):
         ash = self.ash
@@ -28,9 +36,10 @@ class JobHandler(BaseHandler):
 
         template = ash.job_templates_by_id.get(job.job_template)
         if not template:
-            ash.display.print("Original job template not found in cache. Cannot reuse the job.", 'red')
+            ash.display.error("Original job template not found in cache. Cannot reuse the job.")
             return
 
+        # Survey answers come from the job's extra_vars, the survey spec is not needed here
         for var in template.get_asked_variables():
             if var in ['inventory', 'limit', 'job_tags', 'skip_tags']:
                 key, user_input = ash._ask_variable(var)
@@ -51,10 +60,96 @@ class JobHandler(BaseHandler):
         if ash.current_context.cancel():
             ash.display.print(f"Cancelled job with ID: {ash.current_context.id}", 'yellow')
         else:
-            ash.display.print("Failed to cancel the job.", 'red')
+            ash.display.error("Failed to cancel the job.")
 
     def output(self, args):
-        self.ash.current_context.print_stdout()
+        ash = self.ash
+        pager, args = self._pop_flag(args, '--pager')
+        if pager:
+            job = ash.current_context
+            Pager(stdout_source(job), lambda line: to_formatted_text(ANSI(line)),
+                  title=f"Output of job {job.id}", style=ash.style).run()
+            return
+        ash.current_context.print_stdout()
+
+    def durations(self, args):
+        ash = self.ash
+        job = ash.current_context
+        top = 10
+        if args and args[0]:
+            if not args[0].isdigit():
+                ash.display.print("Usage: durations [top_n]", 'yellow')
+                return
+            top = int(args[0])
+
+        profile = ash.cache.load_cache_item(JOB_PROFILES, job.id)
+        if profile is None:
+            ash.display.print(f"Retrieving events of job {job.id}...", 'yellow')
+            events = job.get_events(filters={'event__in': [','.join(PROFILED_EVENTS)]})
+            if events is None:
+                ash.display.error("Unable to retrieve job events.")
+                return
+            profile = JobProfile.from_events(job.id, events)
+            # Events of a finished job never change, so its profile is final
+            if job.finished:
+                ash.cache.insert_cache(JOB_PROFILES, job.id, profile)
+
+        if not profile.tasks:
+            ash.display.print("No task events found for this job.", 'yellow')
+            return
+
+        ash.display.print(f"Top {top} slowest tasks", 'headers')
+        ash.display.display_by_columns(profile.task_rows(top), ['task', 'role', 'hosts', 'duration', 'slowest_host'])
+        ash.display.print(f"\nTop {top} slowest roles", 'headers')
+        ash.display.display_by_columns(profile.role_rows(top), ['role', 'tasks', 'duration'])
+        ash.display.print(f"\nTop {top} slowest hosts", 'headers')
+        ash.display.display_by_columns(profile.host_rows(top), ['host', 'tasks', 'duration'])
+        ash.display.print(f"\nCritical path ({format_duration(profile.total_duration())})", 'headers')
+        ash.display.display_by_columns(profile.critical_path(), ['offset', 'task', 'host', 'duration'])
+
+    def hosts(self, args, output_format=None):
+        ash = self.ash
+        pager, args = self._pop_flag(args, '--pager')
+        statuses = [arg.lower() for arg in args if arg]
+        unknown = [status for status in statuses if status not in HOST_SUMMARY_STATUSES]
+        if unknown:
+            ash.display.error(f"Unknown host status: {', '.join(unknown)}. Valid statuses are: {', '.join(HOST_SUMMARY_STATUSES)}.")
+            return
+
+        if pager:
+            job = ash.current_context
+            filters = HOST_SUMMARY_FILTERS.get(frozenset(statuses)) if statuses else {}
+            if filters is None:
+                summaries = [summary for summary in job.get_host_summaries() or [] if summary.status in statuses]
+                source = list_source(summaries)
+            else:
+                source = api_source(ash.api, "job_host_summaries", baseuri=f"{job.uri}/job_host_summaries/",
+                                    order_by="host_name", filters=filters, factory=host_summary_from_data)
+            self._page_by_columns(source, HOST_SUMMARY_COLUMNS, f"Hosts of job {job.id}")
+            return
+
+        if output_format:
+            pages = ash.current_context.iter_host_summaries()
+            if statuses:
+                pages = ([summary for summary in page if summary.status in statuses] for page in pages)
+            ash.display.stream_by_columns(pages, HOST_SUMMARY_COLUMNS, output_format)
+            return
+
+        summaries = ash.current_context.get_host_summaries()
+        if summaries is None:
+            ash.display.error("Unable to retrieve host summaries.")
+            return
+        if statuses:
+            summaries = [summary for summary in summaries if summary.status in statuses]
+        if not summaries:
+            ash.display.print("No hosts found for this job.", 'yellow')
+            return
+
+        ash.display.display_host_summaries(summaries)
+        if statuses:
+            # Offered as the default limit of the next reuse or launch
+            ash.host_limit = ','.join(summary.host for summary in summaries)
+            ash.display.print(f"{len(summaries)} hosts, next 'reuse' or 'launch' will default limit to: {ash.host_limit}", 'yellow')
 
     def inventory(self, args):
         self.ash._cd_inventory([str(self.ash.current_context.inventory)])
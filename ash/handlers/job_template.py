@@ -3,6 +3,7 @@
 """Job template context command handler."""
 
 from .base import BaseHandler
+from ..display import JOB_COLUMNS
 
 
 class JobTemplateHandler(BaseHandler):
@@ -11,13 +12,14 @@ class JobTemplateHandler(BaseHandler):
     def launch(self, args):
         ash = self.ash
         payload = {}
+        form = self._launch_form(ash.current_context)
 
-        for var in ash.current_context.get_asked_variables():
+        for var in form.asked_variables:
             key, user_input = ash._ask_variable(var)
             payload[key] = user_input
 
         if ash.current_context.survey_enabled:
-            extra_vars = self._handle_survey(ash.current_context.get_survey_spec())
+            extra_vars = self._handle_survey(form.survey_spec)
             print(f"Extra vars from survey: {extra_vars}")
 
             if 'extra_vars' in payload and isinstance(payload['extra_vars'], dict):
@@ -29,6 +31,12 @@ class JobTemplateHandler(BaseHandler):
 
     def jobs(self, args):
         ash = self.ash
+        output_format, args = self._pop_output_format(args)
+        if args is None:
+            return
+        if output_format:
+            ash.display.stream_by_columns(ash.current_context.iter_jobs(), JOB_COLUMNS, output_format)
+            return
         jobs = ash.current_context.jobs()
         if jobs:
             ash.display.display_jobs(jobs)
@@ -1,21 +1,40 @@
 #!/usr/bin/env python
 
-"""Root-level command handlers: ls, cd, watch, cache."""
+"""Root-level command handlers: ls, cd, watch, cache, timing, stats, tasks, fg, kill, use."""
 
+import json
 import sys
-import time
 from os import get_terminal_size
+from types import SimpleNamespace
 
 from .base import BaseHandler
 from ..commands import (
     CD_COMMANDS, LS_COMMANDS, LS_JOB_TEMPLATE_FILTERS,
     LS_INVENTORIES_FILTERS, LS_PROJECTS_FILTERS, LS_JOBS_FILTERS,
 )
-from ..object_types import CACHED_OBJECT_TYPES
+from ..display import JOB_COLUMNS, JOB_TEMPLATE_COLUMNS, INVENTORY_COLUMNS, PROJECT_COLUMNS
+from ..object_types import CACHED_OBJECT_TYPES, INVENTORIES, JOB_TEMPLATES, JOBS, PROJECTS
+from ..federation import fan_out
+from .. import cancellation
+from ..models import ControllerRow
+from ..pager import api_source
+
+_LS_COLUMNS = {
+    JOB_TEMPLATES: JOB_TEMPLATE_COLUMNS,
+    JOBS: JOB_COLUMNS,
+    INVENTORIES: INVENTORY_COLUMNS,
+    PROJECTS: PROJECT_COLUMNS,
+}
+
+_LS_FILTERS = {
+    JOB_TEMPLATES: LS_JOB_TEMPLATE_FILTERS,
+    INVENTORIES: LS_INVENTORIES_FILTERS,
+    PROJECTS: LS_PROJECTS_FILTERS,
+}
 
 
 class RootHandler(BaseHandler):
-    """Handles ls, cd, watch, and cache commands."""
+    """Handles ls, cd, watch, cache, timing, stats, tasks, fg, kill and use commands."""
 
     # ------------------------------------------------------------------ #
     # ls
@@ -23,6 +42,10 @@ class RootHandler(BaseHandler):
 
     def ls(self, args):
         ash = self.ash
+        output_format, args = self._pop_output_format(args)
+        if args is None:
+            return
+        all_controllers, args = self._pop_flag(args, '--all-controllers')
         if len(args) == 0:
             ash.display.print("Usage: ls <object_type>", 'yellow')
             return
@@ -30,50 +53,143 @@ class RootHandler(BaseHandler):
         object_type = args[0]
 
         if object_type not in LS_COMMANDS.keys():
-            ash.display.print(f"Unknown object type: {object_type}", 'red')
+            ash.display.error(f"Unknown object type: {object_type}")
+            return
+
+        if all_controllers:
+            self._ls_all_controllers(object_type, args[1:], output_format)
             return
 
+        if object_type == JOBS:
+            pager, args = self._pop_flag(args, '--pager')
+            if pager:
+                self._page_jobs(args[1:])
+                return
+
         method = getattr(self, f'_ls_{object_type}', None)
-        method(args[1:])
+        method(args[1:], output_format)
 
-    def _ls_job_templates(self, args):
+    def _ls_job_templates(self, args, output_format=None):
         ash = self.ash
         if not ash.job_templates:
             ash.display.print("No job templates in cache. Try using 'cache' command.", 'yellow')
             return
 
         job_templates = ash.filter_objects(ash.job_templates, args, LS_JOB_TEMPLATE_FILTERS)
+        if output_format:
+            ash.display.stream_by_columns([job_templates], JOB_TEMPLATE_COLUMNS, output_format)
+            return
         ash.display.display_job_templates(job_templates)
 
-    def _ls_jobs(self, args):
+    def _ls_jobs(self, args, output_format=None):
         ash = self.ash
         filters, result_limit = self._parse_ls_jobs_args(args)
         if filters is None and result_limit is None:
             return
+        if output_format:
+            ash.display.stream_by_columns(ash.aap.iter_jobs(filters=filters, result_limit=result_limit), JOB_COLUMNS, output_format)
+            return
         jobs = ash.aap.get_jobs(filters=filters, result_limit=result_limit)
         if jobs:
             ash.display.display_jobs(jobs)
         else:
             ash.display.print("No jobs found.", 'yellow')
 
-    def _ls_inventories(self, args):
+    def _page_jobs(self, args):
+        ash = self.ash
+        filters, result_limit = self._parse_ls_jobs_args(args)
+        if filters is None and result_limit is None:
+            return
+        source = api_source(ash.api, JOBS, order_by="-finished", filters=filters, limit=result_limit)
+        self._page_by_columns(source, JOB_COLUMNS, 'Jobs ' + ' '.join(args))
+
+    def _ls_inventories(self, args, output_format=None):
         ash = self.ash
         if not ash.inventories:
             ash.display.print("No inventories in cache. Try using 'cache' command.", 'yellow')
             return
 
         inventories = ash.filter_objects(ash.inventories, args, LS_INVENTORIES_FILTERS)
+        if output_format:
+            ash.display.stream_by_columns([inventories], INVENTORY_COLUMNS, output_format)
+            return
         ash.display.display_inventories(inventories)
 
-    def _ls_projects(self, args):
+    def _ls_projects(self, args, output_format=None):
         ash = self.ash
         if not ash.projects:
             ash.display.print("No projects in cache. Try using 'cache' command.", 'yellow')
             return
 
         projects = ash.filter_objects(ash.projects, args, LS_PROJECTS_FILTERS)
+        if output_format:
+            ash.display.stream_by_columns([projects], PROJECT_COLUMNS, output_format)
+            return
         ash.display.display_projects(projects)
 
+    def _ls_all_controllers(self, object_type, args, output_format=None):
+        """List objects of every configured controller, merged with a controller column."""
+        ash = self.ash
+        columns = ['controller'] + _LS_COLUMNS[object_type]
+        if object_type == JOBS:
+            filters, result_limit = self._parse_ls_jobs_args(args)
+            if filters is None and result_limit is None:
+                return
+
+            def query(name, state):
+                return state['aap'].get_jobs(filters=filters, result_limit=result_limit)
+        else:
+            result_limit = None
+
+            def query(name, state):
+                return ash.filter_objects(ash.controller_objects(name, state, object_type), args, _LS_FILTERS[object_type])
+
+        streaming = output_format in ('jsonl', 'csv')
+        header = [True]
+
+        def on_result(name, objects):
+            if streaming:
+                # Rows are written as each controller answers
+                ash.display.stream_by_columns([[ControllerRow(name, obj) for obj in objects]], columns, output_format, header=header[0])
+                header[0] = False
+            else:
+                ash.display.print(f"{name}: {len(objects)} {object_type}", 'white')
+
+        results, failures = self._fan_out_controllers(query, on_result=on_result)
+        rows = self._merge_controller_rows(results, object_type, result_limit)
+        if output_format == 'json':
+            ash.display.stream_by_columns([rows], columns, output_format)
+        elif not streaming:
+            if rows:
+                ash.display.display_by_columns(rows, columns)
+            else:
+                ash.display.print(f"No {object_type} found.", 'yellow')
+        for name, reason in failures:
+            ash.display.error(f"{name}: {reason}, results are partial.")
+
+    def _fan_out_controllers(self, query, on_result=None):
+        """fan_out query to every configured controller, return (results, failures).
+
+        Controllers with an invalid configuration are failures, and so are
+        those that went offline on their own: their rows come from the cache."""
+        ash = self.ash
+        invalid = []
+        states = ash.controller_states(invalid)
+        results, failures = fan_out(states, query, on_result=on_result)
+        if not ash.force_offline:
+            failures += [(name, "offline, its rows come from the cache") for name, state in states
+                         if state.get('api') is not None and state['api'].offline]
+        return results, invalid + failures
+
+    def _merge_controller_rows(self, results, object_type, result_limit=None):
+        rows = [ControllerRow(name, obj) for name, objects in results for obj in objects]
+        if object_type == JOBS:
+            # Same order as a single controller, most recently finished last and running jobs at the end
+            rows.sort(key=lambda row: (row.finished is None, row.finished or ''))
+            if result_limit:
+                rows = rows[-result_limit:]
+        return rows
+
     def _parse_ls_jobs_args(self, args):
         ash = self.ash
         result_limit = 100
@@ -85,7 +201,7 @@ class RootHandler(BaseHandler):
                     try:
                         filter_value = int(filter_value)
                     except ValueError:
-                        ash.display.print("Invalid result_limit value. It should be an integer.", 'red')
+                        ash.display.error("Invalid result_limit value. It should be an integer.")
                         return None, None
                     result_limit = filter_value
                     continue
@@ -106,6 +222,19 @@ class RootHandler(BaseHandler):
 
     def watch(self, args):
         ash = self.ash
+        output_format, args = self._pop_output_format(args)
+        if args is None:
+            return
+        if output_format == 'json':
+            # A JSON array would never be closed, rows are emitted at every change
+            ash.display.error("watch streams the jobs as they change, use --format jsonl or csv.")
+            return
+        all_controllers, args = self._pop_flag(args, '--all-controllers')
+        columns = ['controller'] + JOB_COLUMNS if all_controllers else JOB_COLUMNS
+        if output_format:
+            self._watch_stream(args, output_format, self._fetch_all_controllers_jobs if all_controllers else None, columns)
+            return
+        fetch_jobs = self._fetch_all_controllers_jobs if all_controllers else self._fetch_jobs
         sys.stdout.write('\033[?25l')
         sys.stdout.flush()
         try:
@@ -115,19 +244,59 @@ class RootHandler(BaseHandler):
                 filters, _ = self._parse_ls_jobs_args(args)
                 if filters is None:
                     return
-                jobs = ash.aap.get_jobs(filters=filters, result_limit=result_limit)
+                jobs, failures = fetch_jobs(filters, result_limit)
                 # Move cursor to the beginning of the first line and clear to the end of the screen
                 sys.stdout.write('\033[H')  # Move cursor to the top-left corner
                 sys.stdout.write('\033[J')  # Clear from cursor to the end of the screen
                 sys.stdout.flush()
+                if failures:
+                    # Keep one line for every controller that did not answer
+                    jobs = jobs[max(0, len(jobs) - max(0, result_limit - len(failures))):]
                 if jobs:
-                    ash.display.display_jobs(jobs)
+                    ash.display.display_by_columns(jobs, columns)
+                for name, reason in failures:
+                    ash.display.error(f"{name}: {reason}")
                 self._render_watch_description(terminal_size, args)
-                time.sleep(5)
+                cancellation.sleep(5)
         finally:
             sys.stdout.write('\033[?25h')
             sys.stdout.flush()
 
+    def _fetch_jobs(self, filters, result_limit):
+        return self.ash.aap.get_jobs(filters=filters, result_limit=result_limit) or [], []
+
+    def _fetch_all_controllers_jobs(self, filters, result_limit):
+        """Return (rows, failures) with the most recent jobs of every controller."""
+        results, failures = self._fan_out_controllers(
+            lambda name, state: state['aap'].get_jobs(filters=filters, result_limit=result_limit))
+        return self._merge_controller_rows(results, JOBS, result_limit), failures
+
+    def _watch_stream(self, args, output_format, fetch_jobs=None, columns=JOB_COLUMNS):
+        """Emit the jobs whose status changed since the previous tick, without redrawing the screen."""
+        ash = self.ash
+        filters, result_limit = self._parse_ls_jobs_args(args)
+        if filters is None:
+            return
+        last_statuses = {}
+        header = True
+        while True:
+            if fetch_jobs is None:
+                pages = ash.aap.iter_jobs(filters=filters, result_limit=result_limit)
+            else:
+                jobs, failures = fetch_jobs(filters, result_limit)
+                pages = [jobs]
+            changed = []
+            for page in pages:
+                for job in page:
+                    key = (getattr(job, 'controller', None), job.id)
+                    if last_statuses.get(key) != job.status:
+                        last_statuses[key] = job.status
+                        changed.append(job)
+            if changed:
+                ash.display.stream_by_columns([changed], columns, output_format, header=header)
+                header = False
+            cancellation.sleep(5)
+
     def _render_watch_description(self, terminal_size, args):
         ash = self.ash
         description = getattr(ash, 'api_description', None)
@@ -168,19 +337,193 @@ class RootHandler(BaseHandler):
 
     def cache(self, args):
         ash = self.ash
+        if ash.api.offline:
+            ash.display.print("The cache cannot be refreshed offline, use 'offline off' first.", 'yellow')
+            return
         if args:
             valid_cache_types = ", ".join(CACHED_OBJECT_TYPES)
             if args[0] not in CACHED_OBJECT_TYPES:
-                ash.display.print(f"Unknown cache type: {args[0]}. Valid types are: {valid_cache_types}.", 'red')
+                ash.display.error(f"Unknown cache type: {args[0]}. Valid types are: {valid_cache_types}.")
                 return
             ash.cache.clean_cache(args[0])
+            if ash.daemon is not None:
+                # Refreshed once in ashd, for every shell
+                ash.api.shared_objects(args[0], refresh=True)
             method = getattr(ash, f'_load_{args[0]}_cache', None)
             method()
         else:
             ash.cache.clean_cache()
+            if ash.daemon is not None:
+                for object_type in CACHED_OBJECT_TYPES:
+                    ash.api.shared_objects(object_type, refresh=True)
             ash._load_all_caches()
         ash.display.print("Cache refreshed.", 'green')
 
+    # ------------------------------------------------------------------ #
+    # timing / stats
+    # ------------------------------------------------------------------ #
+
+    def timing(self, args):
+        ash = self.ash
+        if args and args[0] in ('on', 'off'):
+            ash.timing = args[0] == 'on'
+        elif args:
+            ash.display.print("Usage: timing [on|off]", 'yellow')
+            return
+        ash.display.print(f"Timing is {'on' if ash.timing else 'off'}.", 'green')
+
+    def stats(self, args):
+        ash = self.ash
+        if args and args[0] == 'reset':
+            ash.stats.reset()
+            ash.display.print("Statistics reset.", 'green')
+            return
+        if args and args[0] == 'json':
+            data = json.dumps(ash.stats.to_dict(), indent=4)
+            if len(args) > 1:
+                try:
+                    with open(args[1], 'w', encoding='utf-8') as f:
+                        f.write(data)
+                except OSError as e:
+                    ash.display.error(f"Unable to write statistics to {args[1]}: {e.strerror or e}.")
+                    return
+                ash.display.print(f"Statistics written to {args[1]}.", 'green')
+            else:
+                print(data)
+            return
+        if args:
+            ash.display.print("Usage: stats [json [file]|reset]", 'yellow')
+            return
+
+        data = ash.stats.to_dict()
+        totals = data['totals']
+        ash.display.print(f"Session: {data['duration_s']:.0f} s, {totals['requests']} requests "
+                          f"({totals['coalesced']} saved by coalescing, {totals['retries']} retried), {totals['pages']} pages, "
+                          f"{totals['bytes'] / 1024:.1f} KB, network {totals['network_ms']:.0f} ms, json {totals['json_ms']:.0f} ms, "
+                          f"render {totals['render_ms']:.0f} ms", 'white')
+        if data['endpoints']:
+            rows = []
+            for endpoint, stats in sorted(data['endpoints'].items(), key=lambda item: item[1]['total_ms'], reverse=True):
+                rows.append(SimpleNamespace(
+                    endpoint=endpoint, count=stats['count'], errors=stats['errors'],
+                    avg_ms=f"{stats['total_ms'] / stats['count']:.1f}", max_ms=f"{stats['max_ms']:.1f}",
+                    p95_ms=self._histogram_percentile(stats['histogram'], 0.95, data['latency_buckets_ms']),
+                    kb=f"{stats['bytes'] / 1024:.1f}",
+                ))
+            ash.display.display_by_columns(rows, ['endpoint', 'count', 'errors', 'avg_ms', 'p95_ms', 'max_ms', 'kb'])
+        if data['cache']:
+            rows = [SimpleNamespace(table=table, hits=stats['hits'], misses=stats['misses'], writes=stats['writes'],
+                                    ms=f"{stats['total_ms']:.1f}")
+                    for table, stats in sorted(data['cache'].items())]
+            ash.display.display_by_columns(rows, ['table', 'hits', 'misses', 'writes', 'ms'])
+
+    def _histogram_percentile(self, histogram, percentile, buckets):
+        """Return the upper bound of the bucket holding the given percentile, e.g. '<=250'."""
+        target = sum(histogram) * percentile
+        seen = 0
+        for index, count in enumerate(histogram):
+            seen += count
+            if count and seen >= target:
+                return f"<={buckets[index]}" if index < len(buckets) else f">{buckets[-1]}"
+        return '-'
+
+    # ------------------------------------------------------------------ #
+    # tasks / fg / kill
+    # ------------------------------------------------------------------ #
+
+    def tasks(self, args):
+        ash = self.ash
+        tasks = ash.task_manager.list()
+        if not tasks:
+            ash.display.print("No background tasks.", 'yellow')
+            return
+        rows = [SimpleNamespace(id=task.number, status=task.status, elapsed=f"{task.elapsed:.1f}s", command=task.command)
+                for task in tasks]
+        ash.display.display_by_columns(rows, ['id', 'status', 'elapsed', 'command'])
+        # Finished tasks are reported once, like the jobs of a Unix shell
+        ash.task_manager.forget_finished()
+
+    def _get_task(self, args, usage):
+        ash = self.ash
+        if len(args) != 1 or not args[0].lstrip('%').isdigit():
+            ash.display.print(f"Usage: {usage} <task id>", 'yellow')
+            return None
+        task = ash.task_manager.get(int(args[0].lstrip('%')))
+        if task is None:
+            ash.display.error(f"No task with id {args[0]}.")
+        return task
+
+    def fg(self, args):
+        ash = self.ash
+        task = self._get_task(args, 'fg')
+        if task is None:
+            return
+        ash.display.print(f"[{task.number}] {task.command}", 'white')
+        try:
+            task.wait()
+        except KeyboardInterrupt:
+            # Ctrl-C stops the task as it would have if it ran in the foreground
+            task.interrupt()
+            task.done.wait()
+
+    def kill(self, args):
+        ash = self.ash
+        task = self._get_task(args, 'kill')
+        if task is None:
+            return
+        if task.done.is_set():
+            ash.display.print(f"Task {task.number} already {task.status}.", 'yellow')
+            return
+        task.interrupt()
+        ash.display.print(f"Task {task.number} interrupted, it stops after its current request.", 'yellow')
+
+    # ------------------------------------------------------------------ #
+    # use
+    # ------------------------------------------------------------------ #
+
+    def use(self, args):
+        ash = self.ash
+        names = ash.config.names() if hasattr(ash.config, 'names') else [ash.controller_name]
+        if not args:
+            for name in names:
+                if name == ash.controller_name:
+                    ash.display.print(f"* {name}", 'green')
+                else:
+                    ash.display.print(f"  {name}{' (connected)' if name in ash.controllers else ''}", 'white')
+            return
+        name = ' '.join(args)
+        try:
+            used = ash.use_controller(name)
+        except ValueError as e:
+            ash.display.error(f"{name}: {e}")
+            return
+        if not used:
+            ash.display.error(f"No controller named '{name}' in the configuration.")
+            return
+        ash.display.print(f"Using {ash.controller_name} ({ash.api.base_url})", 'green')
+
+    # ------------------------------------------------------------------ #
+    # offline
+    # ------------------------------------------------------------------ #
+
+    def offline(self, args):
+        ash = self.ash
+        if len(args) > 1 or (args and args[0] not in ('on', 'off')):
+            ash.display.print("Usage: offline [on|off]", 'yellow')
+            return
+        if args and args[0] == 'on':
+            ash.api.go_offline()
+        elif args and args[0] == 'off' and ash.api.offline:
+            ash.api.offline = False
+            if not ash.api.ping():
+                ash.api.offline = True
+                ash.display.error(f"{ash.api.base_url} is still not reachable.")
+                return
+        if ash.api.offline:
+            ash.display.print("Offline, ls, cd, info and job output are served from the cache.", 'yellow')
+        else:
+            ash.display.print(f"Online, connected to {ash.api.base_url}.", 'green')
+
     # ------------------------------------------------------------------ #
     # cd
     # ------------------------------------------------------------------ #
@@ -195,15 +538,15 @@ class RootHandler(BaseHandler):
                 if ash.last_context:
                     ash._switch_context(ash.last_context, ash.last_context_type)
                 else:
-                    ash.display.print("No previous context to switch back to.", 'red')
+                    ash.display.error("No previous context to switch back to.")
             else:
-                ash.display.print("Usage: cd <object_type> <name_or_id>", 'red')
+                ash.display.error("Usage: cd <object_type> <name_or_id>")
             return
 
         object_type = args[0]
 
         if object_type not in CD_COMMANDS.keys():
-            ash.display.print(f"Unknown object type: {object_type}", 'red')
+            ash.display.error(f"Unknown object type: {object_type}")
             return
 
         method = getattr(ash, f'_cd_{object_type}', None)
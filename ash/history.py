@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+"""Command history of the shell, kept in SQLite with a size cap."""
+
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from prompt_toolkit.history import FileHistory, History, ThreadedHistory
+
+HISTORY_SIZE = 10000
+
+# Stores between two compactions, a compaction deletes what is over the cap
+COMPACT_EVERY = 100
+
+LEGACY_HISTORY_FILE = Path.home().joinpath(".ash_history")
+
+
+class SQLiteHistory(History):
+    """History with one row per distinct command, ordered by last use.
+
+    Running a command again moves it to the top instead of adding a line,
+    and only the max_entries most recently used commands are kept: the
+    table is compacted when it is opened over the cap and every
+    COMPACT_EVERY stores. The entries of ~/.ash_history are imported the
+    first time."""
+
+    def __init__(self, db_file, max_entries=HISTORY_SIZE, legacy_file=LEGACY_HISTORY_FILE):
+        super().__init__()
+        self.db_file = db_file
+        self.max_entries = max_entries
+        self.legacy_file = legacy_file
+        self._stores = 0
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_file)
+        if not self._initialized:
+            conn.execute('''CREATE TABLE IF NOT EXISTS history
+                            (command text primary key,
+                             last_used real,
+                             count integer default 1)''')
+            conn.execute('CREATE INDEX IF NOT EXISTS history_last_used ON history (last_used)')
+            count = conn.execute('SELECT count(*) FROM history').fetchone()[0]
+            if not count and os.path.exists(self.legacy_file):
+                self._import_legacy(conn)
+            elif count > self.max_entries:
+                # Sessions shorter than COMPACT_EVERY commands never compact while they run
+                self._compact(conn)
+            conn.commit()
+            self._initialized = True
+        return conn
+
+    def _import_legacy(self, conn):
+        # FileHistory yields the most recent first, older entries get older timestamps
+        now = time.time()
+        strings = list(FileHistory(str(self.legacy_file)).load_history_strings())
+        for offset, string in enumerate(reversed(strings)):
+            self._upsert(conn, string, now - len(strings) + offset)
+        self._compact(conn)
+
+    @staticmethod
+    def _upsert(conn, string, when):
+        conn.execute('''INSERT INTO history (command, last_used, count) VALUES (?, ?, 1)
+                        ON CONFLICT(command) DO UPDATE SET last_used = excluded.last_used, count = count + 1''',
+                     (string, when))
+
+    def _compact(self, conn):
+        conn.execute('''DELETE FROM history WHERE command NOT IN
+                        (SELECT command FROM history ORDER BY last_used DESC LIMIT ?)''', (self.max_entries,))
+
+    def load_history_strings(self):
+        with self._lock:
+            conn = self._connect()
+            try:
+                rows = conn.execute('SELECT command FROM history ORDER BY last_used DESC LIMIT ?',
+                                    (self.max_entries,)).fetchall()
+            finally:
+                conn.close()
+        for row in rows:
+            yield row[0]
+
+    def store_string(self, string):
+        if not string.strip():
+            return
+        with self._lock:
+            conn = self._connect()
+            try:
+                self._upsert(conn, string, time.time())
+                self._stores += 1
+                if self._stores % COMPACT_EVERY == 0:
+                    self._compact(conn)
+                conn.commit()
+            finally:
+                conn.close()
+
+
+def create_history(data_folder, max_entries=HISTORY_SIZE):
+    """Return the history of the prompt, loaded by a background thread on the first prompt."""
+    return ThreadedHistory(SQLiteHistory(str(Path(data_folder).joinpath('history.db')), max_entries=max_entries))
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+"""Task timing profile of a job, built from its runner job events."""
+
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timezone
+
+# Per-host task results carry the timings. Loop items are left out because the
+# task result of a loop already covers all of its items.
+PROFILED_EVENTS = (
+    'runner_on_ok',
+    'runner_on_failed',
+    'runner_on_skipped',
+    'runner_on_unreachable',
+    'runner_on_async_ok',
+    'runner_on_async_failed',
+)
+
+TaskRow = namedtuple('TaskRow', ['task', 'role', 'hosts', 'duration', 'slowest_host'])
+RoleRow = namedtuple('RoleRow', ['role', 'tasks', 'duration'])
+HostRow = namedtuple('HostRow', ['host', 'tasks', 'duration'])
+PathRow = namedtuple('PathRow', ['offset', 'task', 'host', 'duration'])
+
+
+def _parse_time(value):
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    # Runner timings are naive UTC while event 'created' is aware, keep them comparable
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def format_duration(seconds):
+    return f"{seconds:.2f}s"
+
+
+class JobProfile(object):
+    """Per-task, per-role and per-host durations of a job.
+
+    Only plain data is kept so that profiles of finished jobs can be pickled
+    into the local cache."""
+
+    def __init__(self, job_id, tasks):
+        self.job_id = job_id
+        # uuid -> {'name', 'role', 'start', 'end', 'hosts': {host: duration}}
+        self.tasks = tasks
+
+    @classmethod
+    def from_events(cls, job_id, events):
+        tasks = OrderedDict()
+        for event in events:
+            if event.get('event') not in PROFILED_EVENTS:
+                continue
+            event_data = event.get('event_data') or {}
+            key = event.get('parent_uuid') or event_data.get('task_uuid') or event.get('task')
+            start = _parse_time(event_data.get('start'))
+            end = _parse_time(event_data.get('end')) or _parse_time(event.get('created'))
+            duration = event_data.get('duration')
+            if duration is None:
+                duration = (end - start).total_seconds() if start and end else 0.0
+            if start is None:
+                start = end
+
+            task = tasks.get(key)
+            if task is None:
+                task = {
+                    'name': event.get('task') or event_data.get('task', ''),
+                    'role': event.get('role') or event_data.get('role', ''),
+                    'start': start,
+                    'end': end,
+                    'hosts': {},
+                }
+                tasks[key] = task
+            if start and (task['start'] is None or start < task['start']):
+                task['start'] = start
+            if end and (task['end'] is None or end > task['end']):
+                task['end'] = end
+            host = event.get('host_name') or event_data.get('host', '')
+            task['hosts'][host] = max(task['hosts'].get(host, 0.0), float(duration))
+        return cls(job_id, tasks)
+
+    def _wall_time(self, task):
+        if task['start'] and task['end']:
+            return max((task['end'] - task['start']).total_seconds(), max(task['hosts'].values(), default=0.0))
+        return max(task['hosts'].values(), default=0.0)
+
+    def task_rows(self, limit=None):
+        rows = []
+        for task in self.tasks.values():
+            slowest_host = max(task['hosts'].items(), key=lambda item: item[1], default=('', 0.0))[0]
+            rows.append((self._wall_time(task), TaskRow(task['name'], task['role'] or '-', len(task['hosts']), None, slowest_host)))
+        rows.sort(key=lambda row: row[0], reverse=True)
+        return [row._replace(duration=format_duration(wall)) for wall, row in rows[:limit]]
+
+    def role_rows(self, limit=None):
+        roles = {}
+        for task in self.tasks.values():
+            count, total = roles.get(task['role'] or '-', (0, 0.0))
+            roles[task['role'] or '-'] = (count + 1, total + self._wall_time(task))
+        ordered = sorted(roles.items(), key=lambda item: item[1][1], reverse=True)
+        return [RoleRow(role, count, format_duration(total)) for role, (count, total) in ordered[:limit]]
+
+    def host_rows(self, limit=None):
+        hosts = {}
+        for task in self.tasks.values():
+            for host, duration in task['hosts'].items():
+                count, total = hosts.get(host, (0, 0.0))
+                hosts[host] = (count + 1, total + duration)
+        ordered = sorted(hosts.items(), key=lambda item: item[1][1], reverse=True)
+        return [HostRow(host, count, format_duration(total)) for host, (count, total) in ordered[:limit]]
+
+    def critical_path(self):
+        """Return the chain of tasks in execution order with the host that gated each one.
+
+        Tasks run host-synchronised under the linear strategy, so the job wall
+        time is the sum of the slowest host of every task."""
+        ordered = sorted((task for task in self.tasks.values() if task['start']), key=lambda task: task['start'])
+        if not ordered:
+            return []
+        job_start = ordered[0]['start']
+        rows = []
+        for task in ordered:
+            host, duration = max(task['hosts'].items(), key=lambda item: item[1], default=('', 0.0))
+            offset = (task['start'] - job_start).total_seconds()
+            rows.append(PathRow(f"+{format_duration(offset)}", task['name'], host, format_duration(duration)))
+        return rows
+
+    def total_duration(self):
+        starts = [task['start'] for task in self.tasks.values() if task['start']]
+        ends = [task['end'] for task in self.tasks.values() if task['end']]
+        if not starts or not ends:
+            return 0.0
+        return (max(ends) - min(starts)).total_seconds()
@@ -4,22 +4,48 @@
 Application entry point
 """
 
-from .ash import Ash
-from .config import Config
-from .cache import Cache
 import argparse
+import sys
+
+def _read_batch_lines(args):
+    lines = list(args.execute or [])
+    if args.file:
+        if args.file == '-':
+            lines.extend(sys.stdin.read().splitlines())
+        else:
+            with open(args.file, 'r', encoding='utf-8') as f:
+                lines.extend(f.read().splitlines())
+    return lines
 
 def main():
     parser = argparse.ArgumentParser(prog='Ash', description='Ansible Shell for AAP')
     parser.add_argument('-c', '--config')
+    parser.add_argument('-d', '--description', help='Select the configuration with this description')
+    parser.add_argument('-e', '--execute', action='append', metavar='COMMAND',
+                        help='Run a command without starting the shell, can be repeated')
+    parser.add_argument('--offline', action='store_true',
+                        help='Work from the local cache without contacting the controller')
+    parser.add_argument('-f', '--file', help='Run the commands of a script file (- for stdin) without starting the shell')
     args = parser.parse_args()
 
+    # Imported after argument parsing so --help and usage errors stay fast
+    from .ash import Ash
+    from .config import Config
+    from .cache import Cache
+    from .daemon import DaemonClient
+
     config_file = args.config
 
-    config = Config(config_file)
+    config = Config(config_file, description=args.description)
     cache = Cache(config.base_url)
+    # Requests and indexes are shared through ashd when it runs
+    daemon = None if args.offline else DaemonClient.connect()
+
+    if args.execute or args.file:
+        ash = Ash(config, cache, interactive=False, daemon=daemon, offline=args.offline)
+        sys.exit(ash.run_batch(_read_batch_lines(args)))
 
-    ash = Ash(config, cache)
+    ash = Ash(config, cache, daemon=daemon, offline=args.offline)
     ash.run()
 
 if __name__ == '__main__':
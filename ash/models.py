@@ -2,9 +2,59 @@
 
 """Domain model classes for Ansible Automation Platform objects."""
 
-import time
+from collections import namedtuple
+from urllib.parse import urljoin
 
-import requests
+from .cancellation import sleep
+
+
+# Compact row of a job host summary, keeps memory low on jobs with thousands of hosts
+HostSummary = namedtuple('HostSummary', ['host', 'status', 'ok', 'changed', 'failures', 'unreachable', 'skipped'])
+
+HOST_SUMMARY_STATUSES = ('failed', 'unreachable', 'changed', 'ok')
+
+# Listing filters selecting the host summaries of a set of statuses, with the
+# precedence of host_summary_from_data. The controller sets failed when a host
+# is unreachable or has failures. Other sets are filtered after retrieval.
+HOST_SUMMARY_FILTERS = {
+    frozenset(['unreachable']): {'dark__gt': ['0']},
+    frozenset(['failed']): {'failed': ['true'], 'dark': ['0']},
+    frozenset(['changed']): {'failed': ['false'], 'changed__gt': ['0']},
+    frozenset(['ok']): {'failed': ['false'], 'changed': ['0']},
+    frozenset(['failed', 'unreachable']): {'failed': ['true']},
+    frozenset(['changed', 'ok']): {'failed': ['false']},
+    frozenset(HOST_SUMMARY_STATUSES): {},
+}
+
+# What the launch form of a job template needs, cached until the template is modified
+LaunchForm = namedtuple('LaunchForm', ['modified', 'asked_variables', 'survey_spec'])
+
+
+def host_summary_from_data(data):
+    if data.get('dark'):
+        status = 'unreachable'
+    elif data.get('failures') or data.get('failed'):
+        status = 'failed'
+    elif data.get('changed'):
+        status = 'changed'
+    else:
+        status = 'ok'
+    host_name = data.get('host_name') or data.get('summary_fields', {}).get('host', {}).get('name', '')
+    return HostSummary(host_name, status, data.get('ok', 0), data.get('changed', 0),
+                       data.get('failures', 0), data.get('dark', 0), data.get('skipped', 0))
+
+
+class ControllerRow(object):
+    """Object of one of several controllers, with the controller name as an extra column."""
+
+    __slots__ = ('controller', 'obj')
+
+    def __init__(self, controller, obj):
+        self.controller = controller
+        self.obj = obj
+
+    def __getattr__(self, name):
+        return getattr(self.obj, name)
 
 
 class BaseObject():
@@ -17,8 +67,14 @@ class BaseObject():
             setattr(self, k, v)
         self.data = data
 
-    def refresh(self):
-        response = self.api.get_request(self.uri)
+    def __getstate__(self):
+        # The API client holds a session, locks and statistics, it is re-attached when loaded from cache
+        state = self.__dict__.copy()
+        state.pop('api', None)
+        return state
+
+    def refresh(self, fresh=False):
+        response = self.api.get_request(self.uri, fresh=fresh)
 
         if response is None or response.status_code != 200:
             return
@@ -29,7 +85,7 @@ class JobTemplate(BaseObject):
     def __init__(self, api, data):
         super().__init__(api, data)
         self.uri = f"job_templates/{self.id}"
-        self.absolute_url = requests.compat.urljoin(self.api.base_url, f"execution/templates/job-template/{self.id}")
+        self.absolute_url = urljoin(self.api.base_url, f"execution/templates/job-template/{self.id}")
 
     def __str__(self):
         return f"JobTemplate(id={self.id}, name={self.name})"
@@ -39,11 +95,14 @@ class JobTemplate(BaseObject):
                                           order_by="-finished", result_limit=50)
         return jobs
 
+    def iter_jobs(self):
+        return self.api.iter_objects("jobs", baseuri=f"{self.uri}/jobs/", order_by="-finished", result_limit=50)
+
     def get_asked_variables(self):
         asked_vars = []
-        for attr in dir(self):
-            if attr.startswith('ask_') and getattr(self, attr) is True:
-                var = attr[4:].replace('_on_launch', '')
+        for key, value in sorted(self.data.items()):
+            if key.startswith('ask_') and value is True:
+                var = key[4:].replace('_on_launch', '')
                 if var == 'variables':
                     var = 'extra_vars'
                 elif var == 'tags':
@@ -76,7 +135,7 @@ class Inventory(BaseObject):
     def __init__(self, api, data):
         super().__init__(api, data)
         self.uri = f"inventories/{self.id}"
-        self.absolute_url = requests.compat.urljoin(self.api.base_url, f"execution/infrastructure/inventories/inventory/{self.id}/details")
+        self.absolute_url = urljoin(self.api.base_url, f"execution/infrastructure/inventories/inventory/{self.id}/details")
 
     def __str__(self):
         return f"Inventory(id={self.id}, name={self.name})"
@@ -84,6 +143,9 @@ class Inventory(BaseObject):
     def get_hosts(self):
         return self.api.retrieves_objects("hosts", baseuri=f"{self.uri}/hosts/", result_limit=0)
 
+    def iter_hosts(self):
+        return self.api.iter_objects("hosts", baseuri=f"{self.uri}/hosts/", result_limit=0)
+
     def add_hosts(self, hosts):
         results = {}
         for host in hosts:
@@ -96,6 +158,9 @@ class Inventory(BaseObject):
             result = self.api.post_request(f"{self.uri}/hosts/", payload)
             if result is None or result.status_code != 201:
                 self.api.log_error(result)
+                if self.api.offline:
+                    # Every write is refused offline, reported once
+                    break
             results[host] = result
         return results
 
@@ -112,6 +177,9 @@ class Inventory(BaseObject):
             else:
                 self.api.log_error(result)
                 results[host.name] = result
+            if self.api.offline:
+                # Every write is refused offline, reported once
+                break
         return results
 
 
@@ -119,7 +187,7 @@ class Host(BaseObject):
     def __init__(self, api, data):
         super().__init__(api, data)
         self.uri = f"inventory/{self.inventory}/hosts/{self.id}"
-        self.absolute_url = requests.compat.urljoin(self.api.base_url, f"execution/infrastructure/inventories/inventory/{self.inventory}/hosts/{self.id}/details")
+        self.absolute_url = urljoin(self.api.base_url, f"execution/infrastructure/inventories/inventory/{self.inventory}/hosts/{self.id}/details")
 
     def __str__(self):
         return f"Host(id={self.id}, name={self.name})"
@@ -129,7 +197,7 @@ class Project(BaseObject):
     def __init__(self, api, data):
         super().__init__(api, data)
         self.uri = f"projects/{self.id}"
-        self.absolute_url = requests.compat.urljoin(self.api.base_url, f"execution/projects/{self.id}/details")
+        self.absolute_url = urljoin(self.api.base_url, f"execution/projects/{self.id}/details")
 
     def __str__(self):
         return f"Project(id={self.id}, name={self.name})"
@@ -146,13 +214,14 @@ class Job(BaseObject):
     def __init__(self, api, data):
         super().__init__(api, data)
         self.uri = f"jobs/{self.id}"
-        self.absolute_url = requests.compat.urljoin(self.api.base_url, f"execution/jobs/playbook/{self.id}/output")
+        self.absolute_url = urljoin(self.api.base_url, f"execution/jobs/playbook/{self.id}/output")
 
     def __str__(self):
         return f"Job(id={self.id}, name={self.name}, status={self.status})"
 
     def print_stdout(self, follow=True):
-        if follow:
+        # Offline the kept output cannot grow, a job stored while running would be followed forever
+        if follow and not self.api.offline:
             start_line = 0
             while True:
                 self.refresh()
@@ -162,7 +231,7 @@ class Job(BaseObject):
                     print(stdout, end='')
                 if self.finished:
                     break
-                time.sleep(5)
+                sleep(5)
         else:
             stdout = self.get_stdout()
             if stdout is not None:
@@ -178,6 +247,36 @@ class Job(BaseObject):
 
         return response.json().get('content', '')
 
+    def get_events(self, filters=None, parallel=8):
+        return self.api.retrieves_data("job_events", baseuri=f"{self.uri}/job_events/", order_by="counter",
+                                       filters=filters, result_limit=0, parallel=parallel)
+
+    def get_host_summaries(self, parallel=8):
+        data = self.api.retrieves_data("job_host_summaries", baseuri=f"{self.uri}/job_host_summaries/",
+                                       order_by="host_name", result_limit=0, parallel=parallel)
+        if data is None:
+            return None
+        return [host_summary_from_data(item) for item in data]
+
+    def iter_host_summaries(self):
+        for page in self.api.iter_pages("job_host_summaries", baseuri=f"{self.uri}/job_host_summaries/",
+                                        order_by="host_name", result_limit=0):
+            yield [host_summary_from_data(item) for item in page]
+
+    def get_stdout_lines(self, start_line, end_line):
+        """Return (lines, total_line_count) for a range of the job output, or None on error."""
+        endpoint = f"{self.uri}/stdout/?format=json&start_line={start_line}&end_line={end_line}"
+
+        response = self.api.get_request(endpoint)
+
+        if response is None or response.status_code != 200:
+            return None
+
+        body = response.json()
+        lines = body.get('content', '').splitlines()
+        total = body.get('range', {}).get('absolute_end', start_line + len(lines))
+        return lines, total
+
     def relaunch(self):
         response = self.api.post_request(f"{self.uri}/relaunch/", {})
         if response is None or response.status_code != 201:
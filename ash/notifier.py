@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+"""Notifications when the jobs launched in a shell session finish."""
+
+import shlex
+import subprocess
+import threading
+from collections import OrderedDict
+
+from .tasks import console_session
+
+FINISHED_STATUSES = ('successful', 'failed', 'error', 'canceled')
+
+
+class JobNotifier(object):
+    """Daemon thread polling the jobs launched in this session.
+
+    All tracked jobs are checked with a single id__in listing per tick, so
+    the cost does not grow with the number of jobs. on_finished(job) is
+    called once for every job reaching a final state."""
+
+    def __init__(self, aap, on_finished, interval=5):
+        self.aap = aap
+        self.on_finished = on_finished
+        self.interval = interval
+        self.tracked = OrderedDict()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def track(self, job):
+        with self._lock:
+            self.tracked[job.id] = job
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='ash-job-notifier', daemon=True)
+                self._thread.start()
+
+    def untrack(self, job_id):
+        with self._lock:
+            self.tracked.pop(job_id, None)
+
+    def poll(self):
+        """Check the tracked jobs with one request, return the jobs that finished."""
+        with self._lock:
+            job_ids = list(self.tracked)
+        if not job_ids:
+            return []
+        jobs = self.aap.get_jobs(filters={'id__in': [','.join(str(job_id) for job_id in job_ids)]},
+                                 result_limit=len(job_ids))
+        finished = []
+        for job in jobs or []:
+            if job.status not in FINISHED_STATUSES:
+                continue
+            with self._lock:
+                if self.tracked.pop(job.id, None) is None:
+                    continue
+            finished.append(job)
+            self.on_finished(job)
+        return finished
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        with console_session():
+            while not self._stop.wait(self.interval):
+                with self._lock:
+                    if not self.tracked:
+                        self._thread = None
+                        return
+                try:
+                    self.poll()
+                except Exception:  # pylint: disable=broad-except
+                    # A failed tick is retried on the next one
+                    continue
+
+
+def run_notify_command(command, job):
+    """Run the notify_command of the config, e.g. notify-send "ash" "{name} {status}"."""
+    try:
+        arguments = [argument.format(id=job.id, name=job.name, status=job.status) for argument in shlex.split(command)]
+        subprocess.Popen(arguments, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)  # pylint: disable=consider-using-with
+    except (OSError, ValueError, KeyError, IndexError) as e:
+        print(f"notify_command failed: {e}")
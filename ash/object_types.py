@@ -7,5 +7,10 @@ JOBS = 'jobs'
 PROJECTS = 'projects'
 INVENTORIES = 'inventories'
 HOSTS = 'hosts'
+JOB_PROFILES = 'job_profiles'
+LAUNCH_FORMS = 'launch_forms'
 
-CACHED_OBJECT_TYPES = (JOB_TEMPLATES, PROJECTS, INVENTORIES)
\ No newline at end of file
+CACHED_OBJECT_TYPES = (JOB_TEMPLATES, PROJECTS, INVENTORIES)
+
+# Derived data cached per object id, not refreshed by the 'cache' command
+CACHED_DATA_TYPES = (JOB_PROFILES, LAUNCH_FORMS)
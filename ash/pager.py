@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+
+"""Full-screen pager that only fetches and draws the rows in view."""
+
+from collections import OrderedDict
+
+from prompt_toolkit.application import Application
+from prompt_toolkit.buffer import Buffer
+from prompt_toolkit.key_binding import KeyBindings
+from prompt_toolkit.layout import HSplit, Layout, Window, ConditionalContainer
+from prompt_toolkit.layout.controls import BufferControl, FormattedTextControl, UIContent, UIControl
+from prompt_toolkit.filters import Condition
+
+
+class PagedSource(object):
+    """Random access to the rows of a paginated endpoint.
+
+    fetch_page(number) returns (rows, count) for a 1-based page number, or None
+    on error. Only the last max_pages pages are kept in memory."""
+
+    def __init__(self, fetch_page, page_size, limit=None, max_pages=8):
+        self.fetch_page = fetch_page
+        self.page_size = page_size
+        self.limit = limit
+        self.max_pages = max_pages
+        self.count = None
+        self._pages = OrderedDict()
+
+    def _page(self, number):
+        if number in self._pages:
+            self._pages.move_to_end(number)
+            return self._pages[number]
+        result = self.fetch_page(number)
+        if result is None:
+            rows, count = [], self.count or 0
+        else:
+            rows, count = result
+        self.count = min(count, self.limit) if self.limit else count
+        self._pages[number] = rows
+        while len(self._pages) > self.max_pages:
+            self._pages.popitem(last=False)
+        return rows
+
+    def __len__(self):
+        if self.count is None:
+            self._page(1)
+        return self.count
+
+    def get(self, index):
+        if index < 0 or index >= len(self):
+            return None
+        rows = self._page(index // self.page_size + 1)
+        offset = index % self.page_size
+        return rows[offset] if offset < len(rows) else None
+
+
+def api_source(api, object_type, baseuri=None, order_by=None, filters=None, limit=None, factory=None, page_size=100):
+    """PagedSource over a listing endpoint, rows are built with factory or the API object factories."""
+    def fetch_page(number):
+        result = api.retrieves_page(object_type, number, page_size=page_size, order_by=order_by,
+                                    baseuri=baseuri, filters=filters)
+        if result is None:
+            return None
+        data, count = result
+        if factory:
+            return [factory(item) for item in data], count
+        return [api.instantiate_object(object_type, item) for item in data], count
+    return PagedSource(fetch_page, page_size, limit=limit)
+
+
+def list_source(rows, page_size=100):
+    """PagedSource over rows already in memory."""
+    def fetch_page(number):
+        start = (number - 1) * page_size
+        return rows[start:start + page_size], len(rows)
+    return PagedSource(fetch_page, page_size, max_pages=len(rows) // page_size + 1)
+
+
+def stdout_source(job, page_size=500):
+    """PagedSource over the output lines of a job."""
+    def fetch_page(number):
+        start = (number - 1) * page_size
+        return job.get_stdout_lines(start, start + page_size)
+    return PagedSource(fetch_page, page_size)
+
+
+class _RowsControl(UIControl):
+    def __init__(self, pager):
+        self.pager = pager
+
+    def create_content(self, width, height):
+        pager = self.pager
+        pager.height = height
+
+        def get_line(i):
+            index = pager.top + i
+            row = pager.source.get(index)
+            if row is None:
+                return [('', '~')] if index >= len(pager.source) else []
+            fragments = pager.render_row(row)
+            if index == pager.match:
+                return [(f'{style} reverse', text) for style, text in fragments]
+            return fragments
+
+        return UIContent(get_line=get_line, line_count=height, show_cursor=False)
+
+    def is_focusable(self):
+        return True
+
+
+class Pager(object):
+    """Scrollable view over a PagedSource.
+
+    Keys: arrows/j/k, PageUp/PageDown/space, g/G, '/' search, n/N next and
+    previous match, ':' jump to row, q to quit. While the search text is
+    typed only the rows on screen are matched, Enter searches the rest."""
+
+    def __init__(self, source, render_row, header=None, title='', style=None):
+        self.source = source
+        self.render_row = render_row
+        self.header = header or []
+        self.title = title
+        self.top = 0
+        self.height = 1
+        self.match = None
+        self.mode = None
+        self.search_text = ''
+        self.search_origin = 0
+        self.input = Buffer(multiline=False, on_text_changed=self._on_input_changed, accept_handler=self._on_input_accepted)
+        self.app = Application(layout=self._create_layout(), key_bindings=self._create_key_bindings(),
+                               style=style, full_screen=True)
+
+    def run(self):
+        self.app.run()
+
+    # Layout
+
+    def _create_layout(self):
+        self.rows_window = Window(_RowsControl(self))
+        self.input_window = Window(BufferControl(self.input), height=1)
+        body = [
+            Window(FormattedTextControl(lambda: self.header), height=1),
+            self.rows_window,
+            ConditionalContainer(self.input_window, filter=Condition(lambda: self.mode is not None)),
+            Window(FormattedTextControl(self._status), height=1, style='reverse'),
+        ]
+        return Layout(HSplit(body), focused_element=self.rows_window)
+
+    def _status(self):
+        count = len(self.source)
+        last = min(self.top + self.height, count)
+        prompt = {'search': '/', 'jump': ':'}.get(self.mode, '')
+        hint = f"{prompt} " if prompt else ''
+        return [('', f" {hint}{self.title}  rows {self.top + 1 if count else 0}-{last} of {count}  (/ search, n/N next/prev, : jump, q quit)")]
+
+    # Movement
+
+    def scroll_to(self, top):
+        self.top = max(0, min(top, max(0, len(self.source) - self.height)))
+
+    def find(self, text, start, backwards=False, limit=None):
+        """Return the index of the next row containing text, scanning at most limit rows from start."""
+        if not text:
+            return None
+        text = text.lower()
+        count = len(self.source)
+        indexes = range(start, -1, -1) if backwards else range(start, count)
+        if limit is not None:
+            indexes = indexes[:limit]
+        for index in indexes:
+            row = self.source.get(index)
+            if row is not None and text in ''.join(fragment[1] for fragment in self.render_row(row)).lower():
+                return index
+        return None
+
+    def _show_match(self, index):
+        self.match = index
+        if index is not None and not self.top <= index < self.top + self.height:
+            self.scroll_to(index - self.height // 2)
+
+    # Search and jump input
+
+    def _on_input_changed(self, buffer):
+        if self.mode == 'search':
+            # Every key press would scan, and fetch, the whole source, the rows on screen are already loaded
+            self.search_text = buffer.text
+            self.match = self.find(self.search_text, self.search_origin, limit=self.height)
+
+    def _on_input_accepted(self, buffer):
+        if self.mode == 'search':
+            self._show_match(self.find(self.search_text, self.search_origin))
+        elif self.mode == 'jump' and buffer.text.strip().isdigit():
+            row = int(buffer.text.strip()) - 1
+            self.scroll_to(row)
+            self.match = row
+        self._leave_input()
+        return False
+
+    def _enter_input(self, mode):
+        self.mode = mode
+        self.search_origin = self.top
+        self.input.reset()
+        self.app.layout.focus(self.input_window)
+
+    def _leave_input(self):
+        self.mode = None
+        self.app.layout.focus(self.rows_window)
+
+    def _create_key_bindings(self):
+        kb = KeyBindings()
+        browsing = Condition(lambda: self.mode is None)
+
+        @kb.add('q', filter=browsing)
+        @kb.add('c-c')
+        def _quit(event):
+            event.app.exit()
+
+        @kb.add('down', filter=browsing)
+        @kb.add('j', filter=browsing)
+        def _down(event):
+            self.scroll_to(self.top + 1)
+
+        @kb.add('up', filter=browsing)
+        @kb.add('k', filter=browsing)
+        def _up(event):
+            self.scroll_to(self.top - 1)
+
+        @kb.add('pagedown', filter=browsing)
+        @kb.add('space', filter=browsing)
+        def _page_down(event):
+            self.scroll_to(self.top + self.height)
+
+        @kb.add('pageup', filter=browsing)
+        def _page_up(event):
+            self.scroll_to(self.top - self.height)
+
+        @kb.add('g', filter=browsing)
+        @kb.add('home', filter=browsing)
+        def _home(event):
+            self.scroll_to(0)
+
+        @kb.add('G', filter=browsing)
+        @kb.add('end', filter=browsing)
+        def _end(event):
+            self.scroll_to(len(self.source))
+
+        @kb.add('/', filter=browsing)
+        def _search(event):
+            self._enter_input('search')
+
+        @kb.add(':', filter=browsing)
+        def _jump(event):
+            self._enter_input('jump')
+
+        @kb.add('n', filter=browsing)
+        def _next(event):
+            start = self.match + 1 if self.match is not None else self.top
+            self._show_match(self.find(self.search_text, start))
+
+        @kb.add('N', filter=browsing)
+        def _previous(event):
+            start = self.match - 1 if self.match is not None else self.top
+            self._show_match(self.find(self.search_text, start, backwards=True))
+
+        @kb.add('escape', filter=~browsing)
+        def _cancel(event):
+            if self.mode == 'search':
+                self.scroll_to(self.search_origin)
+                self.match = None
+            self._leave_input()
+
+        return kb
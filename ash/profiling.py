@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+"""Profiling of command dispatch, with cProfile or pyinstrument when installed."""
+
+import cProfile
+import importlib.util
+import io
+import pstats
+import sys
+
+
+def sampler_available():
+    return importlib.util.find_spec('pyinstrument') is not None
+
+
+class CommandProfiler(object):
+    """Context manager profiling the code run inside it.
+
+    cProfile is used by default. With sample=True and pyinstrument installed a
+    sampling profiler is used instead, which has a much lower overhead."""
+
+    def __init__(self, sample=False):
+        self.sample = sample and sampler_available()
+        if self.sample:
+            from pyinstrument import Profiler
+            self._profiler = Profiler()
+        else:
+            self._profiler = cProfile.Profile()
+
+    def __enter__(self):
+        if self.sample:
+            self._profiler.start()
+        else:
+            self._profiler.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.sample:
+            self._profiler.stop()
+        else:
+            self._profiler.disable()
+        return False
+
+    def report(self, top=25, out=None):
+        """Write the functions with the highest cumulative time."""
+        out = out or sys.stdout
+        if self.sample:
+            out.write(self._profiler.output_text(unicode=True, color=False))
+            return
+        buffer = io.StringIO()
+        pstats.Stats(self._profiler, stream=buffer).sort_stats('cumulative').print_stats(top)
+        out.write(buffer.getvalue())
+
+    def dump(self, path):
+        """Write a .prof file (snakeviz, flameprof) or, when sampling, a speedscope JSON file."""
+        if self.sample:
+            from pyinstrument.renderers import SpeedscopeRenderer
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(self._profiler.output(SpeedscopeRenderer()))
+        else:
+            self._profiler.dump_stats(path)
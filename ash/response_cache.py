@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+"""In memory cache of the GET responses of a session."""
+
+import threading
+import time
+from collections import OrderedDict
+
+from .stats import normalize_endpoint
+
+# Seconds a response stays valid by endpoint shape, endpoints not listed are never cached.
+# Jobs and listings change under the user's eyes, the objects navigated with cd do not.
+RESPONSE_TTLS = {
+    'job_templates/{id}': 30,
+    'job_templates/{id}/survey_spec': 300,
+    'inventories/{id}': 30,
+    'projects/{id}': 30,
+}
+
+
+def _object_prefix(endpoint):
+    """Return 'job_templates/5/' for any endpoint under job template 5, None for listings."""
+    parts = [part for part in endpoint.split('?', 1)[0].split('/') if part]
+    if len(parts) < 2 or not parts[1].isdigit():
+        return None
+    return f"{parts[0]}/{parts[1]}/"
+
+
+class ResponseCache(object):
+    """TTL and LRU cache of GET responses, bounded by entry count and bytes.
+
+    Writes to an object drop every cached response under its URI."""
+
+    def __init__(self, max_entries=256, max_bytes=8 * 1024 * 1024, ttls=None, default_ttl=0, stats=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttls = RESPONSE_TTLS if ttls is None else ttls
+        # TTL of the endpoints not in ttls, 0 leaves them out
+        self.default_ttl = default_ttl
+        self.stats = stats
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def ttl(self, endpoint):
+        return self.ttls.get(normalize_endpoint(endpoint).rstrip('/'), self.default_ttl)
+
+    def get(self, endpoint):
+        started = time.perf_counter()
+        with self._lock:
+            entry = self._entries.get(endpoint)
+            if entry is not None and entry[0] <= time.monotonic():
+                self._remove(endpoint)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(endpoint)
+        if self.stats is not None and self.ttl(endpoint):
+            self.stats.record_cache('responses', time.perf_counter() - started, hit=entry is not None)
+        return entry[1] if entry is not None else None
+
+    def put(self, endpoint, response):
+        ttl = self.ttl(endpoint)
+        if not ttl or response is None or response.status_code != 200:
+            return
+        size = len(response.content)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(endpoint)
+            self._entries[endpoint] = (time.monotonic() + ttl, response, size)
+            self.size += size
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, endpoint):
+        """Drop the responses of the object a POST or DELETE endpoint belongs to."""
+        prefix = _object_prefix(endpoint)
+        if prefix is None:
+            return
+        with self._lock:
+            for key in [key for key in self._entries if key.rstrip('/') + '/' == prefix or key.startswith(prefix)]:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _remove(self, endpoint):
+        entry = self._entries.pop(endpoint, None)
+        if entry is not None:
+            self.size -= entry[2]
+
+    def __len__(self):
+        return len(self._entries)
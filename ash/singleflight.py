@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+"""Share one call between the threads asking for the same thing at the same time."""
+
+import threading
+
+
+class _Call(object):
+    __slots__ = ('done', 'result', 'error', 'interrupted')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.interrupted = False
+
+
+class SingleFlight(object):
+    """Concurrent do(key, function) calls with the same key run function once.
+
+    The first caller runs it, the others wait and get the same result, or
+    the same exception. saved counts the calls that did not run."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.saved = 0
+
+    def do(self, key, function):
+        """Return (result, shared), shared is True when the result came from another caller."""
+        with self._lock:
+            pending = self._calls.get(key)
+            leader = pending is None
+            if leader:
+                pending = self._calls[key] = _Call()
+            else:
+                self.saved += 1
+        if not leader:
+            pending.done.wait()
+            if pending.interrupted:
+                # The caller that ran it was killed, that is not a reason to fail the others
+                with self._lock:
+                    self.saved -= 1
+                return self.do(key, function)
+            if pending.error is not None:
+                raise pending.error
+            return pending.result, True
+
+        try:
+            pending.result = function()
+        except Exception as e:
+            pending.error = e
+            raise
+        except BaseException:
+            pending.interrupted = True
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            pending.done.set()
+        return pending.result, False
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+
+"""Session statistics on API requests, cache access and rendering."""
+
+import re
+import threading
+import time
+
+# Upper bounds in milliseconds of the latency histogram buckets, the last bucket is open
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_ID_RE = re.compile(r'/\d+(?=/|$)')
+
+
+def normalize_endpoint(endpoint):
+    """Group endpoints by shape, e.g. 'jobs/42/stdout/?format=json' -> 'jobs/{id}/stdout/'."""
+    path = endpoint.split('?', 1)[0]
+    if not path.startswith('/'):
+        path = '/' + path
+    return _ID_RE.sub('/{id}', path).lstrip('/')
+
+
+class Stats(object):
+    """Thread safe counters shared by the API, the cache and the display of a session."""
+
+    # Totals used to compute the per-command breakdown
+    TOTALS = ('requests', 'network_ms', 'bytes', 'pages', 'json_ms', 'cache_ms', 'cache_hits', 'cache_misses', 'render_ms',
+              'coalesced', 'retries', 'errors')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.endpoints = {}
+            self.cache_tables = {}
+            self.coalesced = {}
+            self.totals = dict.fromkeys(self.TOTALS, 0)
+
+    def record_request(self, method, endpoint, elapsed, size=0, status=None):
+        key = f"{method} {normalize_endpoint(endpoint)}"
+        elapsed_ms = elapsed * 1000
+        bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS_MS) if elapsed_ms <= bound), len(LATENCY_BUCKETS_MS))
+        with self._lock:
+            stats = self.endpoints.get(key)
+            if stats is None:
+                stats = {'count': 0, 'errors': 0, 'bytes': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                         'histogram': [0] * (len(LATENCY_BUCKETS_MS) + 1)}
+                self.endpoints[key] = stats
+            stats['count'] += 1
+            stats['bytes'] += size
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+            stats['histogram'][bucket] += 1
+            if status is None or status >= 400:
+                stats['errors'] += 1
+            self.totals['requests'] += 1
+            self.totals['network_ms'] += elapsed_ms
+            self.totals['bytes'] += size
+            if 'page_size=' in endpoint or 'page=' in endpoint:
+                self.totals['pages'] += 1
+
+    def record_coalesced(self, method, endpoint):
+        """Record a request saved by sharing an identical one already in flight."""
+        key = f"{method} {normalize_endpoint(endpoint)}"
+        with self._lock:
+            self.coalesced[key] = self.coalesced.get(key, 0) + 1
+            self.totals['coalesced'] += 1
+
+    def record_retry(self, method, endpoint):
+        """Record a request sent again after an error or a refusal of the controller."""
+        key = f"{method} {normalize_endpoint(endpoint)}"
+        with self._lock:
+            stats = self.endpoints.get(key)
+            if stats is not None:
+                stats['retries'] = stats.get('retries', 0) + 1
+            self.totals['retries'] += 1
+
+    def record_error(self):
+        """Record an error reported to the user, batch runs exit with a failure status when there is one."""
+        with self._lock:
+            self.totals['errors'] += 1
+
+    def record_json(self, elapsed):
+        with self._lock:
+            self.totals['json_ms'] += elapsed * 1000
+
+    def record_cache(self, table, elapsed, hit=None):
+        """Record a cache access, hit is None for writes."""
+        with self._lock:
+            stats = self.cache_tables.setdefault(table, {'hits': 0, 'misses': 0, 'writes': 0, 'total_ms': 0.0})
+            stats['total_ms'] += elapsed * 1000
+            self.totals['cache_ms'] += elapsed * 1000
+            if hit is None:
+                stats['writes'] += 1
+            elif hit:
+                stats['hits'] += 1
+                self.totals['cache_hits'] += 1
+            else:
+                stats['misses'] += 1
+                self.totals['cache_misses'] += 1
+
+    def record_render(self, elapsed):
+        with self._lock:
+            self.totals['render_ms'] += elapsed * 1000
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.totals)
+
+    def delta(self, since):
+        current = self.snapshot()
+        return {key: current[key] - since.get(key, 0) for key in self.TOTALS}
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'duration_s': round(time.time() - self.started, 3),
+                'latency_buckets_ms': list(LATENCY_BUCKETS_MS),
+                'totals': dict(self.totals),
+                'endpoints': {key: dict(value, histogram=list(value['histogram'])) for key, value in self.endpoints.items()},
+                'cache': {key: dict(value) for key, value in self.cache_tables.items()},
+                'coalesced': dict(self.coalesced),
+            }
+
+
+def format_breakdown(command, wall_ms, delta):
+    """One line summary of where the time of a command went."""
+    accounted = delta['network_ms'] + delta['json_ms'] + delta['cache_ms'] + delta['render_ms']
+    return (f"{command}: {wall_ms:.1f} ms"
+            f" | network {delta['network_ms']:.1f} ms ({delta['requests']} requests, {delta['pages']} pages, {delta['bytes'] / 1024:.1f} KB)"
+            f" | json {delta['json_ms']:.1f} ms"
+            f" | cache {delta['cache_ms']:.1f} ms ({delta['cache_hits']} hits, {delta['cache_misses']} misses)"
+            f" | render {delta['render_ms']:.1f} ms"
+            f" | other {max(0.0, wall_ms - accounted):.1f} ms")
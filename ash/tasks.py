@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+
+"""Commands running in worker threads, in the foreground or in the background."""
+
+import shutil
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from prompt_toolkit.application import create_app_session
+from prompt_toolkit.data_structures import Size
+from prompt_toolkit.output.vt100 import Vt100_Output
+
+from .cancellation import check_cancelled, set_cancel_event
+
+
+class _ConsoleWriter(object):
+    """File object writing to whatever sys.stdout is at the time of the write.
+
+    While the prompt is shown sys.stdout is the patch_stdout proxy, which
+    prints above the prompt instead of over it."""
+
+    encoding = 'utf-8'
+
+    def write(self, data):
+        return sys.stdout.write(data)
+
+    def flush(self):
+        sys.stdout.flush()
+
+    def isatty(self):
+        return True
+
+
+def _terminal_size():
+    columns, lines = shutil.get_terminal_size()
+    return Size(rows=lines, columns=columns)
+
+
+def console_session():
+    """App session for threads printing while the prompt may be shown.
+
+    Styled output goes through sys.stdout, so it is printed above the prompt."""
+    return create_app_session(output=Vt100_Output(_ConsoleWriter(), _terminal_size))
+
+
+class Task(object):
+    """A command line run by function in its own thread."""
+
+    def __init__(self, number, command, function, background=False, on_done=None):
+        self.number = number
+        self.command = command
+        self.function = function
+        self.background = background
+        self.on_done = on_done
+        self.status = 'running'
+        self.result = None
+        self.error = None
+        self.started = None
+        self.finished = None
+        self.done = threading.Event()
+        # Set by interrupt, the command stops at its next page, request or poll
+        self.cancelled = threading.Event()
+        self.thread = threading.Thread(target=self._run, name=f'ash-task-{number}', daemon=True)
+
+    def start(self):
+        self.started = time.time()
+        self.thread.start()
+        return self
+
+    def _run(self):
+        if self.background:
+            with console_session():
+                self._call()
+        else:
+            self._call()
+
+    def _call(self):
+        set_cancel_event(self.cancelled)
+        try:
+            self.result = self.function()
+        except KeyboardInterrupt:
+            self.status = 'killed'
+        except Exception as e:
+            self.error = e
+            self.status = 'failed'
+        else:
+            if self.status == 'running':
+                self.status = 'done'
+        finally:
+            set_cancel_event(None)
+            self.finished = time.time()
+            # The done notice is part of the task, wait() returns after it is printed
+            try:
+                if self.on_done:
+                    self.on_done(self)
+            finally:
+                self.done.set()
+
+    def interrupt(self):
+        """Stop the command as Ctrl-C would in the foreground, at its next page, request or poll."""
+        if self.done.is_set():
+            return False
+        if self.status == 'running':
+            self.status = 'killed'
+        self.cancelled.set()
+        return True
+
+    def wait(self, poll_interval=0.1):
+        """Block until the command finishes.
+
+        The short polling keeps the waiting thread responsive to KeyboardInterrupt,
+        and to a kill of the task it runs in, e.g. Ctrl-C on 'fg'."""
+        while not self.done.wait(poll_interval):
+            check_cancelled()
+        return self.result
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+
+class TaskManager(object):
+    """Numbered background tasks of a shell session, like the jobs of a Unix shell."""
+
+    def __init__(self, on_done=None):
+        self._lock = threading.Lock()
+        self._next_number = 1
+        self.tasks = OrderedDict()
+        self.on_done = on_done
+
+    def start(self, command, function):
+        with self._lock:
+            number = self._next_number
+            self._next_number += 1
+            task = Task(number, command, function, background=True, on_done=self.on_done)
+            self.tasks[number] = task
+        return task.start()
+
+    def get(self, number):
+        with self._lock:
+            return self.tasks.get(number)
+
+    def list(self):
+        with self._lock:
+            return list(self.tasks.values())
+
+    def forget_finished(self):
+        with self._lock:
+            for number in [number for number, task in self.tasks.items() if task.done.is_set()]:
+                del self.tasks[number]
+
+    def running(self):
+        return [task for task in self.list() if not task.done.is_set()]
+
+    def wait_all(self):
+        for task in self.running():
+            task.wait()
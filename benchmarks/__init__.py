@@ -0,0 +1 @@
+"""Benchmarks for ash, run them as modules e.g. python -m benchmarks.display"""
@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+
+"""Synthetic AAP payloads at production scale.
+
+Every generator is lazy so that a million jobs never have to be held in
+memory at once. Object ids start at 1 and references between object types
+always point at existing objects of the same scale.
+
+Usage: python -m benchmarks.datasets [scale]
+"""
+
+import sys
+import time
+
+# Object counts of a large controller, scaled down with scaled_sizes()
+FULL_SCALE = {
+    'organizations': 50,
+    'projects': 2000,
+    'inventories': 5000,
+    'hosts': 100000,
+    'job_templates': 20000,
+    'jobs': 1000000,
+}
+
+STATUSES = ('successful', 'successful', 'successful', 'failed', 'running', 'canceled', 'pending', 'error')
+PLAYBOOKS = ('site.yml', 'deploy.yml', 'patch.yml', 'backup.yml', 'restart.yml', 'provision.yml')
+BRANCHES = ('main', 'develop', 'release/2.4', 'hotfix/1234')
+TEAMS = ('web', 'db', 'payments', 'search', 'platform', 'identity', 'storage', 'network')
+
+# Fixed origin keeps generated datasets identical between runs
+_EPOCH = 1704067200
+
+
+def scaled_sizes(scale=1.0):
+    """Return FULL_SCALE multiplied by scale, with at least one object of each type."""
+    return {name: max(1, int(count * scale)) for name, count in FULL_SCALE.items()}
+
+
+def timestamp(offset):
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(_EPOCH + offset)) + f".{offset % 1000000:06d}Z"
+
+
+def _ref(object_id, name, **extra):
+    return dict({'id': object_id, 'name': name}, **extra)
+
+
+def _user(index):
+    return {'id': index % 40 + 1, 'username': f'user{index % 40 + 1}', 'first_name': '', 'last_name': ''}
+
+
+def _organization(index, sizes):
+    organization_id = index % sizes['organizations'] + 1
+    return _ref(organization_id, f'org-{organization_id}', description='')
+
+
+def _team(index):
+    return TEAMS[index % len(TEAMS)]
+
+
+def project_name(project_id):
+    return f'{_team(project_id)}-project-{project_id}'
+
+
+def inventory_name(inventory_id):
+    return f'{_team(inventory_id)}-inventory-{inventory_id}'
+
+
+def job_template_name(job_template_id):
+    return f'{_team(job_template_id)} {PLAYBOOKS[job_template_id % len(PLAYBOOKS)][:-4]} {job_template_id}'
+
+
+def host_name(host_id):
+    return f'{_team(host_id)}{host_id:06d}.dc{host_id % 4 + 1}.example.com'
+
+
+def iter_projects(sizes):
+    for project_id in range(1, sizes['projects'] + 1):
+        yield {
+            'id': project_id,
+            'type': 'project',
+            'url': f'/api/controller/v2/projects/{project_id}/',
+            'name': project_name(project_id),
+            'description': f'Playbooks of the {_team(project_id)} team',
+            'scm_type': 'git',
+            'scm_url': f'https://git.example.com/{_team(project_id)}/project-{project_id}.git',
+            'scm_branch': BRANCHES[project_id % len(BRANCHES)],
+            'status': STATUSES[project_id % 4],
+            'created': timestamp(project_id),
+            'modified': timestamp(project_id * 7),
+            'summary_fields': {
+                'organization': _organization(project_id, sizes),
+                'created_by': _user(project_id),
+                'modified_by': _user(project_id + 1),
+                'last_job': _ref(project_id, project_name(project_id), status='successful',
+                                 finished=timestamp(project_id * 11)),
+                'user_capabilities': {'edit': True, 'delete': True, 'start': True, 'schedule': True, 'copy': True},
+            },
+        }
+
+
+def iter_inventories(sizes):
+    hosts_per_inventory = max(1, sizes['hosts'] // sizes['inventories'])
+    for inventory_id in range(1, sizes['inventories'] + 1):
+        yield {
+            'id': inventory_id,
+            'type': 'inventory',
+            'url': f'/api/controller/v2/inventories/{inventory_id}/',
+            'name': inventory_name(inventory_id),
+            'description': '',
+            'kind': '',
+            'total_hosts': hosts_per_inventory,
+            'hosts_with_active_failures': inventory_id % 3,
+            'has_inventory_sources': inventory_id % 2 == 0,
+            'created': timestamp(inventory_id),
+            'modified': timestamp(inventory_id * 5),
+            'summary_fields': {
+                'organization': _organization(inventory_id, sizes),
+                'created_by': _user(inventory_id),
+                'modified_by': _user(inventory_id + 2),
+                'user_capabilities': {'edit': True, 'delete': True, 'copy': True, 'adhoc': True},
+            },
+        }
+
+
+def iter_hosts(sizes):
+    for host_id in range(1, sizes['hosts'] + 1):
+        inventory_id = (host_id - 1) % sizes['inventories'] + 1
+        yield {
+            'id': host_id,
+            'type': 'host',
+            'url': f'/api/controller/v2/hosts/{host_id}/',
+            'name': host_name(host_id),
+            'description': '',
+            'inventory': inventory_id,
+            'enabled': host_id % 50 != 0,
+            'variables': f'ansible_host: 10.{host_id >> 16 & 255}.{host_id >> 8 & 255}.{host_id & 255}',
+            'created': timestamp(host_id),
+            'modified': timestamp(host_id * 3),
+            'summary_fields': {
+                'inventory': _ref(inventory_id, inventory_name(inventory_id)),
+                'created_by': _user(host_id),
+                'modified_by': _user(host_id),
+                'groups': {'count': 1, 'results': [_ref(host_id % 20 + 1, f'group-{host_id % 20 + 1}')]},
+            },
+        }
+
+
+def iter_job_templates(sizes):
+    for job_template_id in range(1, sizes['job_templates'] + 1):
+        project_id = (job_template_id - 1) % sizes['projects'] + 1
+        inventory_id = (job_template_id - 1) % sizes['inventories'] + 1
+        yield {
+            'id': job_template_id,
+            'type': 'job_template',
+            'url': f'/api/controller/v2/job_templates/{job_template_id}/',
+            'name': job_template_name(job_template_id),
+            'description': '',
+            'job_type': 'run',
+            'playbook': f'playbooks/{PLAYBOOKS[job_template_id % len(PLAYBOOKS)]}',
+            'project': project_id,
+            'inventory': inventory_id,
+            'limit': '',
+            'extra_vars': '---\nserial: 10\n',
+            'scm_branch': '',
+            'survey_enabled': job_template_id % 4 == 0,
+            'ask_limit_on_launch': True,
+            'ask_variables_on_launch': job_template_id % 2 == 0,
+            'ask_inventory_on_launch': job_template_id % 3 == 0,
+            'ask_scm_branch_on_launch': False,
+            'ask_tags_on_launch': False,
+            'ask_skip_tags_on_launch': False,
+            'ask_job_type_on_launch': False,
+            'ask_verbosity_on_launch': False,
+            'ask_credential_on_launch': False,
+            'ask_diff_mode_on_launch': False,
+            'status': STATUSES[job_template_id % len(STATUSES)],
+            'last_job_run': timestamp(job_template_id * 13),
+            'created': timestamp(job_template_id),
+            'modified': timestamp(job_template_id * 9),
+            'summary_fields': {
+                'organization': _organization(job_template_id, sizes),
+                'project': _ref(project_id, project_name(project_id), status='successful', scm_type='git'),
+                'inventory': _ref(inventory_id, inventory_name(inventory_id), total_hosts=20),
+                'last_job': _ref(job_template_id, job_template_name(job_template_id), status='successful',
+                                 finished=timestamp(job_template_id * 13)),
+                'created_by': _user(job_template_id),
+                'modified_by': _user(job_template_id + 3),
+                'labels': {'count': 1, 'results': [_ref(job_template_id % 30 + 1, _team(job_template_id))]},
+                'credentials': [_ref(job_template_id % 10 + 1, f'machine-{job_template_id % 10 + 1}', kind='ssh')],
+                'recent_jobs': [{'id': job_template_id, 'status': 'successful', 'finished': timestamp(job_template_id * 13)}],
+                'user_capabilities': {'edit': True, 'delete': True, 'start': True, 'schedule': True, 'copy': True},
+            },
+        }
+
+
+def make_job(job_id, sizes, status=None, job_template_id=None):
+    job_template_id = job_template_id or (job_id - 1) % sizes['job_templates'] + 1
+    project_id = (job_template_id - 1) % sizes['projects'] + 1
+    inventory_id = (job_template_id - 1) % sizes['inventories'] + 1
+    status = status or STATUSES[job_id % len(STATUSES)]
+    finished = status not in ('running', 'pending')
+    return {
+        'id': job_id,
+        'type': 'job',
+        'url': f'/api/controller/v2/jobs/{job_id}/',
+        'name': job_template_name(job_template_id),
+        'status': status,
+        'failed': status in ('failed', 'error'),
+        'playbook': f'playbooks/{PLAYBOOKS[job_template_id % len(PLAYBOOKS)]}',
+        'limit': host_name(job_id % max(sizes['hosts'], 1) + 1) if job_id % 3 else '',
+        'scm_branch': BRANCHES[job_id % len(BRANCHES)],
+        'job_template': job_template_id,
+        'project': project_id,
+        'inventory': inventory_id,
+        'launch_type': 'manual' if job_id % 5 else 'scheduled',
+        'extra_vars': '{"serial": 10}',
+        'created': timestamp(job_id * 60),
+        'started': timestamp(job_id * 60 + 2),
+        'finished': timestamp(job_id * 60 + 2 + job_id % 600) if finished else None,
+        'elapsed': float(job_id % 600) if finished else 0.0,
+        'summary_fields': {
+            'organization': _organization(job_template_id, sizes),
+            'job_template': _ref(job_template_id, job_template_name(job_template_id)),
+            'project': _ref(project_id, project_name(project_id), status='successful', scm_type='git'),
+            'inventory': _ref(inventory_id, inventory_name(inventory_id)),
+            'created_by': _user(job_id),
+            'labels': {'count': 0, 'results': []},
+            'credentials': [_ref(job_template_id % 10 + 1, f'machine-{job_template_id % 10 + 1}', kind='ssh')],
+            'user_capabilities': {'delete': True, 'start': True},
+        },
+    }
+
+
+def iter_jobs(sizes):
+    """Jobs newest first, like the default listing of a controller."""
+    for job_id in range(sizes['jobs'], 0, -1):
+        yield make_job(job_id, sizes)
+
+
+GENERATORS = {
+    'projects': iter_projects,
+    'inventories': iter_inventories,
+    'hosts': iter_hosts,
+    'job_templates': iter_job_templates,
+    'jobs': iter_jobs,
+}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    sizes = scaled_sizes(float(argv[0]) if argv else 1.0)
+    print(f"{'object type':<14}  {'count':>8}  {'seconds':>8}  {'objects/s':>10}")
+    for name, generator in GENERATORS.items():
+        started = time.perf_counter()
+        count = sum(1 for _ in generator(sizes))
+        elapsed = time.perf_counter() - started
+        print(f"{name:<14}  {count:>8}  {elapsed:>8.3f}  {count / elapsed:>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
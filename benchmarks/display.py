@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+"""Rows per second of Display.display_by_columns on large job listings.
+
+Usage: python -m benchmarks.display [rows ...]
+"""
+
+import io
+import sys
+import time
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from prompt_toolkit.styles import Style
+
+from ash.colors import COLORS
+from ash.display import Display, JOB_COLUMNS, format_timestamp
+
+DEFAULT_SIZES = (1000, 10000, 50000)
+
+
+def make_jobs(count):
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    jobs = []
+    for i in range(count):
+        # Jobs are created in bursts, so timestamps repeat like on a real controller
+        created = (start + timedelta(minutes=i // 20)).isoformat().replace('+00:00', 'Z')
+        jobs.append(SimpleNamespace(
+            id=i,
+            created=created,
+            limit=f"web{i % 500:03d},db{i % 50:02d}",
+            name=f"Deploy application {i % 200}",
+            playbook="playbooks/site.yml",
+            scm_branch="main",
+            status=('successful', 'failed', 'running', 'canceled')[i % 4],
+        ))
+    return jobs
+
+
+def bench(count):
+    display = Display(Style.from_dict(COLORS))
+    jobs = make_jobs(count)
+    format_timestamp.cache_clear()
+    with redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        display.display_by_columns(jobs, JOB_COLUMNS)
+        elapsed = time.perf_counter() - started
+    return elapsed
+
+
+def main(argv=None):
+    sizes = [int(arg) for arg in (argv or sys.argv[1:])] or DEFAULT_SIZES
+    print(f"{'rows':>8}  {'seconds':>8}  {'rows/s':>10}")
+    for count in sizes:
+        elapsed = bench(count)
+        print(f"{count:>8}  {elapsed:>8.3f}  {count / elapsed:>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+"""End-to-end scenarios of the ash shell against a local fake controller.
+
+Usage: python -m benchmarks.e2e [--latency SECONDS] [--jobs N] [--job-templates N] [--error-rate RATE]
+
+Each scenario reports its wall time, the number of requests the controller
+served and the peak memory allocated while it ran.
+"""
+
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from benchmarks.fake_controller import API_PATH, FakeController
+
+from ash.ash import Ash
+from ash.cache import Cache
+
+
+class _StopWatch(Exception):
+    """Raised in place of the watch sleep to stop after a single tick."""
+
+
+def _config(controller):
+    return SimpleNamespace(base_url=controller.url, token='benchmark', api_path=API_PATH,
+                           description='benchmark', description_color='white', verify_ssl=True)
+
+
+def _new_ash(controller):
+    return Ash(_config(controller), Cache(controller.url), interactive=False)
+
+
+def _stop_watch(seconds):
+    raise _StopWatch()
+
+
+def _watch_tick(ash):
+    size = os.terminal_size((200, 50))
+    with patch('ash.handlers.root.get_terminal_size', return_value=size), \
+            patch('ash.handlers.root.cancellation.sleep', _stop_watch):
+        try:
+            ash.execute('watch')
+        except _StopWatch:
+            pass
+
+
+def _add_hosts(ash, controller, count=50):
+    ash.execute('cd inventory 1')
+    names = '\n'.join(f'bench-{time.time_ns()}-{i}.example.com' for i in range(count))
+    ash.session_wo_history = SimpleNamespace(prompt=lambda *args, **kwargs: names)
+    ash.execute('add_hosts')
+
+
+def _output(ash, controller):
+    job_id = next(job['id'] for job in controller.data['jobs'].values() if job['finished'])
+    ash.execute(f'cd job {job_id}')
+    ash.execute('output')
+
+
+def scenarios(controller):
+    """Return (name, setup, run) tuples, setup returns the Ash instance given to run."""
+    def cold():
+        Cache(controller.url)._drop_all_tables()
+        return None
+
+    def start(_):
+        ash = _new_ash(controller)
+        ash._load_all_caches()
+
+    def warm_ash():
+        ash = _new_ash(controller)
+        ash._load_all_caches()
+        return ash
+
+    return [
+        ('cold start', cold, start),
+        ('warm start', lambda: None, start),
+        ('ls jobs', warm_ash, lambda ash: ash.execute('ls jobs result_limit:500')),
+        ('ls job_templates', warm_ash, lambda ash: ash.execute('ls job_templates')),
+        ('cd job_template', warm_ash, lambda ash: ash.execute('cd job_template 1')),
+        ('watch tick', warm_ash, _watch_tick),
+        ('add_hosts', warm_ash, lambda ash: _add_hosts(ash, controller)),
+        ('output', warm_ash, lambda ash: _output(ash, controller)),
+    ]
+
+
+def run_scenario(controller, setup, run):
+    """Return (wall seconds, requests served, peak bytes) of one scenario."""
+    with redirect_stdout(io.StringIO()):
+        ash = setup()
+        controller.reset_counts()
+        tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            run(ash)
+        finally:
+            elapsed = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+    return elapsed, controller.request_count, peak
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the end-to-end benchmark scenarios against a fake controller')
+    parser.add_argument('--latency', type=float, default=0.02, help='Seconds added to every response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with 503')
+    parser.add_argument('--jobs', type=int, default=2000)
+    parser.add_argument('--job-templates', type=int, default=300)
+    parser.add_argument('--inventories', type=int, default=50)
+    parser.add_argument('--stdout-lines', type=int, default=5000)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as home, patch.dict(os.environ, {'HOME': home}):
+        os.makedirs(os.path.join(home, '.local', 'share', 'ash'))
+        with FakeController(latency=args.latency, error_rate=args.error_rate, jobs=args.jobs,
+                            job_templates=args.job_templates, inventories=args.inventories,
+                            stdout_lines=args.stdout_lines) as controller:
+            print(f"{'scenario':<18}  {'seconds':>8}  {'requests':>8}  {'peak MB':>8}")
+            for name, setup, run in scenarios(controller):
+                elapsed, requests, peak = run_scenario(controller, setup, run)
+                print(f"{name:<18}  {elapsed:>8.3f}  {requests:>8}  {peak / 1024 / 1024:>8.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
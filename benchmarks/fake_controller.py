@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+
+"""In-process stand-in for the subset of the AWX/AAP v2 API used by ash.
+
+Usage: python -m benchmarks.fake_controller [--port PORT] [--latency SECONDS]
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from benchmarks.datasets import GENERATORS, make_job, scaled_sizes, timestamp
+
+API_PATH = '/api/controller/v2/'
+LIST_TYPES = ('inventories', 'projects', 'job_templates', 'jobs', 'hosts')
+
+
+def generate_dataset(inventories=20, projects=10, job_templates=50, jobs=500, hosts_per_inventory=20,
+                     stdout_lines=200):
+    """Return the object tables of a small but consistent controller and its sizes."""
+    sizes = dict(scaled_sizes(0), projects=projects, inventories=inventories, job_templates=job_templates,
+                 jobs=jobs, hosts=inventories * hosts_per_inventory)
+    data = {name: {item['id']: item for item in GENERATORS[name](sizes)} for name in LIST_TYPES}
+    return data, sizes, stdout_lines
+
+
+class FakeController(object):
+    """Threaded HTTP server with configurable latency, dataset size and error injection.
+
+    Request counts per method and path are kept in `requests` for assertions and reports."""
+
+    def __init__(self, latency=0.0, error_rate=0.0, seed=0, port=0, **dataset):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.data, self.sizes, self.stdout_lines = generate_dataset(**dataset)
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.failures = []
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self._handler_class())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    @property
+    def request_count(self):
+        with self.lock:
+            return sum(self.requests.values())
+
+    def reset_counts(self):
+        with self.lock:
+            self.requests = {}
+
+    def fail_next(self, count=1, status=503):
+        """Make the next `count` requests fail with `status`."""
+        with self.lock:
+            self.failures.extend([status] * count)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+    # Request handling
+
+    def _handler_class(self):
+        controller = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+                pass
+
+            def do_GET(self):
+                controller._dispatch(self, 'GET')
+
+            def do_POST(self):
+                controller._dispatch(self, 'POST')
+
+            def do_DELETE(self):
+                controller._dispatch(self, 'DELETE')
+
+        return Handler
+
+    def _dispatch(self, request, method):
+        parsed = urlparse(request.path)
+        path = parsed.path
+        with self.lock:
+            key = f"{method} {re.sub(r'/[0-9]+/', '/{id}/', path + '/' if not path.endswith('/') else path)}"
+            self.requests[key] = self.requests.get(key, 0) + 1
+            injected = self.failures.pop(0) if self.failures else None
+        if self.latency:
+            time.sleep(self.latency)
+        if injected is None and self.error_rate and self.random.random() < self.error_rate:
+            injected = 503
+        if injected is not None:
+            return self._send(request, injected, {'detail': 'Injected failure'}, headers={'Retry-After': '0'})
+        if not path.startswith(API_PATH):
+            return self._send(request, 404, {'detail': 'Not found'})
+
+        parts = [part for part in path[len(API_PATH):].split('/') if part]
+        query = parse_qs(parsed.query, keep_blank_values=True)
+        payload = None
+        if method == 'POST':
+            length = int(request.headers.get('Content-Length') or 0)
+            payload = json.loads(request.rfile.read(length) or b'{}') if length else {}
+        try:
+            status, body = self._route(method, parts, query, payload)
+        except KeyError:
+            status, body = 404, {'detail': 'Not found'}
+        self._send(request, status, body)
+
+    def _send(self, request, status, body, headers=None):
+        content = b'' if body is None else json.dumps(body).encode('utf-8')
+        request.send_response(status)
+        request.send_header('Content-Type', 'application/json')
+        request.send_header('Content-Length', str(len(content)))
+        for key, value in (headers or {}).items():
+            request.send_header(key, value)
+        request.end_headers()
+        request.wfile.write(content)
+
+    def _route(self, method, parts, query, payload):
+        if parts == ['ping']:
+            return 200, {'ha': False, 'version': 'fake'}
+        object_type = parts[0]
+        if len(parts) == 1 and method == 'GET':
+            return 200, self._list(parts, query, self._filtered(list(self.data[object_type].values()), query))
+        object_id = int(parts[1])
+        obj = self.data[object_type][object_id]
+        if len(parts) == 2:
+            if method == 'GET':
+                return 200, obj
+            if method == 'DELETE':
+                with self.lock:
+                    del self.data[object_type][object_id]
+                return 204, None
+        sub = parts[2]
+        if method == 'GET':
+            if object_type == 'inventories' and sub == 'hosts':
+                hosts = [host for host in self.data['hosts'].values() if host['inventory'] == object_id]
+                return 200, self._list(parts, query, self._filtered(hosts, query))
+            if object_type == 'job_templates' and sub == 'jobs':
+                jobs = [job for job in self.data['jobs'].values() if job['job_template'] == object_id]
+                return 200, self._list(parts, query, self._filtered(jobs, query))
+            if object_type == 'job_templates' and sub == 'survey_spec':
+                return 200, {'spec': [{'question_name': 'Branch', 'question_description': 'Git branch', 'variable': 'branch',
+                                       'required': False, 'type': 'text', 'default': 'main'}]}
+            if object_type == 'jobs' and sub == 'stdout':
+                return 200, self._stdout(object_id, query)
+            if object_type == 'jobs' and sub == 'job_host_summaries':
+                return 200, self._list(parts, query, self._filtered(self._host_summaries(obj), query))
+            if object_type == 'jobs' and sub == 'job_events':
+                return 200, self._list(parts, query, self._filtered(self._events(obj), query))
+        if method == 'POST':
+            if object_type == 'job_templates' and sub == 'launch':
+                return 201, self._new_job(object_id, payload)
+            if object_type == 'jobs' and sub == 'relaunch':
+                return 201, self._new_job(obj['job_template'], payload)
+            if object_type == 'jobs' and sub == 'cancel':
+                obj['status'] = 'canceled'
+                return 202, None
+            if object_type == 'projects' and sub == 'update':
+                return 202, {'id': object_id, 'status': 'pending'}
+            if object_type == 'inventories' and sub == 'update_inventory_sources':
+                return 202, [{'inventory_source': object_id, 'status': 'started'}]
+            if object_type == 'inventories' and sub == 'hosts':
+                return self._new_host(object_id, payload)
+        return 404, {'detail': 'Not found'}
+
+    # Listing helpers
+
+    def _filtered(self, items, query):
+        """Apply the query filters, repeated filters must all match like on AWX."""
+        for key, values in query.items():
+            if key in ('page', 'page_size', 'order_by', 'format', 'start_line', 'end_line'):
+                continue
+            if key.endswith('__in'):
+                accepted = set(','.join(values).split(','))
+                field = key[:-len('__in')]
+                items = [item for item in items if str(item.get(field)) in accepted]
+                continue
+            for value in values:
+                items = self._filter(items, key, value)
+        order_by = query.get('order_by', [None])[-1]
+        if order_by:
+            field = order_by.lstrip('-')
+            items = sorted(items, key=lambda item: (item.get(field) is None, item.get(field) or ''), reverse=order_by.startswith('-'))
+        return items
+
+    def _filter(self, items, key, value):
+        if key == 'search':
+            terms = [term.lower() for term in value.replace('+', ' ').split()]
+            return [item for item in items if all(term in json.dumps(item).lower() for term in terms)]
+        if key.endswith('__search'):
+            field = key[:-len('__search')]
+            return [item for item in items
+                    if value.lower() in str(item.get('summary_fields', {}).get(field, {}).get('name', '')).lower()
+                    or value.lower() in str(item.get(field, '')).lower()]
+        if key.endswith('__gt'):
+            field = key[:-len('__gt')]
+            return [item for item in items if str(item.get(field, '')) > value]
+        if key.endswith('__startswith'):
+            field = key[:-len('__startswith')]
+            return [item for item in items if str(item.get(field, '')).startswith(value)]
+        return [item for item in items if str(item.get(key)).lower() == value.lower()]
+
+    def _list(self, parts, query, items):
+        page_size = min(int(query.get('page_size', ['25'])[-1]), 200)
+        page = int(query.get('page', ['1'])[-1])
+        start = (page - 1) * page_size
+        results = items[start:start + page_size]
+        next_url = None
+        if start + page_size < len(items):
+            params = '&'.join(f"{key}={value}" for key, values in query.items() if key != 'page' for value in values)
+            next_url = f"{API_PATH}{'/'.join(parts)}/?{params}&page={page + 1}"
+        return {'count': len(items), 'next': next_url, 'previous': None, 'results': results}
+
+    def _stdout(self, job_id, query):
+        total = self.stdout_lines
+        start = int(query.get('start_line', ['0'])[-1])
+        end = min(int(query.get('end_line', [str(total)])[-1]), total)
+        content = ''.join(f"TASK [task {line // 10}] host-{line % 10}.example.com : ok\n" for line in range(start, end))
+        return {'content': content, 'range': {'start': start, 'end': end, 'absolute_end': total}}
+
+    def _host_summaries(self, job):
+        hosts = [host for host in self.data['hosts'].values() if host['inventory'] == job['inventory']]
+        summaries = []
+        for index, host in enumerate(hosts):
+            summaries.append({'id': host['id'], 'host': host['id'], 'host_name': host['name'], 'ok': 5,
+                              'changed': index % 3, 'failures': 1 if index % 7 == 0 else 0,
+                              'dark': 1 if index % 11 == 0 else 0, 'skipped': 1, 'failed': index % 7 == 0})
+        return summaries
+
+    def _events(self, job):
+        events = []
+        hosts = [host['name'] for host in self.data['hosts'].values() if host['inventory'] == job['inventory']][:10]
+        counter = 0
+        for task in range(10):
+            for index, host in enumerate(hosts):
+                counter += 1
+                events.append({'id': counter, 'counter': counter, 'event': 'runner_on_ok', 'task': f'task {task}',
+                               'role': f'role-{task % 3}', 'host_name': host, 'parent_uuid': f'task-{task}',
+                               'created': timestamp(task * 10 + index),
+                               'event_data': {'start': timestamp(task * 10)[:-1], 'end': timestamp(task * 10 + index)[:-1],
+                                              'duration': float(index)}})
+        return events
+
+    def _new_job(self, job_template_id, payload):
+        with self.lock:
+            job_id = max(self.data['jobs'], default=0) + 1
+            job = make_job(job_id, self.sizes, 'pending', job_template_id)
+            job.update({key: value for key, value in (payload or {}).items() if key in ('limit', 'inventory')})
+            self.data['jobs'][job_id] = job
+        return job
+
+    def _new_host(self, inventory_id, payload):
+        with self.lock:
+            name = payload.get('name')
+            if any(host['name'] == name and host['inventory'] == inventory_id for host in self.data['hosts'].values()):
+                return 400, {'__all__': ['Host with this Name and Inventory already exists.']}
+            host_id = max(self.data['hosts'], default=0) + 1
+            host = {'id': host_id, 'name': name, 'inventory': inventory_id, 'enabled': True, 'summary_fields': {}}
+            self.data['hosts'][host_id] = host
+        return 201, host
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve a fake AWX/AAP controller')
+    parser.add_argument('--port', type=int, default=8043)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--jobs', type=int, default=500)
+    args = parser.parse_args(argv)
+    controller = FakeController(latency=args.latency, error_rate=args.error_rate, port=args.port, jobs=args.jobs)
+    print(f"Fake controller listening on {controller.url}{API_PATH}")
+    try:
+        controller.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
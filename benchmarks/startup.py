@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+
+"""Startup time of the ash entry point, measured with python -X importtime.
+
+Usage: python -m benchmarks.startup [--runs N]
+
+Exits with status 1 when a measurement is over its budget.
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+# Cumulative import time budgets in milliseconds
+IMPORT_BUDGETS = {
+    # What --help and argument errors pay
+    'ash.main': 50,
+    # The shell and batch modes, dominated by prompt_toolkit and requests
+    'ash.ash': 600,
+}
+HELP_BUDGET_MS = 300
+
+
+def import_time(module):
+    """Return the cumulative import time of module in milliseconds."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True, check=True)
+    for line in reversed(result.stderr.splitlines()):
+        parts = [part.strip() for part in line.split('|')]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1]) / 1000
+    raise RuntimeError(f"No import time found for {module}")
+
+
+def help_time():
+    started = time.perf_counter()
+    subprocess.run([sys.executable, '-m', 'ash.main', '--help'], capture_output=True, check=True)
+    return (time.perf_counter() - started) * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure ash startup time against budgets')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    measurements = [(f'import {module}', budget, lambda module=module: import_time(module))
+                    for module, budget in IMPORT_BUDGETS.items()]
+    measurements.append(('ash --help', HELP_BUDGET_MS, help_time))
+
+    over_budget = False
+    print(f"{'measurement':<16}  {'median ms':>10}  {'budget ms':>10}")
+    for name, budget, measure in measurements:
+        median = statistics.median(measure() for _ in range(args.runs))
+        status = '' if median <= budget else '  OVER BUDGET'
+        over_budget = over_budget or median > budget
+        print(f"{name:<16}  {median:>10.1f}  {budget:>10}{status}")
+    return 1 if over_budget else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
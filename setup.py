@@ -29,7 +29,7 @@ setup(name='ash',
     packages = find_packages(include=['ash', 'ash.*']),
     install_requires = [line.strip() for line in open('requirements.txt') if line.strip() and not line.startswith('#')],
     entry_points = {
-        'console_scripts': ['ash=ash.main:main'],
+        'console_scripts': ['ash=ash.main:main', 'ashd=ash.daemon:main'],
     },
     include_package_data = True,
     zip_safe = False)
@@ -1,21 +1,52 @@
+import csv
 import io
+import json
+import os
+import pickle
+import pstats
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 import unittest
 from collections import namedtuple
-from contextlib import redirect_stdout
+from pathlib import Path
+from contextlib import redirect_stderr, redirect_stdout
 from collections import OrderedDict
 from types import SimpleNamespace
-from unittest.mock import Mock, call
+from unittest.mock import AsyncMock, Mock, call
 from unittest.mock import patch
 
+from ash.aap import AAP, API, OFFLINE_REFUSAL
+from ash import cancellation
+from ash.cache import Cache, CacheWriter
+from ash.history import SQLiteHistory
 from ash.ash import Ash
-from ash.commands import JT_COMMANDS, ROOT_COMMANDS
+from ash.commands import JOB_COMMANDS, JT_COMMANDS, ROOT_COMMANDS
+from ash.config import Config
+from ash.display import Display, JOB_TEMPLATE_COLUMNS, format_timestamp
 from ash.handlers.base import BaseHandler
 from ash.handlers.root import RootHandler
 from ash.handlers.job_template import JobTemplateHandler
 from ash.handlers.job import JobHandler
 from ash.handlers.inventory import InventoryHandler
 from ash.handlers.project import ProjectHandler
-from ash.object_types import PROJECTS, INVENTORIES, CACHED_OBJECT_TYPES
+from ash.models import Job, host_summary_from_data
+from ash.stats import Stats, normalize_endpoint
+from ash.pager import PagedSource, Pager
+from ash.object_types import PROJECTS, INVENTORIES, JOBS, JOB_TEMPLATES, CACHED_OBJECT_TYPES, JOB_PROFILES
+from ash.job_profile import JobProfile
+from ash.tasks import Task, TaskManager
+from ash.notifier import JobNotifier
+from ash.federation import fan_out
+from ash.daemon import DaemonClient, DaemonServer
+from ash.response_cache import ResponseCache
+from ash.singleflight import SingleFlight
+from ash.backoff import AdaptiveLimiter, RetryPolicy, retry_after
+from benchmarks.datasets import job_template_name
+from benchmarks.fake_controller import API_PATH, FakeController
 
 
 LIST_JOBS_COMMAND_LINE = "ls jobs project:demo nightly result_limit:5"
@@ -26,10 +57,12 @@ class BareAsh(Ash):
         pass
 
 
-class TestAshBehavior(unittest.TestCase):
+class AshTestCase(unittest.TestCase):
     def setUp(self):
         self.ash = BareAsh()
         self.ash.display = Mock()
+        self.ash.api = Mock(offline=False)
+        self.ash.force_offline = False
         self.ash.commands = ROOT_COMMANDS.copy()
         self.ash.completer = None
         self.ash._base_handler = BaseHandler(self.ash)
@@ -39,10 +72,16 @@ class TestAshBehavior(unittest.TestCase):
         self.ash._inventory_handler = InventoryHandler(self.ash)
         self.ash._project_handler = ProjectHandler(self.ash)
         self.ash._command_handlers = self.ash._build_command_handlers()
+        self.ash.task_manager = TaskManager(on_done=self.ash._on_task_done)
+        self.ash.notifier = Mock()
+        self.ash.cache_writer = Mock()
+        self.ash.controllers = OrderedDict()
 
+
+class TestAshBehavior(AshTestCase):
     def test_run_dispatches_known_command_with_args(self):
         self.ash.session = Mock()
-        self.ash.session.prompt = Mock(side_effect=[LIST_JOBS_COMMAND_LINE, "exit"])
+        self.ash.session.prompt_async = AsyncMock(side_effect=[LIST_JOBS_COMMAND_LINE, "exit"])
         self.ash.get_prompt = Mock(return_value=[])
         self.ash.aap = Mock()
         self.ash.aap.get_jobs.return_value = []
@@ -71,6 +110,7 @@ class TestAshBehavior(unittest.TestCase):
         self.assertEqual(loaded, objects)
         self.assertEqual(by_id, {1: objects[0], 2: objects[1]})
         self.assertEqual(by_name, {"Inventory A": objects[0], "Inventory B": objects[1]})
+        self.assertIs(objects[0].api, self.ash.api)
         self.ash.aap.get_inventories.assert_not_called()
         self.ash.cache.insert_cache.assert_not_called()
 
@@ -119,7 +159,7 @@ class TestAshBehavior(unittest.TestCase):
     def test_cmd_launch_merges_prompted_values_and_survey_vars(self):
         self.ash.commands = OrderedDict({**JT_COMMANDS, **ROOT_COMMANDS})
         self.ash.session = Mock()
-        self.ash.session.prompt = Mock(side_effect=["launch", "exit"])
+        self.ash.session.prompt_async = AsyncMock(side_effect=["launch", "exit"])
         self.ash.get_prompt = Mock(return_value=[])
         self.ash.session_wo_history = Mock()
         default_survey_input = ""
@@ -127,6 +167,8 @@ class TestAshBehavior(unittest.TestCase):
         self.ash.session_wo_history.prompt = Mock(
             side_effect=[default_survey_input, launch_confirmation]
         )
+        self.ash.cache = Mock()
+        self.ash.cache.load_cache_item.return_value = None
         self.ash.current_context = Mock()
         self.ash.current_context.get_asked_variables.return_value = ["inventory", "extra_vars"]
         self.ash.current_context.survey_enabled = True
@@ -190,7 +232,7 @@ class TestAshBehavior(unittest.TestCase):
 
         self.ash._cd_inventory(["does-not-exist"])
 
-        self.ash.display.print.assert_called_with("Inventory 'does-not-exist' not found.", 'red')
+        self.ash.display.error.assert_called_with("Inventory 'does-not-exist' not found.")
 
     def test_root_cache_with_invalid_type_prints_valid_types(self):
         self.ash.cache = Mock()
@@ -199,9 +241,8 @@ class TestAshBehavior(unittest.TestCase):
         self.ash._root_handler.cache(["invalid_type"])
 
         valid_types = ", ".join(CACHED_OBJECT_TYPES)
-        self.ash.display.print.assert_called_with(
+        self.ash.display.error.assert_called_with(
             f"Unknown cache type: invalid_type. Valid types are: {valid_types}.",
-            'red',
         )
         self.ash.cache.clean_cache.assert_not_called()
 
@@ -231,7 +272,7 @@ class TestAshBehavior(unittest.TestCase):
         self.ash._root_handler._ls_jobs(["result_limit:not_an_int"])
 
         self.ash.aap.get_jobs.assert_not_called()
-        self.ash.display.print.assert_called_with("Invalid result_limit value. It should be an integer.", 'red')
+        self.ash.display.error.assert_called_with("Invalid result_limit value. It should be an integer.")
 
     def test_watch_renders_description_on_last_line(self):
         terminal_size = namedtuple("TerminalSize", ["columns", "lines"])(80, 24)
@@ -242,7 +283,7 @@ class TestAshBehavior(unittest.TestCase):
         watch_args = ["project:demo", "nightly"]
 
         with patch("ash.handlers.root.get_terminal_size", return_value=terminal_size), \
-             patch("ash.handlers.root.time.sleep", side_effect=KeyboardInterrupt):
+             patch("ash.handlers.root.cancellation.sleep", side_effect=KeyboardInterrupt):
             stdout = io.StringIO()
             with redirect_stdout(stdout):
                 with self.assertRaises(KeyboardInterrupt):
@@ -264,6 +305,1482 @@ class TestAshBehavior(unittest.TestCase):
         self.assertIn(expected_footer, output)
         self.assertIn("\033[32m", output)
 
+    def test_reuse_does_not_fetch_the_survey_spec(self):
+        template = Mock(survey_enabled=True)
+        template.get_asked_variables.return_value = ["credential"]
+        self.ash.job_templates_by_id = {7: template}
+        self.ash.current_context = SimpleNamespace(job_template=7, extra_vars='{"release": "1.2"}',
+                                                   summary_fields={"credentials": [{"id": 3}]})
+
+        with patch.object(JobHandler, "_execute_payload") as execute_payload:
+            self.ash._job_handler.reuse([])
+
+        template.get_survey_spec.assert_not_called()
+        execute_payload.assert_called_once_with(template, {"credential": [3], "extra_vars": {"release": "1.2"}})
+
+
+def runner_event(task, host, start, end, duration, role="", uuid=None):
+    return {
+        "event": "runner_on_ok",
+        "task": task,
+        "role": role,
+        "host_name": host,
+        "parent_uuid": uuid or task,
+        "created": f"2024-05-01T10:{end}Z",
+        "event_data": {
+            "start": f"2024-05-01T10:{start}",
+            "end": f"2024-05-01T10:{end}",
+            "duration": duration,
+        },
+    }
+
+
+class TestJobProfile(unittest.TestCase):
+    def setUp(self):
+        self.events = [
+            runner_event("gather", "web1", "00:00", "00:02", 2.0),
+            runner_event("gather", "web2", "00:00", "00:05", 5.0),
+            runner_event("install", "web1", "00:05", "00:35", 30.0, role="nginx"),
+            runner_event("install", "web2", "00:05", "00:15", 10.0, role="nginx"),
+            {"event": "playbook_on_stats"},
+        ]
+
+    def test_task_rows_are_sorted_by_wall_time(self):
+        profile = JobProfile.from_events(1, self.events)
+
+        rows = profile.task_rows()
+
+        self.assertEqual([row.task for row in rows], ["install", "gather"])
+        self.assertEqual(rows[0].duration, "30.00s")
+        self.assertEqual(rows[0].slowest_host, "web1")
+        self.assertEqual(rows[0].hosts, 2)
+        self.assertEqual(len(profile.task_rows(1)), 1)
+
+    def test_role_and_host_rows_aggregate_durations(self):
+        profile = JobProfile.from_events(1, self.events)
+
+        self.assertEqual(profile.role_rows()[0][:2], ("nginx", 1))
+        hosts = {row.host: row.duration for row in profile.host_rows()}
+        self.assertEqual(hosts, {"web1": "32.00s", "web2": "15.00s"})
+
+    def test_critical_path_follows_slowest_host_of_each_task(self):
+        profile = JobProfile.from_events(1, self.events)
+
+        path = profile.critical_path()
+
+        self.assertEqual([(row.task, row.host) for row in path], [("gather", "web2"), ("install", "web1")])
+        self.assertEqual(path[1].offset, "+5.00s")
+        self.assertEqual(profile.total_duration(), 35.0)
+
+
+class TestJobProfileCommand(AshTestCase):
+    def test_profile_of_finished_job_is_cached(self):
+        self.ash.cache = Mock()
+        self.ash.cache.load_cache_item.return_value = None
+        job = Mock(id=7, finished="2024-05-01T10:01:00Z")
+        job.get_events.return_value = [runner_event("gather", "web1", "00:00", "00:02", 2.0)]
+        self.ash.current_context = job
+
+        self.ash._job_handler.durations([])
+
+        self.ash.cache.insert_cache.assert_called_once()
+        table, job_id, profile = self.ash.cache.insert_cache.call_args[0]
+        self.assertEqual((table, job_id), (JOB_PROFILES, 7))
+        self.assertEqual(profile.task_rows()[0].task, "gather")
+
+    def test_cached_profile_skips_event_retrieval(self):
+        self.ash.cache = Mock()
+        self.ash.cache.load_cache_item.return_value = JobProfile.from_events(
+            7, [runner_event("gather", "web1", "00:00", "00:02", 2.0)]
+        )
+        job = Mock(id=7)
+        self.ash.current_context = job
+
+        self.ash._job_handler.durations(["5"])
+
+        job.get_events.assert_not_called()
+        self.ash.display.display_by_columns.assert_called()
+
+
+class TestJobHostSummaries(AshTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ash.current_context_type = JOBS
+        self.ash.current_context = Mock()
+        self.ash.current_context.get_host_summaries.return_value = [
+            host_summary_from_data({"host_name": "web1", "ok": 3}),
+            host_summary_from_data({"host_name": "web2", "failures": 1, "failed": True}),
+            host_summary_from_data({"host_name": "web3", "dark": 1}),
+            host_summary_from_data({"host_name": "web4", "changed": 2, "ok": 2}),
+        ]
+
+    def test_host_summary_status_precedence(self):
+        statuses = [summary.status for summary in self.ash.current_context.get_host_summaries()]
+
+        self.assertEqual(statuses, ["ok", "failed", "unreachable", "changed"])
+
+    def test_hosts_filter_offers_failed_set_as_next_limit(self):
+        self.ash._command_handlers["hosts"](["failed", "unreachable"])
+
+        displayed = self.ash.display.display_host_summaries.call_args[0][0]
+        self.assertEqual([summary.host for summary in displayed], ["web2", "web3"])
+        self.assertEqual(self.ash.host_limit, "web2,web3")
+
+        default, _, _ = self.ash._base_handler._get_variable_defaults("limit")
+
+        self.assertEqual(default, "web2,web3")
+        self.assertIsNone(self.ash.host_limit)
+
+    def test_hosts_filter_limit_is_dropped_by_a_launch_without_limit(self):
+        self.ash._command_handlers["hosts"](["failed"])
+        self.ash._base_handler._validate_payload = Mock(return_value="no")
+
+        self.ash._base_handler._execute_payload(Mock(), {"job_tags": "deploy"})
+
+        self.assertIsNone(self.ash.host_limit)
+
+    def test_hosts_pager_filters_statuses_on_the_controller(self):
+        self.ash.current_context.uri = "jobs/7"
+        self.ash.api.retrieves_page.return_value = ([{"host_name": "web3", "dark": 1, "failed": True}], 1)
+        self.ash._job_handler._page_by_columns = Mock()
+
+        self.ash._job_handler.hosts(["--pager", "unreachable"])
+
+        source = self.ash._job_handler._page_by_columns.call_args.args[0]
+        self.assertEqual(source.get(0).host, "web3")
+        self.assertEqual(self.ash.api.retrieves_page.call_args.kwargs["filters"], {"dark__gt": ["0"]})
+        self.ash.current_context.get_host_summaries.assert_not_called()
+
+    def test_hosts_rejects_unknown_status(self):
+        self.ash._job_handler.hosts(["broken"])
+
+        self.ash.current_context.get_host_summaries.assert_not_called()
+
+
+class TestBatchMode(unittest.TestCase):
+    def setUp(self):
+        self.config = SimpleNamespace(base_url="https://aap.example.com", token="token", api_path="/api/controller/v2/")
+        self.cache = Mock()
+        self.cache.load_cache.return_value = [SimpleNamespace(id=3, name="Platform")]
+
+    def test_batch_ash_skips_prompt_sessions_and_loads_caches_on_demand(self):
+        with patch("ash.ash.PromptSession") as prompt_session, patch("ash.ash.create_history") as create_history:
+            ash = Ash(self.config, self.cache, interactive=False)
+
+            self.cache.load_cache.assert_not_called()
+            self.assertEqual(ash.projects_by_id[3].name, "Platform")
+            self.cache.load_cache.assert_called_once_with(PROJECTS)
+            prompt_session.assert_not_called()
+            create_history.assert_not_called()
+
+    def test_run_batch_skips_comments_and_reports_unknown_commands(self):
+        with patch("ash.ash.PromptSession"), patch("ash.ash.create_history"):
+            ash = Ash(self.config, self.cache, interactive=False)
+        ash._command_handlers["ls"] = Mock()
+
+        with redirect_stdout(io.StringIO()):
+            status = ash.run_batch(["# nightly report", "", "ls jobs status:failed", "bogus"])
+
+        ash._command_handlers["ls"].assert_called_once_with(["jobs", "status:failed"])
+        self.assertEqual(status, 1)
+
+    def test_run_batch_fails_when_a_command_reports_an_error(self):
+        with patch("ash.ash.PromptSession"), patch("ash.ash.create_history"):
+            ash = Ash(self.config, self.cache, interactive=False)
+        ash._command_handlers["ls"] = lambda args: ash.display.error("Job '999' not found.")
+        ash._command_handlers["stats"] = Mock()
+
+        with redirect_stdout(io.StringIO()):
+            self.assertEqual(ash.run_batch(["stats"]), 0)
+            self.assertEqual(ash.run_batch(["ls", "stats"]), 1)
+
+    def test_run_batch_does_not_fail_on_red_status_lines(self):
+        with patch("ash.ash.PromptSession"), patch("ash.ash.create_history"):
+            ash = Ash(self.config, self.cache, interactive=False)
+        ash._command_handlers["ls"] = lambda args: ash.display.print("Job 3 finished: failed", ash.display.status_to_color("failed"))
+
+        with redirect_stdout(io.StringIO()):
+            self.assertEqual(ash.run_batch(["ls"]), 0)
+
+    def test_run_batch_fails_on_api_errors_and_exceptions_without_stopping(self):
+        with patch("ash.ash.PromptSession"), patch("ash.ash.create_history"):
+            ash = Ash(self.config, self.cache, interactive=False)
+        ash._command_handlers["ls"] = Mock(side_effect=KeyError("summary_fields"))
+        ash._command_handlers["tasks"] = lambda args: ash.api.log_error(None)
+        ash._command_handlers["stats"] = Mock()
+        ash.display.error = Mock(wraps=ash.display.error)
+
+        with redirect_stdout(io.StringIO()):
+            self.assertEqual(ash.run_batch(["ls"]), 1)
+            self.assertEqual(ash.run_batch(["tasks", "stats"]), 1)
+
+        ash._command_handlers["stats"].assert_called_once_with([])
+        ash.display.error.assert_any_call("ls: KeyError: 'summary_fields'")
+
+    def test_run_batch_stops_at_exit(self):
+        with patch("ash.ash.PromptSession"), patch("ash.ash.create_history"):
+            ash = Ash(self.config, self.cache, interactive=False)
+        ash._command_handlers["ls"] = Mock()
+
+        status = ash.run_batch(["exit", "ls jobs"])
+
+        ash._command_handlers["ls"].assert_not_called()
+        self.assertEqual(status, 0)
+
+
+class TestStreamingFormats(AshTestCase):
+    def setUp(self):
+        super().setUp()
+        self.pages = [
+            [SimpleNamespace(id=1, name="Deploy", playbook="site.yml")],
+            [SimpleNamespace(id=2, name="Patch, all", playbook="patch.yml")],
+        ]
+
+    def stream(self, output_format, pages):
+        out = io.StringIO()
+        Display(None).stream_by_columns(pages, JOB_TEMPLATE_COLUMNS, output_format, out=out)
+        return out.getvalue()
+
+    def test_jsonl_writes_one_object_per_row(self):
+        lines = self.stream("jsonl", self.pages).splitlines()
+
+        self.assertEqual([json.loads(line)["id"] for line in lines], [1, 2])
+
+    def test_json_and_csv_are_valid_documents(self):
+        self.assertEqual(json.loads(self.stream("json", self.pages))[1]["name"], "Patch, all")
+        self.assertEqual(json.loads(self.stream("json", [])), [])
+        rows = list(csv.reader(io.StringIO(self.stream("csv", self.pages))))
+        self.assertEqual(rows, [["id", "name", "playbook"], ["1", "Deploy", "site.yml"], ["2", "Patch, all", "patch.yml"]])
+
+    def test_pop_output_format_accepts_both_spellings(self):
+        handler = self.ash._base_handler
+
+        self.assertEqual(handler._pop_output_format(["jobs", "--format", "csv", "x"]), ("csv", ["jobs", "x"]))
+        self.assertEqual(handler._pop_output_format(["--format=jsonl"]), ("jsonl", []))
+        self.assertEqual(handler._pop_output_format(["--format", "xml"]), (None, None))
+
+    def test_ls_jobs_with_format_streams_pages(self):
+        self.ash.aap = Mock()
+        self.ash.aap.iter_jobs.return_value = iter(self.pages)
+
+        self.ash._root_handler.ls(["jobs", "--format", "jsonl", "result_limit:5"])
+
+        self.ash.aap.iter_jobs.assert_called_once_with(filters={}, result_limit=5)
+        self.ash.aap.get_jobs.assert_not_called()
+        self.ash.display.stream_by_columns.assert_called_once()
+
+
+    def test_watch_refuses_json_format(self):
+        self.ash.aap = Mock()
+
+        self.ash._root_handler.watch(["--format", "json"])
+
+        self.ash.aap.iter_jobs.assert_not_called()
+        self.ash.display.error.assert_called_once_with("watch streams the jobs as they change, use --format jsonl or csv.")
+
+    def test_api_errors_are_kept_out_of_streamed_rows(self):
+        api = API("https://aap.example.com", "token", "/api/controller/v2/")
+
+        with redirect_stdout(io.StringIO()) as output, redirect_stderr(io.StringIO()) as errors:
+            api.log_error(None)
+
+        self.assertEqual(output.getvalue(), "")
+        self.assertIn("No response from API", errors.getvalue())
+
+class TestDisplayByColumns(unittest.TestCase):
+    def test_table_is_written_in_a_single_formatted_text_call(self):
+        objects = [SimpleNamespace(id=i, name=f"Template {i}", playbook="site.yml") for i in range(50)]
+
+        with patch("ash.display.print_formatted_text") as print_formatted_text:
+            Display(None).display_by_columns(objects, JOB_TEMPLATE_COLUMNS)
+
+        print_formatted_text.assert_called_once()
+        fragments = list(print_formatted_text.call_args[0][0])
+        lines = "".join(text for _, text in fragments).splitlines()
+        self.assertEqual(len(lines), 51)
+        self.assertEqual(lines[0].split(), ["id", "name", "playbook"])
+        self.assertEqual(fragments[0][0], "class:headers")
+        self.assertEqual(fragments[2][0], "class:white_bold")
+
+    def test_timestamps_are_formatted_through_a_memoized_parser(self):
+        format_timestamp.cache_clear()
+        display = Display(None)
+
+        first = display.parse_label("2024-05-01T10:00:00.123456Z")
+        second = display.parse_label("2024-05-01T10:00:00.123456Z")
+
+        self.assertEqual(first, second)
+        self.assertRegex(first, r"^\d{2}/\d{2}-\d{2}:\d{2}$")
+        self.assertEqual(format_timestamp.cache_info().hits, 1)
+        self.assertEqual(display.parse_label("not a date at all", 8), "not a...")
+
+
+class TestPager(unittest.TestCase):
+    def setUp(self):
+        self.fetched = []
+
+        def fetch_page(number):
+            self.fetched.append(number)
+            start = (number - 1) * 10
+            return [f"row {i}" for i in range(start, min(start + 10, 1000))], 1000
+
+        self.source = PagedSource(fetch_page, 10, max_pages=3)
+        self.pager = Pager(self.source, lambda row: [("", row)])
+
+    def test_source_fetches_pages_on_demand_and_evicts_old_ones(self):
+        self.assertEqual(self.source.get(25), "row 25")
+        self.assertEqual(self.fetched, [1, 3])
+        for index in (35, 45, 55):
+            self.source.get(index)
+
+        self.assertEqual(len(self.source._pages), 3)
+        self.assertIsNone(self.source.get(1000))
+
+    def test_rendering_only_touches_visible_rows(self):
+        control = self.pager.rows_window.content
+        self.pager.scroll_to(500)
+
+        content = control.create_content(80, 5)
+        lines = [content.get_line(i) for i in range(content.line_count)]
+
+        self.assertEqual([line[0][1] for line in lines], [f"row {i}" for i in range(500, 505)])
+        self.assertEqual(self.fetched, [1, 51])
+
+    def test_search_and_jump_scroll_to_the_match(self):
+        self.pager.height = 10
+
+        index = self.pager.find("row 742", 0)
+        self.pager._show_match(index)
+
+        self.assertEqual(index, 742)
+        self.assertEqual(self.pager.top, 737)
+        self.pager.scroll_to(5000)
+        self.assertEqual(self.pager.top, 990)
+
+
+    def test_typing_a_search_only_matches_the_rows_on_screen(self):
+        self.pager.height = 10
+        self.pager.mode = 'search'
+        self.pager.search_origin = 0
+        self.pager.source.get(0)
+
+        for length in range(1, len("row 742") + 1):
+            self.pager.input.text = "row 742"[:length]
+        self.assertIsNone(self.pager.match)
+        self.assertEqual(self.fetched, [1])
+
+        self.pager.input.text = "row 7"
+        self.assertEqual(self.pager.match, 7)
+
+        self.pager.input.text = "row 742"
+        self.pager._on_input_accepted(self.pager.input)
+        self.assertEqual(self.pager.match, 742)
+        self.assertEqual(self.fetched, list(range(1, 76)))
+
+class TestStartupImports(unittest.TestCase):
+    def imported_modules(self, module):
+        code = f"import sys, {module}; print(' '.join(sorted(sys.modules)))"
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        return set(result.stdout.split())
+
+    def test_entry_point_defers_heavy_modules_until_arguments_are_parsed(self):
+        modules = self.imported_modules("ash.main")
+
+        for heavy in ("ash.ash", "prompt_toolkit", "requests", "yaml", "iterfzf"):
+            self.assertNotIn(heavy, modules)
+
+    def test_shell_defers_picker_and_parser_modules(self):
+        modules = self.imported_modules("ash.ash")
+
+        for lazy in ("yaml", "iterfzf", "dateutil"):
+            self.assertNotIn(lazy, modules)
+
+
+class TestStats(AshTestCase):
+    def test_normalize_endpoint_groups_by_shape(self):
+        self.assertEqual(normalize_endpoint("jobs/42/stdout/?format=json"), "jobs/{id}/stdout/")
+        self.assertEqual(normalize_endpoint("job_templates/7"), "job_templates/{id}")
+
+    def test_api_requests_feed_latency_bytes_and_json_stats(self):
+        api = API("https://aap.example.com", "token", "/api/controller/v2/")
+        response = Mock(status_code=200, content=b"x" * 2048)
+        response.json = Mock(return_value={"results": []})
+        api.session.request = Mock(return_value=response)
+
+        api.get_request("jobs/?page_size=100")
+        response = api.get_request("jobs/42/")
+        response.json()
+        response.json()
+
+        data = api.stats.to_dict()
+        self.assertEqual(data["endpoints"]["GET jobs/"]["count"], 1)
+        self.assertEqual(data["endpoints"]["GET jobs/{id}/"]["bytes"], 2048)
+        self.assertEqual(data["totals"]["pages"], 1)
+        self.assertEqual(sum(data["endpoints"]["GET jobs/{id}/"]["histogram"]), 1)
+        self.assertEqual(json.loads(json.dumps(data))["totals"]["requests"], 2)
+
+    def test_timing_prints_a_breakdown_after_each_command(self):
+        self.ash.stats = Stats()
+        self.ash._command_handlers["ls"] = Mock(side_effect=lambda args: self.ash.stats.record_cache("projects", 0.002, hit=True))
+        self.ash._root_handler.timing(["on"])
+
+        self.ash.execute("ls projects")
+
+        breakdown = self.ash.display.print.call_args[0][0]
+        self.assertTrue(breakdown.startswith("ls: "))
+        self.assertIn("(1 hits, 0 misses)", breakdown)
+
+    def test_stats_json_reports_a_file_that_cannot_be_written(self):
+        self.ash.stats = Stats()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "missing", "stats.json")
+            self.ash._root_handler.stats(["json", path])
+
+        self.ash.display.error.assert_called_once()
+        self.assertTrue(self.ash.display.error.call_args.args[0].startswith(f"Unable to write statistics to {path}: "))
+
+    def test_objects_are_pickled_without_their_api_client(self):
+        job = Job(API("https://aap.example.com", "token", "/api/controller/v2/"), {"id": 1, "name": "Deploy", "status": "ok"})
+
+        restored = pickle.loads(pickle.dumps(job))
+
+        self.assertEqual(restored.name, "Deploy")
+        self.assertFalse(hasattr(restored, "api"))
+
+
+class TestCommandProfiling(AshTestCase):
+    def test_profile_wraps_the_dispatched_command(self):
+        self.ash._command_handlers["ls"] = Mock()
+        stdout = io.StringIO()
+
+        with redirect_stdout(stdout):
+            self.ash._base_handler.profile(["ls", "jobs", "status:failed"])
+
+        self.ash._command_handlers["ls"].assert_called_once_with(["jobs", "status:failed"])
+        self.assertIn("cumulative", stdout.getvalue())
+
+    def test_profile_and_job_durations_are_both_listed_in_job_context(self):
+        commands = self.ash._get_commands_for_context(JOBS)
+
+        self.assertEqual(commands["profile"], ROOT_COMMANDS["profile"])
+        self.assertEqual(commands["durations"], JOB_COMMANDS["durations"])
+
+    def test_batch_profile_writes_prof_file(self):
+        config = SimpleNamespace(base_url="https://aap.example.com", token="token", api_path="/api/controller/v2/")
+        with patch("ash.ash.PromptSession"), patch("ash.ash.create_history"):
+            ash = Ash(config, Mock(), interactive=False)
+        ash._command_handlers["ls"] = Mock()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "batch.prof")
+            with patch.dict(os.environ, {"ASH_PROFILE": path}), redirect_stderr(io.StringIO()):
+                ash.run_batch(["ls jobs"])
+
+            self.assertGreater(pstats.Stats(path).total_calls, 0)
+
+
+class TestApiPagination(unittest.TestCase):
+    def page(self, results, count, next_url=None):
+        return Mock(status_code=200, json=Mock(return_value={"results": results, "count": count, "next": next_url}))
+
+    def test_parallel_retrieval_requests_remaining_pages_by_number(self):
+        api = API("https://aap.example.com", "token", "/api/controller/v2/")
+        pages = {
+            "jobs/1/job_events/?page_size=100": self.page(list(range(100)), 250, "/api/controller/v2/jobs/1/job_events/?page=2"),
+            "jobs/1/job_events/?page_size=100&page=2": self.page(list(range(100, 200)), 250),
+            "jobs/1/job_events/?page_size=100&page=3": self.page(list(range(200, 250)), 250),
+        }
+        api.get_request = Mock(side_effect=lambda endpoint: pages[endpoint])
+
+        data = api.retrieves_data("job_events", baseuri="jobs/1/job_events/", result_limit=0, parallel=4)
+
+        self.assertEqual(data, list(range(250)))
+        self.assertEqual(api.get_request.call_count, 3)
+
+    def test_iter_pages_follows_next_until_result_limit(self):
+        api = API("https://aap.example.com", "token", "/api/controller/v2/")
+        pages = {
+            "jobs/?page_size=100": self.page(list(range(100)), 300, "/api/controller/v2/jobs/?page=2"),
+            "jobs/?page=2": self.page(list(range(100, 200)), 300, "/api/controller/v2/jobs/?page=3"),
+        }
+        api.get_request = Mock(side_effect=lambda endpoint: pages[endpoint])
+
+        result = list(api.iter_pages("jobs", result_limit=150))
+
+        self.assertEqual([len(page) for page in result], [100, 50])
+        self.assertEqual(api.get_request.call_count, 2)
+
+    def test_concurrent_callers_sharing_the_first_page_get_their_own_list(self):
+        with FakeController(jobs=250, latency=0.3) as controller:
+            api = API(controller.url, "token", API_PATH)
+            results = [None, None]
+
+            def retrieve(index):
+                results[index] = api.retrieves_data("jobs", result_limit=250)
+
+            threads = [threading.Thread(target=retrieve, args=(index,)) for index in range(2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        for data in results:
+            self.assertEqual(len(data), 250)
+            self.assertEqual(len({item["id"] for item in data}), 250)
+
+
+class TestFakeController(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.controller = FakeController(jobs=230, job_templates=12, inventories=3, hosts_per_inventory=5).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.controller.stop()
+
+    def setUp(self):
+        self.controller.reset_counts()
+        self.api = API(self.controller.url, "token", API_PATH)
+
+    def test_retrieves_data_follows_next_links(self):
+        data = self.api.retrieves_data("jobs", result_limit=0)
+
+        self.assertEqual(len(data), 230)
+        self.assertEqual(self.controller.requests["GET /api/controller/v2/jobs/"], 3)
+
+    def test_parallel_retrieval_matches_sequential_order(self):
+        sequential = self.api.retrieves_data("jobs", order_by="-id", result_limit=0)
+        parallel = self.api.retrieves_data("jobs", order_by="-id", result_limit=0, parallel=4)
+
+        self.assertEqual([job["id"] for job in parallel], [job["id"] for job in sequential])
+
+    def test_search_filters_are_applied_by_the_controller(self):
+        jobs = self.api.retrieves_data("jobs", result_limit=0, filters={"job_template__search": [job_template_name(12)]})
+
+        self.assertTrue(jobs)
+        self.assertTrue(all(job["summary_fields"]["job_template"]["name"] == job_template_name(12) for job in jobs))
+
+    def test_injected_errors_are_reported_as_missing_data(self):
+        self.controller.fail_next(self.api.retry.retries + 1)
+
+        with redirect_stdout(io.StringIO()):
+            data = self.api.retrieves_data("jobs", result_limit=10)
+
+        self.assertIsNone(data)
+
+
+class TestResponseCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.controller = FakeController(jobs=10, job_templates=3, inventories=1, hosts_per_inventory=1).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.controller.stop()
+
+    def setUp(self):
+        self.controller.reset_counts()
+        self.api = API(self.controller.url, "token", API_PATH)
+
+    def response(self, size):
+        return SimpleNamespace(status_code=200, content=b"x" * size)
+
+    def test_navigation_reuses_object_responses(self):
+        for _ in range(3):
+            self.api.get_request("job_templates/1")
+        self.api.get_request("job_templates/1", fresh=True)
+
+        self.assertEqual(self.controller.request_count, 2)
+        self.assertEqual(self.api.stats.cache_tables["responses"]["hits"], 2)
+
+    def test_jobs_are_never_cached(self):
+        self.api.get_request("jobs/1/")
+        self.api.get_request("jobs/1/")
+
+        self.assertEqual(self.controller.request_count, 2)
+
+    def test_writes_invalidate_the_object_responses(self):
+        self.api.get_request("job_templates/1")
+        self.api.get_request("job_templates/1/survey_spec/")
+        self.api.get_request("job_templates/2")
+
+        self.api.post_request("job_templates/1/launch/", {})
+
+        self.assertEqual(len(self.api.responses), 1)
+        self.assertIsNotNone(self.api.responses.get("job_templates/2"))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = ResponseCache(max_entries=2, max_bytes=100)
+        cache.put("projects/1/", self.response(10))
+        cache.put("projects/2/", self.response(10))
+        cache.get("projects/1/")
+        cache.put("projects/3/", self.response(10))
+
+        self.assertIsNone(cache.get("projects/2/"))
+        self.assertIsNotNone(cache.get("projects/1/"))
+
+        cache.put("projects/4/", self.response(95))
+
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.size, 95)
+
+
+class TestBackoff(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.controller = FakeController(jobs=10, job_templates=2, inventories=1, hosts_per_inventory=1).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.controller.stop()
+
+    def setUp(self):
+        self.controller.reset_counts()
+        self.api = API(self.controller.url, "token", API_PATH)
+
+    def test_busy_controller_errors_are_retried(self):
+        self.controller.fail_next(2, status=429)
+
+        data = self.api.retrieves_data("jobs", result_limit=5)
+
+        self.assertEqual(len(data), 5)
+        self.assertEqual(self.controller.request_count, 3)
+        self.assertEqual(self.api.stats.snapshot()["retries"], 2)
+
+    def test_launches_are_not_sent_again_after_a_gateway_error(self):
+        self.controller.fail_next(1, status=502)
+
+        with redirect_stdout(io.StringIO()):
+            response = self.api.post_request("job_templates/1/launch/", {})
+
+        self.assertEqual(response.status_code, 502)
+        self.assertEqual(self.controller.request_count, 1)
+
+    def test_retry_after_is_honoured(self):
+        response = SimpleNamespace(status_code=503, headers={"Retry-After": "7"})
+        dated = SimpleNamespace(headers={"Retry-After": "Thu, 01 Jan 2026 00:00:12 GMT"})
+
+        self.assertEqual(RetryPolicy().delay(0, response), 7.0)
+        self.assertEqual(retry_after(dated, now=1767225600.0), 12.0)
+        self.assertLessEqual(RetryPolicy(base_delay=1, max_delay=3).delay(5), 3)
+
+    def test_limiter_backs_off_on_errors_and_grows_when_healthy(self):
+        limiter = AdaptiveLimiter(initial=8, maximum=10)
+        # Every request takes 10ms, wall clock noise would count some as slow
+        clock = (100 + tick / 100 for tick in range(1000))
+
+        with patch("ash.backoff.time.monotonic", side_effect=clock):
+            limiter.release(limiter.acquire(), "jobs/", ok=False)
+            self.assertEqual(limiter.limit, 4)
+
+            for _ in range(20):
+                limiter.release(limiter.acquire(), "jobs/")
+        self.assertGreater(limiter.limit, 6)
+        self.assertLessEqual(limiter.limit, 10)
+
+    def test_limiter_caps_requests_in_flight(self):
+        limiter = AdaptiveLimiter(initial=2)
+        limiter.acquire()
+        limiter.acquire()
+        waiter = threading.Thread(target=limiter.acquire)
+        waiter.start()
+        waiter.join(0.1)
+
+        self.assertTrue(waiter.is_alive())
+        limiter.release(time.monotonic(), "jobs/")
+        waiter.join(1)
+        self.assertFalse(waiter.is_alive())
+
+
+    def test_killed_command_stops_waiting_for_a_slot(self):
+        limiter = AdaptiveLimiter(initial=1)
+        limiter.acquire()
+        killed = threading.Event()
+        outcome = []
+
+        def wait_for_slot():
+            cancellation.set_cancel_event(killed)
+            try:
+                limiter.acquire()
+                outcome.append("acquired")
+            except KeyboardInterrupt:
+                outcome.append("interrupted")
+
+        waiter = threading.Thread(target=wait_for_slot)
+        waiter.start()
+        killed.set()
+        waiter.join(1)
+
+        self.assertEqual(outcome, ["interrupted"])
+        self.assertEqual(limiter.in_flight, 1)
+
+class TestReadThroughCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.controller = FakeController(jobs=5, job_templates=4, inventories=2, hosts_per_inventory=1).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.controller.stop()
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        home = Path(self.directory.name)
+        home.joinpath(".local", "share", "ash").mkdir(parents=True)
+        with patch.object(Path, "home", return_value=home):
+            self.cache = Cache(self.controller.url)
+        self.controller.reset_counts()
+        self.aap = AAP(API(self.controller.url, "token", API_PATH), cache=self.cache)
+
+    def test_miss_is_fetched_and_written_back(self):
+        inventory = self.aap.get_inventory(2)
+
+        obj, cached_at = self.cache.load_cache_entry(INVENTORIES, 2)
+        self.assertEqual(obj.name, inventory.name)
+        self.assertAlmostEqual(cached_at, time.time(), delta=5)
+        self.assertEqual(self.controller.requests["GET /api/controller/v2/inventories/{id}/"], 1)
+
+    def test_fresh_entry_is_served_without_request(self):
+        self.aap.get_project(1)
+        self.controller.reset_counts()
+
+        project = AAP(self.aap.api, cache=self.cache).get_project(1)
+
+        self.assertEqual(project.id, 1)
+        self.assertIs(project.api, self.aap.api)
+        self.assertEqual(self.controller.request_count, 0)
+
+    def test_stale_unmodified_entry_costs_one_empty_listing(self):
+        self.aap.get_job_template(3)
+        self.controller.reset_counts()
+        self.aap.max_age = 0
+
+        job_template = self.aap.get_job_template(3)
+
+        self.assertEqual(job_template.id, 3)
+        self.assertEqual(dict(self.controller.requests), {"GET /api/controller/v2/job_templates/": 1})
+
+    def test_stale_modified_entry_is_fetched_again(self):
+        stale = self.aap.get_job_template(3)
+        stale.modified = "2000-01-01T00:00:00Z"
+        self.cache.insert_cache(JOB_TEMPLATES, 3, stale)
+        self.aap.max_age = 0
+
+        job_template = AAP(API(self.controller.url, "token", API_PATH), cache=self.cache, max_age=0).get_job_template(3)
+
+        self.assertNotEqual(job_template.modified, stale.modified)
+        self.assertEqual(self.cache.load_cache_entry(JOB_TEMPLATES, 3)[0].modified, job_template.modified)
+
+    def test_launch_form_is_cached_until_the_template_is_modified(self):
+        handler = BaseHandler(SimpleNamespace(cache=self.cache))
+        template = self.aap.get_job_template(4)
+        template.data["ask_limit_on_launch"] = True
+        form = handler._launch_form(template)
+        self.controller.reset_counts()
+
+        again = handler._launch_form(AAP(API(self.controller.url, "token", API_PATH)).get_job_template(4))
+        self.assertNotIn("GET /api/controller/v2/job_templates/{id}/survey_spec/", self.controller.requests)
+        self.assertEqual(again, form)
+        self.assertIn("limit", form.asked_variables)
+        self.assertTrue(form.survey_spec)
+
+        template.modified = "2099-01-01T00:00:00Z"
+        template.api = API(self.controller.url, "token", API_PATH)
+        handler._launch_form(template)
+        self.assertEqual(self.controller.requests["GET /api/controller/v2/job_templates/{id}/survey_spec/"], 1)
+
+
+class TestOffline(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.controller = FakeController(jobs=5, job_templates=2, inventories=1, hosts_per_inventory=1).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.controller.stop()
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        home = Path(self.directory.name)
+        home.joinpath(".local", "share", "ash").mkdir(parents=True)
+        with patch.object(Path, "home", return_value=home):
+            self.cache = Cache(self.controller.url)
+        self.controller.reset_counts()
+        self.api = API(self.controller.url, "token", API_PATH, store=CacheWriter(self.cache))
+        # Pending writes are stored before the temporary directory goes away
+        self.addCleanup(self.api.store.flush)
+
+    def test_job_output_seen_online_is_served_offline_without_request(self):
+        online = self.api.get_request("jobs/2/stdout/?format=txt").text
+        self.api.store.flush()
+        self.controller.reset_counts()
+        self.api.offline = True
+
+        self.assertEqual(self.api.get_request("jobs/2/stdout/?format=txt").text, online)
+        self.assertIsNone(self.api.get_request("jobs/3/stdout/?format=txt"))
+        self.assertEqual(self.controller.request_count, 0)
+
+    def test_later_output_chunks_are_not_kept(self):
+        self.api.get_request("jobs/2/stdout/?format=json&start_line=0")
+        self.api.get_request("jobs/2/stdout/?format=json&start_line=40")
+        self.api.store.flush()
+
+        self.assertIsNotNone(self.cache.load_response("jobs/2/stdout/?format=json&start_line=0"))
+        self.assertIsNone(self.cache.load_response("jobs/2/stdout/?format=json&start_line=40"))
+
+    def test_stored_responses_are_pruned_to_the_most_recent(self):
+        with patch("ash.cache.STORED_RESPONSES_MAX_ENTRIES", 3):
+            for job_id in range(1, 6):
+                self.cache.insert_responses([(f"jobs/{job_id}/", "{}")])
+
+        kept = [job_id for job_id in range(1, 6) if self.cache.load_response(f"jobs/{job_id}/")]
+        self.assertEqual(kept, [3, 4, 5])
+
+    def test_stored_responses_are_pruned_by_size(self):
+        with patch("ash.cache.STORED_RESPONSES_MAX_BYTES", 25):
+            for job_id in range(1, 4):
+                self.cache.insert_responses([(f"jobs/{job_id}/", "x" * 10)])
+
+        kept = [job_id for job_id in range(1, 4) if self.cache.load_response(f"jobs/{job_id}/")]
+        self.assertEqual(kept, [2, 3])
+
+    def test_writes_are_refused_offline(self):
+        self.api.offline = True
+
+        with redirect_stderr(io.StringIO()) as output:
+            response = self.api.post_request("job_templates/1/launch/", {})
+            self.api.log_error(response)
+
+        self.assertIs(response, OFFLINE_REFUSAL)
+        lines = output.getvalue().splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertIn("ash is offline, the controller cannot be changed.", lines[0])
+        self.assertEqual(self.controller.request_count, 0)
+
+    def test_unreachable_controller_falls_back_to_offline(self):
+        config = SimpleNamespace(base_url=self.controller.url, token="token", api_path=API_PATH)
+        probed = threading.Event()
+
+        def unreachable(api):
+            self.assertTrue(probed.wait(5))
+            return False
+
+        with patch("ash.ash.PromptSession"), patch("ash.ash.create_history"), \
+                patch.object(API, "ping", unreachable), redirect_stdout(io.StringIO()) as output:
+            ash = Ash(config, self.cache)
+            # Startup does not wait for the probe
+            self.assertFalse(ash.api.offline)
+            probed.set()
+            ash._prefetch_executor.shutdown(wait=True)
+
+        self.assertTrue(ash.api.offline)
+        self.assertIn("not reachable", output.getvalue())
+
+    def test_controller_lost_mid_session_switches_to_offline(self):
+        self.api.get_request("jobs/2/")
+        self.api.store.flush()
+        api = API("http://127.0.0.1:1", "token", API_PATH, store=self.api.store)
+        api.retry = RetryPolicy(retries=0)
+        api.auto_offline = True
+
+        with redirect_stdout(io.StringIO()) as output:
+            response = api.get_request("jobs/2/")
+
+        self.assertTrue(api.offline)
+        self.assertEqual(response.json()["id"], 2)
+        self.assertIn("not reachable", output.getvalue())
+
+    def test_output_of_a_job_stored_while_running_is_not_followed_offline(self):
+        job = Job(self.api, {"id": 2, "name": "deploy", "status": "running", "finished": None})
+        self.api.get_request("jobs/2/stdout/?format=json&start_line=0")
+        self.api.offline = True
+
+        with patch("ash.models.sleep") as sleep, redirect_stdout(io.StringIO()):
+            job.print_stdout()
+
+        sleep.assert_not_called()
+        self.assertEqual(self.controller.request_count, 1)
+
+    def test_prompt_shows_the_age_of_the_data(self):
+        config = SimpleNamespace(base_url=self.controller.url, token="token", api_path=API_PATH)
+        self.cache.insert_cache(PROJECTS, 1, SimpleNamespace(id=1, name="Platform"))
+        with patch("ash.ash.PromptSession"), patch("ash.ash.create_history"), \
+                patch("ash.ash.time.time", return_value=time.time() + 7200):
+            ash = Ash(config, self.cache, interactive=False, offline=True)
+            prompt = ash.get_prompt()
+
+        self.assertIn(('class:yellow', '[offline, data 2h old] '), prompt)
+        self.assertEqual(ash.projects_by_id[1].name, "Platform")
+        self.assertEqual(self.controller.request_count, 0)
+
+
+class TestHistory(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.legacy_file = os.path.join(self.directory.name, ".ash_history")
+        self.db_file = os.path.join(self.directory.name, "history.db")
+
+    def history(self, max_entries=100):
+        return SQLiteHistory(self.db_file, max_entries=max_entries, legacy_file=self.legacy_file)
+
+    def row_count(self):
+        conn = sqlite3.connect(self.db_file)
+        try:
+            return conn.execute("SELECT count(*) FROM history").fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_repeated_commands_are_stored_once_and_moved_to_the_top(self):
+        history = self.history()
+        for command in ("ls jobs", "cd job 1", "ls jobs", "  "):
+            history.store_string(command)
+
+        self.assertEqual(list(self.history().load_history_strings()), ["ls jobs", "cd job 1"])
+
+    def test_compaction_keeps_the_most_recent_commands(self):
+        history = self.history(max_entries=3)
+        with patch("ash.history.COMPACT_EVERY", 5):
+            for number in range(10):
+                history.store_string(f"cd job {number}")
+
+        self.assertEqual(list(history.load_history_strings()), ["cd job 9", "cd job 8", "cd job 7"])
+        self.assertEqual(self.row_count(), 3)
+
+    def test_history_over_the_cap_is_compacted_when_opened(self):
+        history = self.history()
+        for number in range(10):
+            history.store_string(f"cd job {number}")
+        self.assertEqual(self.row_count(), 10)
+
+        self.assertEqual(list(self.history(max_entries=4).load_history_strings())[0], "cd job 9")
+        self.assertEqual(self.row_count(), 4)
+
+    def test_legacy_history_file_is_imported_once(self):
+        with open(self.legacy_file, "w", encoding="utf-8") as f:
+            f.write("\n# 2024-01-01 10:00:00\n+ls jobs\n\n# 2024-01-01 10:01:00\n+stats\n")
+
+        self.assertEqual(list(self.history().load_history_strings()), ["stats", "ls jobs"])
+        os.remove(self.legacy_file)
+        self.assertEqual(list(self.history().load_history_strings()), ["stats", "ls jobs"])
+
+
+class TestSingleFlight(unittest.TestCase):
+    def test_concurrent_identical_gets_share_one_request(self):
+        with FakeController(latency=0.2, jobs=5, job_templates=1, inventories=1, hosts_per_inventory=1) as controller:
+            api = API(controller.url, "token", API_PATH)
+            barrier = threading.Barrier(6)
+            responses = []
+
+            def get():
+                barrier.wait()
+                responses.append(api.get_request("jobs/1/"))
+
+            threads = [threading.Thread(target=get) for _ in range(6)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            self.assertEqual(controller.request_count, 1)
+        self.assertEqual(len({id(response) for response in responses}), 1)
+        self.assertEqual(api.stats.to_dict()["coalesced"], {"GET jobs/{id}/": 5})
+        self.assertEqual(api.inflight.saved, 5)
+
+    def test_waiters_get_the_error_of_the_call(self):
+        flight = SingleFlight()
+        started = threading.Event()
+        errors = []
+
+        def fail():
+            started.set()
+            time.sleep(0.1)
+            raise ValueError("boom")
+
+        def follow():
+            started.wait()
+            try:
+                flight.do("key", Mock())
+            except ValueError as e:
+                errors.append(e)
+
+        follower = threading.Thread(target=follow)
+        follower.start()
+        with self.assertRaises(ValueError):
+            flight.do("key", fail)
+        follower.join()
+
+        self.assertEqual([str(e) for e in errors], ["boom"])
+
+
+class TestDaemon(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.controller = FakeController(jobs=30, job_templates=4, inventories=2, hosts_per_inventory=2).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.controller.stop()
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        home = Path(self.directory.name)
+        home.joinpath(".local", "share", "ash").mkdir(parents=True)
+        home_patch = patch.object(Path, "home", return_value=home)
+        home_patch.start()
+        self.addCleanup(home_patch.stop)
+        self.path = home.joinpath("ashd.sock")
+        self.server = DaemonServer(self.path)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.controller.reset_counts()
+
+    def shell_api(self):
+        return API(self.controller.url, "token", API_PATH, daemon=DaemonClient.connect(self.path))
+
+    def test_connect_without_daemon_returns_none(self):
+        self.assertIsNone(DaemonClient.connect(Path(self.directory.name).joinpath("missing.sock")))
+
+    def test_shells_share_get_requests(self):
+        first, second = self.shell_api(), self.shell_api()
+
+        self.assertEqual(len(first.retrieves_data("jobs", result_limit=5)), 5)
+        self.assertEqual(len(second.retrieves_data("jobs", result_limit=5)), 5)
+
+        self.assertEqual(self.controller.request_count, 1)
+
+    def test_writes_invalidate_shared_responses(self):
+        api = self.shell_api()
+        api.get_request("jobs/1/")
+
+        self.assertEqual(api.post_request("jobs/1/relaunch/", {}).status_code, 201)
+        api.get_request("jobs/1/")
+
+        self.assertEqual(self.controller.requests["GET /api/controller/v2/jobs/{id}/"], 2)
+
+    def test_shared_responses_are_bounded_and_expire(self):
+        api = self.shell_api()
+        api.get_request("jobs/1/")
+        service = next(iter(self.server.services.values()))
+        service.responses.max_entries = 2
+
+        for job_id in (2, 3):
+            api.get_request(f"jobs/{job_id}/")
+        self.assertEqual(len(service.responses), 2)
+
+        with patch("ash.response_cache.time.monotonic", return_value=time.monotonic() + 10):
+            api.get_request("jobs/3/")
+        self.assertEqual(self.controller.requests["GET /api/controller/v2/jobs/{id}/"], 4)
+
+    def test_probe_through_the_daemon_is_not_retried(self):
+        api = self.shell_api()
+        self.controller.fail_next(status=503)
+
+        self.assertFalse(api.ping())
+        self.assertTrue(api.ping())
+        self.assertEqual(self.controller.requests["GET /api/controller/v2/ping/"], 2)
+
+    def test_new_shell_gets_warm_indexes(self):
+        inventories = self.shell_api().shared_objects(INVENTORIES)
+        self.controller.reset_counts()
+
+        api = self.shell_api()
+        warm = api.shared_objects(INVENTORIES)
+
+        self.assertEqual([inventory.id for inventory in warm], [inventory.id for inventory in inventories])
+        self.assertIs(warm[0].api, api)
+        self.assertEqual(self.controller.request_count, 0)
+
+    def test_shell_falls_back_to_the_controller_when_the_daemon_stops(self):
+        api = self.shell_api()
+        self.server.shutdown()
+        self.server.server_close()
+        api.daemon.close()
+
+        with redirect_stdout(io.StringIO()):
+            response = api.get_request("jobs/1/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(api.daemon)
+
+
+class TestBackgroundTasks(AshTestCase):
+    def setUp(self):
+        super().setUp()
+        self.started = threading.Event()
+
+    def busy_command(self, args):
+        self.started.set()
+        while True:
+            cancellation.sleep(0.01)
+
+    def test_command_ending_with_ampersand_runs_in_background(self):
+        self.ash.aap = Mock()
+        self.ash.aap.get_jobs.return_value = []
+
+        self.assertTrue(self.ash.execute(LIST_JOBS_COMMAND_LINE + " &"))
+        task = self.ash.task_manager.get(1)
+        task.wait()
+
+        self.assertEqual(task.status, "done")
+        self.assertEqual(task.command, LIST_JOBS_COMMAND_LINE)
+        self.ash.aap.get_jobs.assert_called_once()
+        self.ash.display.print.assert_any_call(f"[1] done ({task.elapsed:.1f}s): {LIST_JOBS_COMMAND_LINE}", 'green')
+
+    def test_kill_interrupts_a_running_task(self):
+        self.ash._command_handlers['stats'] = self.busy_command
+        self.ash.execute("stats &")
+        self.assertTrue(self.started.wait(5))
+
+        self.ash.execute("kill 1")
+        task = self.ash.task_manager.get(1)
+        task.wait()
+
+        self.assertEqual(task.status, "killed")
+
+    def test_ctrl_c_on_fg_kills_the_task_it_waits_for(self):
+        self.ash._command_handlers['stats'] = self.busy_command
+        self.ash.execute("stats &")
+        self.assertTrue(self.started.wait(5))
+        background = self.ash.task_manager.get(1)
+
+        foreground = Task(0, "fg 1", lambda: self.ash.execute("fg 1")).start()
+        time.sleep(0.2)
+        foreground.interrupt()
+
+        self.assertTrue(foreground.done.wait(5))
+        self.assertTrue(background.done.wait(5))
+        self.assertEqual(background.status, "killed")
+
+    def test_killed_task_stops_between_requests_and_releases_its_slot(self):
+        with FakeController(jobs=2000, latency=0.05) as controller:
+            api = API(controller.url, "token", API_PATH)
+            pages = []
+
+            def list_jobs():
+                for page in api.iter_pages("jobs", result_limit=2000):
+                    pages.append(page)
+                    self.started.set()
+
+            task = self.ash.task_manager.start("ls jobs", list_jobs)
+            self.assertTrue(self.started.wait(5))
+            task.interrupt()
+            task.wait()
+
+        self.assertEqual(task.status, "killed")
+        self.assertLess(len(pages), 20)
+        self.assertEqual(api.limiter.in_flight, 0)
+        self.assertEqual(api.inflight._calls, {})
+
+    def test_tasks_lists_and_then_forgets_finished_tasks(self):
+        self.ash._command_handlers['stats'] = Mock()
+        self.ash.execute("stats &")
+        self.ash.task_manager.get(1).wait()
+
+        self.ash.execute("tasks")
+
+        rows, columns = self.ash.display.display_by_columns.call_args.args
+        self.assertEqual([(row.id, row.status, row.command) for row in rows], [(1, "done", "stats")])
+        self.assertEqual(self.ash.task_manager.list(), [])
+
+    def test_interactive_commands_are_refused_in_background(self):
+        self.ash.execute("cd job_template 1 &")
+        self.ash.execute("watch &")
+
+        self.assertEqual(self.ash.task_manager.list(), [])
+        self.assertEqual(self.ash.display.error.call_count, 2)
+
+
+class TestJobNotifier(unittest.TestCase):
+    def job(self, job_id, status):
+        return SimpleNamespace(id=job_id, name=f"job {job_id}", status=status)
+
+    def test_poll_checks_all_tracked_jobs_with_one_request(self):
+        aap = Mock()
+        aap.get_jobs.return_value = [self.job(1, "successful"), self.job(2, "running"), self.job(3, "failed")]
+        finished = []
+        notifier = JobNotifier(aap, finished.append, interval=60)
+        for job_id in (1, 2, 3):
+            notifier.tracked[job_id] = self.job(job_id, "pending")
+
+        notifier.poll()
+
+        aap.get_jobs.assert_called_once_with(filters={"id__in": ["1,2,3"]}, result_limit=3)
+        self.assertEqual([job.id for job in finished], [1, 3])
+        self.assertEqual(list(notifier.tracked), [2])
+
+    def test_finished_jobs_are_notified_once(self):
+        aap = Mock()
+        aap.get_jobs.return_value = [self.job(1, "successful")]
+        finished = []
+        notifier = JobNotifier(aap, finished.append, interval=60)
+        notifier.tracked[1] = self.job(1, "pending")
+
+        notifier.poll()
+        notifier.poll()
+
+        self.assertEqual(len(finished), 1)
+        aap.get_jobs.assert_called_once()
+
+    def test_relaunch_tracks_the_new_job(self):
+        ash = BareAsh()
+        ash.display = Mock()
+        ash.notifier = Mock()
+        ash._switch_context = Mock()
+        ash._cmd_output = Mock()
+        job = self.job(7, "pending")
+        ash.current_context = Mock()
+        ash.current_context.relaunch.return_value = job
+
+        JobHandler(ash).relaunch([])
+
+        ash.notifier.track.assert_called_once_with(job)
+
+
+class TestMultiController(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        config_file = os.path.join(self.directory.name, "config.yml")
+        with open(config_file, "w", encoding="utf-8") as f:
+            f.write("- base_url: https://east.example.com\n  token: east\n  description: east\n"
+                    "- base_url: https://west.example.com\n  token: west\n  description: west\n")
+        self.config = Config(config_file, description="east")
+        self.cache = Mock()
+        self.cache.load_cache.return_value = [SimpleNamespace(id=1, name="east-project")]
+        self.ash = Ash(self.config, self.cache, interactive=False)
+        self.ash.display = Mock()
+
+    def test_config_keeps_every_controller(self):
+        self.assertEqual(self.config.names(), ["east", "west"])
+        self.assertEqual(self.config.select("west").base_url, "https://west.example.com")
+        self.assertIsNone(self.config.select("north"))
+
+    def test_use_keeps_the_state_of_each_controller_warm(self):
+        east_api = self.ash.api
+        context = SimpleNamespace(id=1, name="deploy")
+        self.ash.current_context = context
+        self.assertIn(1, self.ash.projects_by_id)
+
+        with patch("ash.ash.Cache") as cache_class:
+            cache_class.return_value.load_cache.return_value = []
+            self.ash.execute("use west")
+
+        self.assertEqual(self.ash.api.base_url, "https://west.example.com")
+        self.assertIsNone(self.ash.current_context)
+        self.assertNotIn("projects_by_id", self.ash.__dict__)
+        self.assertIn(('class:white', '[west] '), self.ash.get_prompt())
+
+        self.ash.execute("use east")
+
+        self.assertIs(self.ash.api, east_api)
+        self.assertIs(self.ash.current_context, context)
+        self.assertIn(1, self.ash.projects_by_id)
+        self.assertEqual(self.cache.load_cache.call_count, 1)
+
+    def test_use_unknown_controller_keeps_the_active_one(self):
+        api = self.ash.api
+
+        self.ash.execute("use north")
+
+        self.assertIs(self.ash.api, api)
+        self.ash.display.error.assert_called_once_with("No controller named 'north' in the configuration.")
+
+    def test_use_invalid_controller_reports_it_and_keeps_the_active_one(self):
+        self.config.entries.append({"base_url": "north.example.com", "token": "north", "description": "north"})
+        api = self.ash.api
+
+        self.ash.execute("use north")
+
+        self.assertIs(self.ash.api, api)
+        self.ash.display.error.assert_called_once_with(
+            "north: Invalid base_url: north.example.com. Expected an absolute URL with http/https.")
+
+    def test_invalid_controller_is_skipped_by_controller_states(self):
+        self.config.entries.append({"base_url": "https://north.example.com", "description": "north"})
+        failures = []
+
+        with patch("ash.ash.Cache"):
+            states = self.ash.controller_states(failures)
+
+        self.assertEqual([name for name, _ in states], ["east", "west"])
+        self.assertEqual(failures, [("north", "Missing required config key: token")])
+
+    def test_controllers_of_all_controllers_queries_are_probed_on_use_only(self):
+        self.ash.interactive = True
+        self.ash._background = Mock()
+
+        with patch("ash.ash.Cache"):
+            west = dict(self.ash.controller_states())["west"]
+            self.assertFalse(west['api'].auto_offline)
+            self.ash._background.assert_not_called()
+            self.ash.execute("use west")
+
+        self.assertTrue(west['api'].auto_offline)
+        self.ash._background.assert_called_once_with(self.ash._probe, west['api'])
+
+    def test_host_limit_belongs_to_its_controller(self):
+        self.ash.host_limit = "web1,web2"
+
+        with patch("ash.ash.Cache"):
+            self.ash.execute("use west")
+            self.assertIsNone(getattr(self.ash, "host_limit", None))
+            self.ash.execute("use east")
+
+        self.assertEqual(self.ash.host_limit, "web1,web2")
+
+    def test_use_cannot_run_in_the_background(self):
+        api = self.ash.api
+
+        for command in ("use west &", "offline on &"):
+            self.ash.execute(command)
+
+        self.assertIs(self.ash.api, api)
+        self.assertFalse(self.ash.task_manager.tasks)
+
+
+class TestPrefetch(AshTestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.controller = FakeController(jobs=20, job_templates=8, inventories=2, hosts_per_inventory=1).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.controller.stop()
+
+    def setUp(self):
+        super().setUp()
+        self.controller.reset_counts()
+        self.ash.api = API(self.controller.url, "token", API_PATH)
+        self.ash.aap = AAP(self.ash.api)
+        self.ash.cache = Mock()
+        self.ash.current_context = None
+        self.ash.current_context_type = None
+
+    def test_job_context_prefetches_its_template_inventory_and_project(self):
+        job = self.ash.aap.get_job(4)
+        template_id = job.summary_fields["job_template"]["id"]
+        self.ash.job_templates_by_id = {template_id: SimpleNamespace(survey_enabled=True)}
+
+        self.ash._switch_context(job, JOBS)
+        self.ash._prefetch_executor.shutdown(wait=True)
+        self.controller.reset_counts()
+
+        self.ash.api.get_request(f"job_templates/{template_id}")
+        self.ash.api.get_request(f"job_templates/{template_id}/survey_spec/")
+        self.ash.api.get_request(f"inventories/{job.inventory}")
+        self.ash.api.get_request(f"projects/{job.project}")
+
+        self.assertEqual(self.controller.request_count, 0)
+
+    def test_background_errors_are_reported(self):
+        def refresh():
+            raise ValueError("unexpected answer")
+
+        self.ash._background(refresh)
+        self.ash._prefetch_executor.shutdown(wait=True)
+
+        self.ash.display.error.assert_called_once_with("Background refresh failed: ValueError: unexpected answer")
+
+    def test_exit_flushes_after_the_running_refreshes(self):
+        self.ash.cache_writer = CacheWriter(self.ash.cache, delay=60)
+        started, release = threading.Event(), threading.Event()
+
+        def refresh():
+            started.set()
+            release.wait(5)
+            self.ash.cache_writer.write(JOBS, 4, "job")
+
+        self.ash._background(refresh)
+        self.assertTrue(started.wait(5))
+        threading.Timer(0.1, release.set).start()
+        self.ash._close()
+
+        self.ash.cache.insert_cache_many.assert_called_once_with(JOBS, [(4, "job")])
+
+    def test_cd_switches_before_the_refresh_and_writes_back_in_batches(self):
+        cached = self.ash.aap.get_job_template(2)
+        cached.name = "stale name"
+        released = threading.Event()
+        refresh = cached.refresh
+        cached.refresh = lambda: (released.wait(5), refresh())
+        self.ash.cache = Mock()
+        self.ash.cache_writer = CacheWriter(self.ash.cache, delay=0.05)
+        self.ash._invalidate_prompt = Mock()
+        self.ash.api_description = None
+
+        self.ash._switch_context(cached, JOB_TEMPLATES)
+
+        self.assertIn("stale name", self.ash.get_prompt()[-2][1])
+        released.set()
+        self.ash._prefetch_executor.shutdown(wait=True)
+        self.assertIn(job_template_name(2), self.ash.get_prompt()[-2][1])
+        self.ash._invalidate_prompt.assert_called_once_with()
+        self.ash.cache_writer.flush()
+        self.ash.cache.insert_cache_many.assert_called_once_with(JOB_TEMPLATES, [(2, cached)])
+
+    def test_batch_runs_do_not_prefetch(self):
+        self.ash.interactive = False
+
+        self.ash._switch_context(self.ash.aap.get_job(4), JOBS)
+
+        self.assertIsNone(self.ash._prefetch_executor)
+
+
+class TestFederatedQueries(AshTestCase):
+    def job(self, job_id, finished):
+        return Job(SimpleNamespace(base_url="https://aap.example.com"),
+                   {"id": job_id, "name": f"job {job_id}", "status": "successful", "finished": finished, "created": "",
+                    "limit": "", "playbook": "site.yml", "scm_branch": ""})
+
+    def test_fan_out_reports_slow_and_failing_controllers(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def query(name, state):
+            if name == "down":
+                raise ConnectionError("refused")
+            if name == "slow":
+                release.wait(5)
+            return None if name == "broken" else [name]
+
+        controllers = [(name, {}) for name in ("east", "slow", "down", "broken", "west")]
+        started = time.perf_counter()
+        results, failures = fan_out(controllers, query, timeout=0.2)
+
+        self.assertLess(time.perf_counter() - started, 2)
+        self.assertEqual(results, [("east", ["east"]), ("west", ["west"])])
+        self.assertEqual(sorted(failures), [("broken", "request failed"), ("down", "refused"), ("slow", "timed out")])
+
+    def test_ls_jobs_all_controllers_reports_offline_controllers(self):
+        east, west = Mock(), Mock()
+        east.get_jobs.return_value = [self.job(1, "2024-05-01T10:00:00Z")]
+        west.get_jobs.return_value = [self.job(1, "2024-05-01T11:00:00Z")]
+        self.ash.controller_states = Mock(return_value=[("east", {"aap": east, "api": Mock(offline=False)}),
+                                                        ("west", {"aap": west, "api": Mock(offline=True)})])
+
+        self.ash.execute("ls jobs --all-controllers")
+
+        self.ash.display.error.assert_called_once_with("west: offline, its rows come from the cache, results are partial.")
+
+    def test_ls_jobs_all_controllers_merges_rows_with_a_controller_column(self):
+        east, west = Mock(), Mock()
+        east.get_jobs.return_value = [self.job(1, "2024-05-01T10:00:00Z"), self.job(2, None)]
+        west.get_jobs.return_value = [self.job(1, "2024-05-01T11:00:00Z")]
+        self.ash.controller_states = Mock(return_value=[("east", {"aap": east}), ("west", {"aap": west})])
+
+        self.ash.execute("ls jobs --all-controllers result_limit:5")
+
+        rows, columns = self.ash.display.display_by_columns.call_args.args
+        self.assertEqual(columns[0], "controller")
+        self.assertEqual([(row.controller, row.id) for row in rows], [("east", 1), ("west", 1), ("east", 2)])
+        east.get_jobs.assert_called_once_with(filters={}, result_limit=5)
+
 
 if __name__ == "__main__":
     unittest.main()
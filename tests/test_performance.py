@@ -0,0 +1,162 @@
+"""Time and memory budgets of the code paths that grow with the size of a controller.
+
+The dataset size is a fraction of benchmarks.datasets.FULL_SCALE set with
+ASH_PERF_SCALE (default 0.01, i.e. 200 job templates and 10k jobs). Budgets
+are per object so that they hold at every scale, with a fixed allowance for
+setup costs. They are loose enough for a slow CI runner and tight enough to
+catch an accidental quadratic loop or a copy of every object.
+"""
+
+import io
+import os
+import tempfile
+import time
+import tracemalloc
+import unittest
+from contextlib import redirect_stdout
+from itertools import islice
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+from prompt_toolkit.document import Document
+from prompt_toolkit.styles import Style
+
+from ash.ash import Ash
+from ash.cache import Cache
+from ash.colors import COLORS
+from ash.commands import LS_JOB_TEMPLATE_FILTERS, ROOT_COMMANDS
+from ash.completer import AshCompleter
+from ash.display import Display, JOB_COLUMNS
+from ash.models import Job, JobTemplate
+from ash.object_types import JOB_TEMPLATES
+from benchmarks import e2e
+from benchmarks.datasets import iter_job_templates, iter_jobs, scaled_sizes
+
+SCALE = float(os.environ.get('ASH_PERF_SCALE', '0.01'))
+SIZES = scaled_sizes(SCALE)
+
+# Fixed allowances for connection setup, imports and first-call caches
+BASE_SECONDS = 0.05
+BASE_BYTES = 512 * 1024
+
+
+class BareAsh(Ash):
+    def __init__(self):
+        pass
+
+
+def measure(function):
+    """Return (result, seconds, peak traced bytes) of a call.
+
+    The function is called twice, tracemalloc slows down allocations too much
+    to time the traced call."""
+    started = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, elapsed, peak
+
+
+class PerformanceTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.api = SimpleNamespace(base_url='https://aap.example.com')
+        cls.job_templates = [JobTemplate(cls.api, data) for data in iter_job_templates(SIZES)]
+
+    def assertWithinBudget(self, elapsed, peak, count, seconds_per_object, bytes_per_object):
+        self.assertLess(elapsed, BASE_SECONDS + count * seconds_per_object,
+                        f"{count} objects took {elapsed:.3f}s")
+        self.assertLess(peak, BASE_BYTES + count * bytes_per_object,
+                        f"{count} objects peaked at {peak / 1024:.0f} KB")
+
+
+class TestCachePerformance(PerformanceTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.home = tempfile.TemporaryDirectory()
+        cls.environment = patch.dict(os.environ, {'HOME': cls.home.name})
+        cls.environment.start()
+        os.makedirs(os.path.join(cls.home.name, '.local', 'share', 'ash'))
+        cls.cache = Cache('https://aap.example.com')
+        cls.cache.insert_cache_many(JOB_TEMPLATES, ((obj.id, obj) for obj in cls.job_templates))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.environment.stop()
+        cls.home.cleanup()
+
+    def test_load_cache(self):
+        objects, elapsed, peak = measure(lambda: self.cache.load_cache(JOB_TEMPLATES))
+
+        self.assertEqual(len(objects), len(self.job_templates))
+        self.assertWithinBudget(elapsed, peak, len(objects), 0.0002, 16 * 1024)
+
+    def test_get_objects_from_cache(self):
+        ash = BareAsh()
+        ash.cache = self.cache
+        ash.api = Mock()
+        ash.interactive = False
+
+        (objects, by_id, by_name), elapsed, peak = measure(lambda: ash._get_objects(JOB_TEMPLATES))
+
+        self.assertEqual(len(by_id), len(self.job_templates))
+        self.assertWithinBudget(elapsed, peak, len(objects), 0.0002, 16 * 1024)
+
+
+class TestFilterPerformance(PerformanceTestCase):
+    def test_filter_objects(self):
+        ash = BareAsh()
+        ash.display = Mock()
+        args = ['project:web', 'created_by:user', 'site']
+
+        objects, elapsed, peak = measure(lambda: ash.filter_objects(self.job_templates, args, LS_JOB_TEMPLATE_FILTERS))
+
+        self.assertTrue(objects)
+        self.assertWithinBudget(elapsed, peak, len(self.job_templates), 0.00002, 64)
+
+
+class TestCompleterPerformance(PerformanceTestCase):
+    def test_cd_job_template_completion(self):
+        ash = SimpleNamespace(commands=ROOT_COMMANDS, current_context_type=None,
+                              job_templates_by_name={obj.name: obj for obj in self.job_templates})
+        completer = AshCompleter(ash)
+        document = Document('cd job_template web')
+
+        completions, elapsed, peak = measure(lambda: list(completer.get_completions(document, None)))
+
+        self.assertTrue(completions)
+        self.assertWithinBudget(elapsed, peak, len(self.job_templates), 0.00005, 1024)
+
+
+class TestDisplayPerformance(unittest.TestCase):
+    def test_display_by_columns(self):
+        api = SimpleNamespace(base_url='https://aap.example.com')
+        jobs = [Job(api, data) for data in islice(iter_jobs(SIZES), 10000)]
+        display = Display(Style.from_dict(COLORS))
+
+        with redirect_stdout(io.StringIO()):
+            _, elapsed, peak = measure(lambda: display.display_by_columns(jobs, JOB_COLUMNS))
+
+        self.assertLess(elapsed, BASE_SECONDS + len(jobs) * 0.0002, f"{len(jobs)} rows took {elapsed:.3f}s")
+        self.assertLess(peak, BASE_BYTES + len(jobs) * 4096, f"{len(jobs)} rows peaked at {peak / 1024:.0f} KB")
+
+
+
+class TestEndToEndScenarios(unittest.TestCase):
+    def test_every_scenario_runs_against_a_small_controller(self):
+        with redirect_stdout(io.StringIO()) as output:
+            status = e2e.main(['--latency', '0', '--jobs', '200', '--job-templates', '30', '--inventories', '5',
+                               '--stdout-lines', '200'])
+
+        self.assertEqual(status, 0)
+        lines = output.getvalue().splitlines()
+        self.assertEqual([line[:18].strip() for line in lines[1:]], [name for name, _, _ in e2e.scenarios(None)])
+
+if __name__ == "__main__":
+    unittest.main()